@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import Mode, Role, Session, Phase, Player, Vote, Result, Profile
+from .models import (
+    Mode, Role, Session, Phase, Player, Vote, Result, Profile, GameEvent, PhaseTimer,
+    SessionChange,
+)
 
 
 @admin.register(Mode)
@@ -44,8 +47,9 @@ class PlayerAdmin(admin.ModelAdmin):
         "role",
         "status",
         "seat_number",
+        "role_delivery",
     )
-    list_filter = ("session", "status", "role")
+    list_filter = ("session", "status", "role", "role_delivery")
     search_fields = ("name", "session__id")
 
 
@@ -61,6 +65,27 @@ class ResultAdmin(admin.ModelAdmin):
     list_display = ("session", "winner_side", "rounds_count", "mafia_count", "town_count")
     list_filter = ("winner_side",)
 
+@admin.register(GameEvent)
+class GameEventAdmin(admin.ModelAdmin):
+    list_display = ("session", "seq", "kind", "created_at")
+    list_filter = ("kind",)
+    search_fields = ("session__id",)
+
+
+@admin.register(PhaseTimer)
+class PhaseTimerAdmin(admin.ModelAdmin):
+    list_display = ("session", "kind", "round", "speaker", "deadline")
+    list_filter = ("kind",)
+    search_fields = ("session__id",)
+
+
+@admin.register(SessionChange)
+class SessionChangeAdmin(admin.ModelAdmin):
+    list_display = ("id", "session_id", "tg_chat_id", "tg_table", "kind", "created_at")
+    list_filter = ("kind",)
+    search_fields = ("session_id", "tg_chat_id")
+
+
 @admin.register(Profile)
 class ProfileAdmin(admin.ModelAdmin):
     list_display = ("user", "role")
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class GameConfig(AppConfig):
     name = 'game'
+
+    def ready(self):
+        # сигналы сброса кэша справочников
+        from . import registry  # noqa: F401
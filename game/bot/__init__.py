@@ -0,0 +1,4 @@
+"""
+Инфраструктура Telegram-бота (game/management/commands/runbot.py):
+работа с БД, очереди, вспомогательные структуры.
+"""
@@ -0,0 +1,53 @@
+import time
+
+
+class TableChanges:
+    """Правки одной партии с сайта: ключ (chat_id, стол) и строки SessionChange по возрастанию id."""
+
+    __slots__ = ("key", "changes")
+
+    def __init__(self, key, changes: list):
+        self.key = key
+        self.changes = changes
+
+
+class ChangeCursor:
+    """
+    Курсор ленты правок с сайта (SessionChange).
+
+    id строк растут монотонно, но строка с меньшим id может стать видна
+    позже большей: её транзакция закоммитилась позже (PostgreSQL) или
+    откатилась. Поэтому пропуски в id не проскакиваются молча: каждый
+    пропущенный id перепроверяется ещё grace секунд, потом забывается.
+    Запрос очередной порции — id > position или id из missing().
+    """
+
+    def __init__(self, position: int = 0, grace: float = 30.0, max_gaps: int = 1000, clock=time.monotonic):
+        self.position = position
+        self.grace = grace
+        self.max_gaps = max_gaps
+        self.clock = clock
+        # id пропуска -> до какого момента его ещё ждать
+        self._gaps: dict[int, float] = {}
+
+    def advance(self, ids):
+        """Отметить прочитанные id (по возрастанию)."""
+        deadline = self.clock() + self.grace
+        for change_id in ids:
+            if change_id <= self.position:
+                # дождались пропуска
+                self._gaps.pop(change_id, None)
+                continue
+            for gap in range(max(self.position + 1, change_id - self.max_gaps), change_id):
+                self._gaps[gap] = deadline
+            self.position = change_id
+        if len(self._gaps) > self.max_gaps:
+            for gap in sorted(self._gaps)[: len(self._gaps) - self.max_gaps]:
+                del self._gaps[gap]
+
+    def missing(self) -> list[int]:
+        """Пропущенные id, которые ещё имеет смысл перепроверить."""
+        now = self.clock()
+        for gap in [gap for gap, deadline in self._gaps.items() if deadline < now]:
+            del self._gaps[gap]
+        return sorted(self._gaps)
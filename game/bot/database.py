@@ -0,0 +1,65 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from asgiref.sync import sync_to_async
+
+from .metrics import timed
+
+
+class DatabaseExecutor:
+    """
+    Работа бота с БД из event loop.
+
+    Одиночные запросы бот делает через async-API ORM (acreate, abulk_create,
+    aupdate, async for ...) и ждёт их через query(). Синхронными остаются
+    только операции из нескольких запросов, которым нужны один поток и одно
+    соединение: транзакция пачки отложенной записи, восстановление партии
+    из БД, прогрев справочников. Они идут через run() — одна передача
+    в поток на операцию, а не на каждый запрос.
+
+    threads = 0 — run() выполняется в общем потоке БД Django, том же, что
+    у async-API ORM: все запросы бота идут по очереди, для SQLite это
+    единственный безопасный вариант (второй пишущий поток упирается в
+    блокировку базы). threads > 0 — свой пул потоков: многошаговые
+    операции не ждут одиночных запросов (для PostgreSQL и т.п.).
+
+    handoffs — сколько раз работа с БД уходила из event loop в поток
+    (для /stats и benchbot). Время ожидания засчитывается обработчику
+    как время БД (см. metrics.timed).
+    """
+
+    def __init__(self, threads: int = 0):
+        self.threads = threads
+        self._pool: ThreadPoolExecutor | None = None
+        self.handoffs = 0
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.threads, thread_name_prefix="bot-db"
+            )
+        return self._pool
+
+    async def run(self, func, *args, **kwargs):
+        """Выполнить синхронную func(*args, **kwargs) в потоке БД."""
+        self.handoffs += 1
+        with timed("db"):
+            if not self.threads:
+                return await sync_to_async(func)(*args, **kwargs)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._get_pool(), partial(func, *args, **kwargs)
+            )
+
+    async def query(self, awaitable):
+        """Дождаться async-запроса ORM (aget, acreate, ...)."""
+        self.handoffs += 1
+        with timed("db"):
+            return await awaitable
+
+    def close(self):
+        """Остановить пул (дождавшись начатых операций)."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
@@ -0,0 +1,126 @@
+import asyncio
+import contextvars
+from collections import deque
+
+from telegram.error import BadRequest, Forbidden
+
+from .outbound import TokenBucket
+
+
+class RoleMessage:
+    """Роль одного игрока для отправки в личку: кому, что и куда записать итог."""
+
+    __slots__ = ("user_id", "text", "game_key", "session_id", "seat", "db_id", "attempts")
+
+    def __init__(self, user_id: int, text: str, game_key, session_id, seat: int, db_id=None):
+        self.user_id = user_id
+        self.text = text
+        # партия (chat_id, стол) и место игрока — чтобы отметить доставку в её состоянии
+        self.game_key = game_key
+        self.session_id = session_id
+        self.seat = seat
+        self.db_id = db_id
+        self.attempts = 0
+
+
+class RoleDelivery:
+    """
+    Рассылка ролей игрокам в личные сообщения.
+
+    submit() не ждёт отправки: роли встают в общую очередь, одна фоновая
+    задача выпускает их в OutboundScheduler не быстрее rate сообщений
+    в секунду. Так раздача ролей столу из 20 человек (и нескольким столам
+    сразу) занимает только часть общего лимита бота, и ответы в группы
+    не ждут за ней.
+
+    Исход каждой отправки передаётся в on_status(message, status):
+    - "sent" — доставлено;
+    - "failed" — Telegram не даёт написать игроку (он не начинал диалог
+      с ботом или заблокировал его) либо кончились попытки.
+    Сетевые ошибки повторяются до max_attempts раз с растущей паузой
+    retry_delay * номер попытки.
+    """
+
+    SENT = "sent"
+    FAILED = "failed"
+
+    def __init__(
+        self,
+        outbound,
+        rate: float = 10,
+        max_attempts: int = 3,
+        retry_delay: float = 5.0,
+        on_status=None,
+    ):
+        self.outbound = outbound
+        self.bucket = TokenBucket(rate, rate)
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.on_status = on_status
+        self._queue: deque = deque()
+        self._task: asyncio.Task | None = None
+        self._inflight: set[asyncio.Task] = set()
+
+        # для /stats
+        self.queued = 0
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._queue) + len(self._inflight)
+
+    def submit(self, bot, messages):
+        """Поставить роли в очередь на отправку."""
+        for message in messages:
+            self._queue.append((bot, message))
+            self.queued += 1
+        if self._queue and self._task is None:
+            # свой контекст: рассылка идёт после обработчика и не попадает в его метрики
+            self._task = asyncio.create_task(self._run(), context=contextvars.Context())
+
+    async def _run(self):
+        try:
+            while self._queue:
+                await self.bucket.acquire()
+                bot, message = self._queue.popleft()
+                task = asyncio.create_task(self._deliver(bot, message))
+                self._inflight.add(task)
+                task.add_done_callback(self._inflight.discard)
+        finally:
+            self._task = None
+
+    async def _deliver(self, bot, message: RoleMessage):
+        message.attempts += 1
+        try:
+            await self.outbound.send(bot, message.user_id, message.text, merge=False)
+        except (Forbidden, BadRequest):
+            status = self.FAILED
+        except Exception:
+            if message.attempts < self.max_attempts:
+                self.retried += 1
+                await asyncio.sleep(self.retry_delay * message.attempts)
+                self.submit(bot, [message])
+                return
+            status = self.FAILED
+        else:
+            status = self.SENT
+
+        if status == self.SENT:
+            self.sent += 1
+        else:
+            self.failed += 1
+        if self.on_status:
+            await self.on_status(message, status)
+
+    async def flush(self):
+        """Дождаться отправки всего, что стоит в очереди (включая повторы)."""
+        while self._task is not None or self._inflight:
+            await asyncio.gather(
+                *[t for t in (self._task, *self._inflight) if t is not None],
+                return_exceptions=True,
+            )
+
+    async def close(self):
+        await self.flush()
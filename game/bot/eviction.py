@@ -0,0 +1,83 @@
+import time
+from collections import OrderedDict
+from itertools import islice
+
+from .state import deep_sizeof
+
+
+class IdleGamePolicy:
+    """
+    Какие чаты выгружать из памяти бота.
+
+    Помнит момент последнего апдейта каждого чата (LRU: давно молчащие —
+    в начале). select() отдаёт:
+    - чаты, молчащие дольше ttl секунд;
+    - если партий в памяти больше, чем помещается в memory_budget байт, —
+      ещё самые давно молчащие чаты с партиями, пока не поместятся.
+
+    Выгружается чат целиком, со всеми его столами: games — индекс
+    chat_id -> {стол: партия}. Размер чата оценивается по выборке: средний
+    deep_sizeof нескольких чатов, умноженный на их число. ttl или
+    memory_budget = 0 — ограничение не действует.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 6 * 60 * 60,
+        memory_budget: int = 0,
+        sample_size: int = 32,
+        clock=time.monotonic,
+    ):
+        self.ttl = ttl
+        self.memory_budget = memory_budget
+        self.sample_size = sample_size
+        self.clock = clock
+        # chat_id -> время последнего апдейта
+        self._last_seen: OrderedDict[int, float] = OrderedDict()
+
+    def __len__(self):
+        return len(self._last_seen)
+
+    def touch(self, chat_id: int):
+        self._last_seen[chat_id] = self.clock()
+        self._last_seen.move_to_end(chat_id)
+
+    def forget(self, chat_id: int):
+        self._last_seen.pop(chat_id, None)
+
+    def game_size(self, games: dict) -> float:
+        """Средний размер чата со всеми его столами в байтах (по первым sample_size чатам)."""
+        sample = list(islice(games.values(), self.sample_size))
+        if not sample:
+            return 0.0
+        return sum(deep_sizeof(game) for game in sample) / len(sample)
+
+    def select(self, games: dict, busy=()) -> list[int]:
+        """Чаты на выгрузку, от давно молчащих к недавним; чаты из busy не трогаем."""
+        victims = []
+        chosen = set()
+
+        if self.ttl:
+            deadline = self.clock() - self.ttl
+            for chat_id, seen in self._last_seen.items():
+                if seen > deadline:
+                    break
+                if chat_id not in busy:
+                    victims.append(chat_id)
+                    chosen.add(chat_id)
+
+        if self.memory_budget and games:
+            size = self.game_size(games)
+            allowed = int(self.memory_budget // size) if size else len(games)
+            excess = len(games) - allowed - sum(1 for chat_id in chosen if chat_id in games)
+            if excess > 0:
+                for chat_id in self._last_seen:
+                    if excess <= 0:
+                        break
+                    if chat_id in chosen or chat_id in busy or chat_id not in games:
+                        continue
+                    victims.append(chat_id)
+                    chosen.add(chat_id)
+                    excess -= 1
+
+        return victims
@@ -0,0 +1,145 @@
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter, deque
+
+from telegram.request import BaseRequest
+
+
+class FakeBotAPI(BaseRequest):
+    """
+    Локальная подмена Bot API для запусков без Telegram.
+
+    Подключается к приложению как транспорт (ApplicationBuilder().request(...)):
+    бот «отправляет» сообщения, а они просто складываются в calls.
+    На sendMessage / editMessageText отвечает правдоподобным Message,
+    на остальные методы — True.
+
+    Для проверки лимитов можно задать задержку ответа (latency) и
+    ограничение chat_limit сообщений (и правок) в чат за window секунд: сверх него
+    подмена, как и Telegram, отвечает 429 с retry_after.
+    Сообщения в чаты из blocked отклоняются с 403 — как личка игрока,
+    который не начинал диалог с ботом.
+    """
+
+    BOT_USER = {
+        "id": 1,
+        "is_bot": True,
+        "first_name": "Mafia Assistant (fake)",
+        "username": "fake_mafia_bot",
+    }
+
+    def __init__(
+        self,
+        record: bool = True,
+        latency: float = 0.0,
+        chat_limit: int | None = None,
+        window: float = 1.0,
+        blocked=(),
+    ):
+        self.record = record
+        self.latency = latency
+        self.chat_limit = chat_limit
+        self.window = window
+        self.blocked = set(blocked)
+        # (метод Bot API, параметры) в порядке вызова
+        self.calls: list[tuple[str, dict]] = []
+        # число вызовов по методам (ведётся и без record)
+        self.counts: Counter = Counter()
+        self.flood_errors = 0
+        self._message_ids = itertools.count(1)
+        # chat_id -> время последних отправок (для chat_limit)
+        self._sent_at: dict = {}
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def sent_messages(self, chat_id=None) -> list[dict]:
+        """Параметры всех sendMessage (при необходимости — только в один чат)."""
+        return [
+            params
+            for method, params in self.calls
+            if method == "sendMessage"
+            and (chat_id is None or params.get("chat_id") == chat_id)
+        ]
+
+    def _message(self, params: dict) -> dict:
+        message = {
+            "message_id": params.get("message_id") or next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": params.get("chat_id", 0), "type": "group"},
+            "from": self.BOT_USER,
+        }
+        if "text" in params:
+            message["text"] = params["text"]
+        return message
+
+    def _result(self, method: str, params: dict):
+        if method == "getMe":
+            return self.BOT_USER
+        if method == "getUpdates":
+            return []
+        if method in ("sendMessage", "editMessageText"):
+            return self._message(params)
+        return True
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data=None,
+        read_timeout=None,
+        write_timeout=None,
+        connect_timeout=None,
+        pool_timeout=None,
+    ) -> tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.counts[api_method] += 1
+        if self.record:
+            self.calls.append((api_method, params))
+        if api_method == "getUpdates":
+            # апдейтов у подмены нет; не крутим polling впустую
+            await asyncio.sleep(min(params.get("timeout") or 0, 1))
+        elif self.latency:
+            await asyncio.sleep(self.latency)
+
+        if api_method == "sendMessage" and params.get("chat_id") in self.blocked:
+            body = {
+                "ok": False,
+                "error_code": 403,
+                "description": "Forbidden: bot can't initiate conversation with a user",
+            }
+            return 403, json.dumps(body).encode()
+
+        if api_method in ("sendMessage", "editMessageText"):
+            retry_after = self._flood_check(params.get("chat_id"))
+            if retry_after:
+                self.flood_errors += 1
+                body = {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {retry_after}",
+                    "parameters": {"retry_after": retry_after},
+                }
+                return 429, json.dumps(body).encode()
+
+        body = {"ok": True, "result": self._result(api_method, params)}
+        return 200, json.dumps(body).encode()
+
+    def _flood_check(self, chat_id) -> int:
+        """0 — можно отправлять, иначе через сколько секунд повторить."""
+        if self.chat_limit is None:
+            return 0
+        now = time.monotonic()
+        sent = self._sent_at.setdefault(chat_id, deque())
+        while sent and now - sent[0] >= self.window:
+            sent.popleft()
+        if len(sent) >= self.chat_limit:
+            return max(1, int(self.window - (now - sent[0]) + 0.999))
+        sent.append(now)
+        return 0
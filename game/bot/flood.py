@@ -0,0 +1,99 @@
+import time
+from collections import OrderedDict
+
+from .outbound import TokenBucket
+
+
+class FloodGuard:
+    """
+    Защита бота от потока входящих команд и нажатий кнопок.
+
+    - Token bucket на чат (chat_rate в секунду, запас chat_burst) и на
+      пользователя (user_rate, user_burst): команда или нажатие сверх
+      лимита отбрасывается. rate = 0 — без этого лимита.
+    - Повторное нажатие той же кнопки того же сообщения тем же
+      пользователем раньше, чем через debounce секунд, отбрасывается, не
+      расходуя лимиты (зависший клиент или двойной тап).
+
+    Бакеты хранятся для последних max_tracked чатов и пользователей:
+    забытый бакет заново начинается полным. В шардированном режиме у
+    каждого воркера свои бакеты: лимит пользователя считается по чатам
+    этого воркера.
+    """
+
+    USER = "user"
+    CHAT = "chat"
+    REPEAT = "repeat"
+
+    def __init__(
+        self,
+        chat_rate: float = 2,
+        chat_burst: float = 30,
+        user_rate: float = 1,
+        user_burst: float = 15,
+        debounce: float = 1.0,
+        max_tracked: int = 10000,
+        clock=time.monotonic,
+    ):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.debounce = debounce
+        self.max_tracked = max_tracked
+        self.clock = clock
+        self._chats: OrderedDict[int, TokenBucket] = OrderedDict()
+        self._users: OrderedDict[int, TokenBucket] = OrderedDict()
+        # (chat_id, user_id, message_id, data) -> момент последнего нажатия
+        self._taps: OrderedDict[tuple, float] = OrderedDict()
+
+        # для /stats: сколько отброшено по каждой причине
+        self.dropped = {self.USER: 0, self.CHAT: 0, self.REPEAT: 0}
+
+    def _bucket(self, buckets: OrderedDict, key, rate: float, burst: float) -> TokenBucket:
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = TokenBucket(rate, burst, clock=self.clock)
+            if len(buckets) > self.max_tracked:
+                buckets.popitem(last=False)
+        else:
+            buckets.move_to_end(key)
+        return bucket
+
+    def _repeated_tap(self, tap: tuple) -> bool:
+        now = self.clock()
+        # нажатия лежат по времени: устаревшие — в начале
+        while self._taps:
+            oldest, at = next(iter(self._taps.items()))
+            if now - at < self.debounce:
+                break
+            del self._taps[oldest]
+        if tap in self._taps:
+            return True
+        self._taps[tap] = now
+        if len(self._taps) > self.max_tracked:
+            self._taps.popitem(last=False)
+        return False
+
+    def check(self, chat_id: int | None, user_id: int | None, tap: tuple | None = None) -> str | None:
+        """
+        Пропустить ли апдейт. tap — (message_id, data) нажатой кнопки.
+        Возвращает причину отказа (USER, CHAT, REPEAT) или None — можно.
+        """
+        reason = None
+        if tap is not None and self.debounce and self._repeated_tap((chat_id, user_id, *tap)):
+            reason = self.REPEAT
+        # сначала лимит пользователя: один флудящий не тратит лимит всего чата
+        elif (
+            user_id is not None and self.user_rate
+            and not self._bucket(self._users, user_id, self.user_rate, self.user_burst).try_acquire()
+        ):
+            reason = self.USER
+        elif (
+            chat_id is not None and self.chat_rate
+            and not self._bucket(self._chats, chat_id, self.chat_rate, self.chat_burst).try_acquire()
+        ):
+            reason = self.CHAT
+        if reason is not None:
+            self.dropped[reason] += 1
+        return reason
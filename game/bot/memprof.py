@@ -0,0 +1,133 @@
+import heapq
+import os
+import tracemalloc
+from collections import Counter
+
+from .state import deep_sizeof
+
+# собственные выделения tracemalloc и импорт модулей в снимке не нужны
+_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+# чья это память — по пути файла, где она выделена (первое совпадение)
+_AREAS = (
+    (f"{os.sep}telegram{os.sep}", "python-telegram-bot"),
+    (f"{os.sep}django{os.sep}", "Django"),
+    (f"{os.sep}httpx{os.sep}", "httpx"),
+    (f"{os.sep}httpcore{os.sep}", "httpx"),
+    (f"{os.sep}asyncio{os.sep}", "asyncio"),
+    (f"{os.sep}game{os.sep}", "бот (game)"),
+)
+
+
+def _area(filename: str) -> str:
+    for marker, area in _AREAS:
+        if marker in filename:
+            return area
+    return "прочее"
+
+
+def _where(frame) -> str:
+    """Файл:строка без длинного префикса пути (от пакета, которому принадлежит файл)."""
+    parts = frame.filename.split(os.sep)
+    return f"{os.sep.join(parts[-2:])}:{frame.lineno}"
+
+
+def _size(size: int) -> str:
+    if size >= 1024 * 1024:
+        return f"{size / (1024 * 1024):.1f} МБ"
+    return f"{size / 1024:.1f} КБ"
+
+
+def game_sizes(games: dict, top: int) -> tuple[int, list]:
+    """Сколько байт занимают партии: (всего, [(размер, ключ) для top самых больших])."""
+    sizes = [(deep_sizeof(game), key) for key, game in games.items()]
+    return sum(size for size, _ in sizes), heapq.nlargest(top, sizes)
+
+
+class MemoryProfiler:
+    """
+    Профилировщик памяти процесса бота на tracemalloc.
+
+    Пока он включён, Python записывает место выделения каждого блока
+    памяти (frames кадров стека): это замедляет выделения, но при
+    frames=1 терпимо и в рабочем процессе. Снимки делаются редко —
+    периодически и по запросу; отчёт по снимку показывает:
+    - чья память: бот, python-telegram-bot, Django, asyncio, прочее;
+    - top мест выделения (файл:строка);
+    - рост по местам выделения с прошлого снимка.
+
+    С path снимок сохраняется в файл, и первый снимок после перезапуска
+    сравнивается с последним снимком прошлого запуска.
+    """
+
+    def __init__(self, frames: int = 1, top: int = 10, path: str = ""):
+        self.frames = frames
+        self.top = top
+        self.path = path
+        self.previous: tracemalloc.Snapshot | None = None
+        self.snapshots = 0
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        if self.previous is None and self.path and os.path.exists(self.path):
+            try:
+                self.previous = tracemalloc.Snapshot.load(self.path)
+            except Exception:
+                # файл от другой версии Python или обрезан — сравнивать не с чем
+                self.previous = None
+
+    def stop(self):
+        tracemalloc.stop()
+
+    def take(self) -> tracemalloc.Snapshot:
+        """Снимок выделений (синхронно; можно звать из потока)."""
+        return tracemalloc.take_snapshot().filter_traces(_FILTERS)
+
+    def report(self, snapshot: tracemalloc.Snapshot) -> list[str]:
+        """
+        Строки отчёта по снимку. Снимок становится «прошлым» для
+        следующего отчёта (и записывается в path, если он задан).
+        """
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"Отслежено tracemalloc: {_size(current)}, пик {_size(peak)}"]
+
+        areas = Counter()
+        for stat in snapshot.statistics("filename"):
+            areas[_area(stat.traceback[0].filename)] += stat.size
+        lines.append(
+            "По источникам: "
+            + ", ".join(f"{area} {_size(size)}" for area, size in areas.most_common())
+        )
+
+        lines += ["", "Больше всего памяти выделено:"]
+        for stat in snapshot.statistics("lineno")[: self.top]:
+            lines.append(f"  {_where(stat.traceback[0])} — {_size(stat.size)}, блоков {stat.count}")
+
+        if self.previous is not None:
+            lines += ["", "Изменения с прошлого снимка:"]
+            grown = [
+                stat for stat in snapshot.compare_to(self.previous, "lineno") if stat.size_diff
+            ]
+            for stat in grown[: self.top]:
+                lines.append(
+                    f"  {_where(stat.traceback[0])} — {stat.size_diff / 1024:+.1f} КБ, "
+                    f"блоков {stat.count_diff:+d}"
+                )
+            if not grown:
+                lines.append("  без изменений")
+
+        self.previous = snapshot
+        self.snapshots += 1
+        if self.path:
+            snapshot.dump(self.path)
+        return lines
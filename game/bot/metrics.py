@@ -0,0 +1,154 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+# Верхние границы корзин гистограмм, в секундах
+BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"),
+)
+
+PARTS = ("total", "db", "net", "cpu")
+
+
+class Histogram:
+    """Гистограмма задержек с фиксированными корзинами (BUCKETS)."""
+
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += seconds
+
+    def percentile(self, q: float) -> float:
+        """Оценка сверху: граница корзины, в которую попал q-й перцентиль."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return BUCKETS[-1]
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+
+class _Timing:
+    """Время текущего обработчика, потраченное на БД и на Telegram."""
+
+    __slots__ = ("db", "net")
+
+    def __init__(self):
+        self.db = 0.0
+        self.net = 0.0
+
+
+_current: ContextVar[_Timing | None] = ContextVar("bot_handler_timing", default=None)
+
+
+def add_time(kind: str, seconds: float):
+    """Засчитать seconds текущему обработчику (kind: "db" или "net")."""
+    timing = _current.get()
+    if timing is not None:
+        setattr(timing, kind, getattr(timing, kind) + seconds)
+
+
+@contextmanager
+def timed(kind: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(kind, time.perf_counter() - started)
+
+
+class HandlerStats:
+    __slots__ = ("calls", "errors", "histograms")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.histograms = {part: Histogram() for part in PARTS}
+
+
+class BotMetrics:
+    """
+    Метрики бота в памяти процесса.
+
+    Каждый зарегистрированный обработчик оборачивается в instrument():
+    на вызов пишется общее время и его части — БД (DatabaseExecutor, ожидание
+    очереди записи), сеть (запросы к Bot API, которые обработчик ждал)
+    и остальное («CPU»: наш код и ожидание event loop).
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.updates = 0
+        self.errors = 0
+        self.handlers: dict[str, HandlerStats] = {}
+
+    def instrument(self, name: str, callback):
+        stats = self.handlers.setdefault(name, HandlerStats())
+
+        @wraps(callback)
+        async def wrapper(update, context):
+            timing = _Timing()
+            token = _current.set(timing)
+            started = time.perf_counter()
+            try:
+                return await callback(update, context)
+            except Exception:
+                stats.errors += 1
+                self.errors += 1
+                raise
+            finally:
+                _current.reset(token)
+                total = time.perf_counter() - started
+                stats.calls += 1
+                h = stats.histograms
+                h["total"].observe(total)
+                h["db"].observe(timing.db)
+                h["net"].observe(timing.net)
+                h["cpu"].observe(max(0.0, total - timing.db - timing.net))
+
+        return wrapper
+
+    def count_update(self):
+        self.updates += 1
+
+    def render(self, extra_lines=()) -> str:
+        """Текст для /stats и периодического лога."""
+        uptime = int(time.time() - self.started_at)
+        hours, rest = divmod(uptime, 3600)
+        lines = [
+            f"Работает: {hours} ч {rest // 60} мин",
+            f"Апдейтов: {self.updates}, ошибок в обработчиках: {self.errors}",
+            *extra_lines,
+            "",
+            "Обработчики — вызовов, p50/p99 мс, среднее БД/сеть/CPU мс:",
+        ]
+        for name, stats in sorted(self.handlers.items()):
+            if not stats.calls:
+                continue
+            h = stats.histograms
+            errors = f", ошибок {stats.errors}" if stats.errors else ""
+            lines.append(
+                f"{name}: {stats.calls}{errors}, "
+                f"{h['total'].percentile(0.5) * 1000:g}/{h['total'].percentile(0.99) * 1000:g}, "
+                f"{h['db'].mean * 1000:.1f}/{h['net'].mean * 1000:.1f}/{h['cpu'].mean * 1000:.1f}"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,366 @@
+import asyncio
+import contextvars
+import time
+from collections import OrderedDict, deque
+
+from telegram import ReplyParameters
+from telegram.error import BadRequest, RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from .metrics import timed
+
+
+class TokenBucket:
+    """
+    Классический token bucket: rate токенов в секунду, запас не больше capacity.
+
+    Пустой бакет не отказывает, а говорит, сколько ждать (delay),
+    acquire() сам дожидается токена.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated", "clock")
+
+    def __init__(self, rate: float, capacity: float | None = None, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    def delay(self, tokens: float = 1) -> float:
+        """Через сколько секунд в бакете наберётся tokens."""
+        self._refill()
+        if self.tokens >= tokens:
+            return 0.0
+        return (tokens - self.tokens) / self.rate
+
+    @property
+    def full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+    async def acquire(self, tokens: float = 1):
+        while not self.try_acquire(tokens):
+            await asyncio.sleep(self.delay(tokens))
+
+
+class OutboundRateLimiter(BaseRateLimiter):
+    """
+    Ограничитель запросов бота к Bot API (ApplicationBuilder().rate_limiter(...)).
+
+    Через него проходят все вызовы бота, кроме getUpdates:
+    - общий бакет на бота (лимит Telegram — около 30 сообщений в секунду);
+    - бакет на чат: 1 сообщение в секунду в личке, ~20 в минуту в группе;
+    - на 429 (RetryAfter) чат (или весь бот, если чата нет) молчит
+      указанное время, после чего запрос повторяется — без шторма повторов.
+    """
+
+    # служебные методы не тратят токены сообщений
+    FREE_ENDPOINTS = frozenset({
+        "getMe",
+        "answerCallbackQuery",
+        "deleteWebhook",
+        "setWebhook",
+        "getWebhookInfo",
+        "close",
+        "logOut",
+    })
+
+    def __init__(
+        self,
+        global_rate: float = 30,
+        chat_rate: float = 1,
+        group_rate: float = 20 / 60,
+        chat_burst: float = 3,
+        max_retries: int = 3,
+        max_chats: int = 10000,
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+
+        # LRU бакетов по чатам: давно молчащие чаты вытесняются
+        self._chat_buckets: OrderedDict[int, TokenBucket] = OrderedDict()
+        # chat_id (None — весь бот) -> момент, до которого Telegram просил ждать
+        self._paused_until: dict = {}
+
+        self.retries = 0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            # отрицательные id — группы и каналы
+            rate = self.group_rate if chat_id < 0 else self.chat_rate
+            bucket = TokenBucket(rate, self.chat_burst)
+            self._chat_buckets[chat_id] = bucket
+            if len(self._chat_buckets) > self.max_chats:
+                self._chat_buckets.popitem(last=False)
+        else:
+            self._chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    async def _wait_pause(self, chat_id):
+        for key in (None, chat_id):
+            until = self._paused_until.get(key)
+            if until is None:
+                continue
+            delay = until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                self._paused_until.pop(key, None)
+
+    async def process_request(
+        self, callback, args, kwargs, endpoint, data, rate_limit_args
+    ):
+        # ожидание лимитов и сам запрос — сетевое время обработчика
+        with timed("net"):
+            return await self._process(callback, args, kwargs, endpoint, data)
+
+    async def _process(self, callback, args, kwargs, endpoint, data):
+        chat_id = data.get("chat_id")
+        if not isinstance(chat_id, int):
+            # @username каналов и прочее — без бакета чата
+            chat_id = None
+
+        attempt = 0
+        while True:
+            await self._wait_pause(chat_id)
+            if endpoint not in self.FREE_ENDPOINTS:
+                if chat_id is not None:
+                    await self._chat_bucket(chat_id).acquire()
+                await self.global_bucket.acquire()
+
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                self.retries += 1
+                self._paused_until[chat_id] = max(
+                    self._paused_until.get(chat_id, 0),
+                    time.monotonic() + e.retry_after,
+                )
+
+
+class _Outgoing:
+    __slots__ = ("text", "reply_markup", "reply_to", "future", "merge", "edit_of")
+
+    def __init__(self, text, reply_markup, reply_to, future, merge=True, edit_of=None):
+        self.text = text
+        self.reply_markup = reply_markup
+        self.reply_to = reply_to
+        self.future = future
+        self.merge = merge
+        # правка уже отправленного сообщения: его id или future с Message
+        self.edit_of = edit_of
+
+
+class OutboundScheduler:
+    """
+    Очередь исходящих сообщений бота по чатам.
+
+    Обработчик не ждёт Telegram: send() ставит текст в очередь чата и
+    возвращает future. Для каждого чата с непустой очередью работает одна
+    задача, которая отправляет сообщения по порядку. Пока она ждёт
+    лимита (см. OutboundRateLimiter), новые тексты копятся, и подряд
+    идущие сообщения в один чат уходят одним сообщением.
+
+    Склеиваются только сообщения без клавиатуры, за которыми идут другие:
+    клавиатура остаётся у последнего текста пачки.
+
+    edit() ставит в ту же очередь правку сообщения (editMessageText).
+    Если в очереди уже есть более свежая правка того же сообщения,
+    старая не отправляется вовсе.
+    """
+
+    MAX_TEXT_LENGTH = 4096
+    SEPARATOR = "\n\n"
+
+    def __init__(self, merge_delay: float = 0.05, on_error=None):
+        self.merge_delay = merge_delay
+        self.on_error = on_error
+        self._queues: dict[int, deque] = {}
+        self._tasks: dict[int, asyncio.Task] = {}
+
+        # статистика для логов / /stats
+        self.queued = 0
+        self.sent = 0
+        self.merged = 0
+        self.edited = 0
+        self.superseded = 0
+        self.failed = 0
+
+    @property
+    def pending(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def send(
+        self, bot, chat_id: int, text: str, reply_markup=None, reply_to=None, merge=True
+    ):
+        """
+        Поставить сообщение в очередь чата; future получит отправленный Message.
+        merge=False — сообщение уходит отдельно, ни с чем не склеиваясь.
+        """
+        return self._put(
+            bot, chat_id, _Outgoing(text, reply_markup, reply_to, None, merge=merge)
+        )
+
+    def edit(self, bot, chat_id: int, message, text: str, reply_markup=None):
+        """
+        Поставить в очередь чата правку текста сообщения.
+        message — id сообщения или future из send() (дождёмся отправки).
+        """
+        return self._put(
+            bot,
+            chat_id,
+            _Outgoing(text, reply_markup, None, None, merge=False, edit_of=message),
+        )
+
+    def _put(self, bot, chat_id: int, item: _Outgoing):
+        future = asyncio.get_running_loop().create_future()
+        # ошибку уже сообщили через on_error; не ругаемся, если future никто не ждёт
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        item.future = future
+
+        self._queues.setdefault(chat_id, deque()).append(item)
+        self.queued += 1
+        if chat_id not in self._tasks:
+            # свой контекст: отправка идёт уже после обработчика
+            # и не должна попадать в его метрики
+            self._tasks[chat_id] = asyncio.create_task(
+                self._drain(bot, chat_id), context=contextvars.Context()
+            )
+        return future
+
+    def _superseded(self, item: _Outgoing, queue: deque) -> bool:
+        """Есть ли дальше в очереди правка того же сообщения."""
+        target = item.edit_of
+        for other in queue:
+            if other.edit_of is target or (
+                isinstance(target, int) and other.edit_of == target
+            ):
+                return True
+        return False
+
+    def _take(self, queue: deque) -> list[_Outgoing]:
+        batch = [queue.popleft()]
+        if not batch[0].merge:
+            return batch
+        length = len(batch[0].text)
+        while queue and batch[-1].reply_markup is None and queue[0].merge:
+            length += len(self.SEPARATOR) + len(queue[0].text)
+            if length > self.MAX_TEXT_LENGTH:
+                break
+            batch.append(queue.popleft())
+        return batch
+
+    async def _drain(self, bot, chat_id: int):
+        queue = self._queues[chat_id]
+        try:
+            if self.merge_delay:
+                # даём обработчику дописать соседние сообщения
+                await asyncio.sleep(self.merge_delay)
+
+            while queue:
+                batch = self._take(queue)
+                if batch[0].edit_of is not None:
+                    await self._edit(bot, chat_id, batch[0], queue)
+                    continue
+
+                reply_to = batch[0].reply_to
+                try:
+                    message = await bot.send_message(
+                        chat_id,
+                        self.SEPARATOR.join(item.text for item in batch),
+                        reply_markup=batch[-1].reply_markup,
+                        reply_parameters=(
+                            ReplyParameters(reply_to, allow_sending_without_reply=True)
+                            if reply_to is not None
+                            else None
+                        ),
+                    )
+                except Exception as e:
+                    self.failed += len(batch)
+                    if self.on_error:
+                        self.on_error(f"Не удалось отправить сообщение в чат {chat_id}: {e}")
+                    for item in batch:
+                        if not item.future.done():
+                            item.future.set_exception(e)
+                    continue
+
+                self.sent += 1
+                self.merged += len(batch) - 1
+                for item in batch:
+                    if not item.future.done():
+                        item.future.set_result(message)
+        finally:
+            del self._tasks[chat_id]
+            if not queue:
+                del self._queues[chat_id]
+
+    async def _edit(self, bot, chat_id: int, item: _Outgoing, queue: deque):
+        if self._superseded(item, queue):
+            self.superseded += 1
+            item.future.set_result(None)
+            return
+
+        try:
+            message_id = item.edit_of
+            if not isinstance(message_id, int):
+                message_id = (await message_id).message_id
+            result = await bot.edit_message_text(
+                item.text,
+                chat_id=chat_id,
+                message_id=message_id,
+                reply_markup=item.reply_markup,
+            )
+        except BadRequest as e:
+            if "not modified" in str(e):
+                # текст уже такой — правка не нужна
+                item.future.set_result(None)
+                return
+            self._edit_failed(chat_id, item, e)
+            return
+        except Exception as e:
+            self._edit_failed(chat_id, item, e)
+            return
+
+        self.edited += 1
+        item.future.set_result(result)
+
+    def _edit_failed(self, chat_id: int, item: _Outgoing, error: Exception):
+        self.failed += 1
+        if self.on_error:
+            self.on_error(f"Не удалось изменить сообщение в чате {chat_id}: {error}")
+        item.future.set_exception(error)
+
+    async def flush(self):
+        """Дождаться отправки всего, что уже стоит в очередях."""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks.values()), return_exceptions=True)
+
+    async def close(self):
+        await self.flush()
@@ -0,0 +1,16 @@
+class ControlPanel:
+    """
+    Закреплённое сообщение-«панель» партии в чате (режим TG_BOT_CONTROL_PANEL).
+
+    message — id сообщения или, пока оно ещё в очереди на отправку,
+    future с будущим Message (OutboundScheduler.edit() принимает и то, и другое).
+    headline — текст текущей фазы, под ним панель показывает состояние партии.
+    digest — хэш последнего показанного текста: одинаковый текст не правим.
+    """
+
+    __slots__ = ("message", "headline", "digest")
+
+    def __init__(self, message, headline: str, digest: int):
+        self.message = message
+        self.headline = headline
+        self.digest = digest
@@ -0,0 +1,102 @@
+import asyncio
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from .changes import TableChanges
+from .timers import TimerEntry
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Параллельная обработка апдейтов разных чатов (ApplicationBuilder().concurrent_updates(...)).
+
+    Апдейты одного чата идут строго по очереди (asyncio.Lock на чат, FIFO),
+    поэтому обработчики одного чата не гоняются за общий game-словарь.
+    Разные чаты обрабатываются одновременно.
+
+    Ограничения:
+    - max_in_flight — сколько обработчиков реально работает одновременно
+      (семафор берётся уже после блокировки чата, так что апдейты,
+      ждущие свой чат, не занимают эти места);
+    - max_queued — сколько апдейтов всего принято в обработку, включая
+      ожидающих свою очередь в чате (семафор самого python-telegram-bot).
+    """
+
+    def __init__(self, max_in_flight: int = 64, max_queued: int = 4096):
+        super().__init__(max(max_in_flight, max_queued))
+        self.max_in_flight = max_in_flight
+        self._in_flight = asyncio.BoundedSemaphore(max_in_flight)
+        # chat key -> [lock, сколько апдейтов его держат или ждут]
+        self._chat_locks: dict = {}
+
+        # для /stats
+        self.running = 0
+        self.waiting = 0
+        self.processed = 0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    @staticmethod
+    def chat_key(update):
+        """Ключ очереди: чат апдейта, иначе пользователь; None — без упорядочивания."""
+        if isinstance(update, TimerEntry):
+            # сработавший таймер встаёт в очередь своего чата (ключ — (chat_id, стол))
+            return update.key[0]
+        if isinstance(update, TableChanges):
+            # правки с сайта применяются по очереди с апдейтами своего чата
+            return update.key[0]
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return ("user", update.effective_user.id)
+        return None
+
+    @property
+    def busy_chats(self):
+        """Ключи чатов, у которых есть апдейты в работе или в очереди."""
+        return self._chat_locks.keys()
+
+    def is_busy(self, key) -> bool:
+        """Есть ли сейчас апдейты этого чата в работе или в очереди."""
+        return key in self._chat_locks
+
+    async def do_process_update(self, update, coroutine) -> None:
+        key = self.chat_key(update)
+        if key is None:
+            await self._run(coroutine)
+            return
+
+        entry = self._chat_locks.get(key)
+        if entry is None:
+            entry = self._chat_locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        self.waiting += 1
+        acquired = False
+        try:
+            async with entry[0]:
+                acquired = True
+                self.waiting -= 1
+                await self._run(coroutine)
+        finally:
+            if not acquired:
+                self.waiting -= 1
+            entry[1] -= 1
+            if not entry[1]:
+                # ни одного апдейта этого чата — блокировка больше не нужна
+                del self._chat_locks[key]
+
+    async def _run(self, coroutine):
+        async with self._in_flight:
+            self.running += 1
+            try:
+                await coroutine
+            finally:
+                self.running -= 1
+                self.processed += 1
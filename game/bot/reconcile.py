@@ -0,0 +1,61 @@
+from collections import Counter
+
+
+def chunked(items: list, size: int):
+    """Части списка по size элементов — для запросов с id__in."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def diff_rows(expected: dict, actual: dict) -> tuple[dict, list]:
+    """
+    Сравнить строки БД с тем, какими они должны быть.
+
+    expected и actual — {id: {поле: значение}}; сравниваются только поля
+    из expected. Возвращает ({id: {поле: нужное значение}} для
+    разошедшихся строк, [id строк, которых в БД нет]).
+    """
+    changed = {}
+    missing = []
+    for row_id, fields in expected.items():
+        row = actual.get(row_id)
+        if row is None:
+            missing.append(row_id)
+            continue
+        diff = {field: value for field, value in fields.items() if row.get(field) != value}
+        if diff:
+            changed[row_id] = diff
+    return changed, missing
+
+
+class ReconcileStats:
+    """
+    Итоги сверки партий бота с БД (для /stats и консоли).
+
+    mismatches — расхождения последнего прохода по видам,
+    total — расхождения за всё время работы бота.
+    """
+
+    def __init__(self):
+        self.runs = 0
+        self.games = 0
+        self.skipped = 0
+        self.statements = 0
+        self.last_seconds = 0.0
+        self.mismatches: Counter = Counter()
+        self.total: Counter = Counter()
+
+    def start(self):
+        self.runs += 1
+        self.games = self.skipped = self.statements = 0
+        self.mismatches = Counter()
+
+    def count(self, kind: str, n: int = 1):
+        if n:
+            self.mismatches[kind] += n
+            self.total[kind] += n
+
+    def render(self) -> str:
+        if not self.mismatches:
+            return "расхождений нет"
+        return ", ".join(f"{kind} {n}" for kind, n in self.mismatches.most_common())
@@ -0,0 +1,236 @@
+import asyncio
+import json
+import multiprocessing
+import queue as queue_lib
+import signal
+
+# Ключи апдейта Telegram, в которых лежит объект с полем chat
+CHAT_KEYS = (
+    "message",
+    "edited_message",
+    "channel_post",
+    "edited_channel_post",
+    "my_chat_member",
+    "chat_member",
+    "chat_join_request",
+)
+
+
+def update_chat_id(data: dict):
+    """chat_id «сырого» апдейта (dict из Bot API) или None, если чата нет."""
+    for key in CHAT_KEYS:
+        if key in data:
+            return data[key]["chat"]["id"]
+
+    query = data.get("callback_query")
+    if query:
+        message = query.get("message")
+        if message:
+            return message["chat"]["id"]
+        return query["from"]["id"]
+
+    return None
+
+
+def shard_for(chat_id, shards: int) -> int:
+    """
+    Номер воркера, которому принадлежит чат.
+
+    Зависит только от chat_id, поэтому одинаков во всех процессах
+    и между перезапусками. Апдейты без чата уходят воркеру 0.
+    """
+    if chat_id is None or shards <= 1:
+        return 0
+    return chat_id % shards
+
+
+def read_updates_file(path: str):
+    """
+    Подменный источник апдейтов: JSON Lines, один апдейт Bot API на строку.
+
+    Нужен для локальных прогонов шардированного режима без Telegram.
+    """
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+class ShardRouter:
+    """
+    Раздаёт апдейты воркерам по chat_id.
+
+    У каждого воркера одна очередь (FIFO), а чат всегда попадает
+    к одному и тому же воркеру — поэтому апдейты одного чата
+    обрабатываются в том порядке, в котором пришли.
+    """
+
+    def __init__(self, queues: list, workers: list = (), on_error=None):
+        self.queues = queues
+        self.workers = list(workers)
+        self.on_error = on_error
+        self.routed = [0] * len(queues)
+        self.dropped = 0
+
+    def route(self, data: dict) -> int:
+        """Отправить апдейт воркеру-владельцу, вернуть номер воркера."""
+        index = shard_for(update_chat_id(data), len(self.queues))
+        if self._put(index, data):
+            self.routed[index] += 1
+        else:
+            self.dropped += 1
+        return index
+
+    def offer(self, data: dict) -> bool:
+        """
+        Как route(), но без ожидания: False, если очередь воркера полна.
+
+        Для webhook: сервер не может ждать воркера внутри цикла событий,
+        вместо этого он отвечает Telegram 503, и тот повторит апдейт.
+        """
+        index = shard_for(update_chat_id(data), len(self.queues))
+        try:
+            self.queues[index].put_nowait(data)
+        except queue_lib.Full:
+            return False
+        self.routed[index] += 1
+        return True
+
+    def _put(self, index: int, data) -> bool:
+        # очередь ограничена: ждём, пока воркер разгрузит её,
+        # но не вечно, если сам воркер уже упал
+        while True:
+            try:
+                self.queues[index].put(data, timeout=1)
+                return True
+            except queue_lib.Full:
+                if self.workers and not self.workers[index].is_alive():
+                    if self.on_error:
+                        self.on_error(f"Воркер {index} остановлен, апдейт отброшен.")
+                    return False
+
+    def close(self):
+        """Попросить воркеров дообработать очередь и завершиться."""
+        for index in range(len(self.queues)):
+            if not self.workers or self.workers[index].is_alive():
+                self._put(index, None)
+
+
+async def poll_updates(token: str, router: ShardRouter, timeout: int = 30):
+    """Long polling getUpdates во фронт-процессе: апдейты только раздаются, не обрабатываются."""
+    from telegram import Bot, Update
+    from telegram.error import NetworkError
+
+    offset = None
+    async with Bot(token) as bot:
+        await bot.delete_webhook()
+        while True:
+            try:
+                updates = await bot.get_updates(
+                    offset=offset,
+                    timeout=timeout,
+                    allowed_updates=Update.ALL_TYPES,
+                )
+            except NetworkError:
+                await asyncio.sleep(1)
+                continue
+
+            for update in updates:
+                router.route(update.to_dict())
+                offset = update.update_id + 1
+
+
+async def receive_webhook(
+    server, router: ShardRouter, token: str = "", url: str = "", replay_file=None
+):
+    """
+    Webhook во фронт-процессе: апдейты из HTTP-запросов сразу раздаются воркерам.
+
+    С url адрес регистрируется в Telegram; с replay_file апдейты берутся
+    из файла и отправляются на свой же сервер (локальные прогоны).
+    """
+    from .webhook import register_webhook, replay_updates
+
+    server.intake = router.offer
+    await server.start()
+    try:
+        if url:
+            from telegram import Bot
+
+            async with Bot(token) as bot:
+                await register_webhook(bot, url, server.secret_token)
+        if replay_file:
+            await replay_updates(server.url, replay_file, server.secret_token)
+        else:
+            await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+def run_worker(index: int, shards: int, updates, fake_api: bool):
+    """Точка входа процесса-воркера (запускается через spawn)."""
+    # Ctrl+C получает вся группа процессов; воркер останавливается
+    # только по сигналу фронта (None в очереди), дообработав свои апдейты
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    import django
+
+    django.setup()
+
+    from game.management.commands.runbot import Command
+
+    Command().serve_shard(index, shards, updates, fake_api=fake_api)
+
+
+def run_sharded(
+    shards: int,
+    token: str = "",
+    updates_file: str | None = None,
+    fake_api: bool = False,
+    queue_size: int = 1000,
+    log=print,
+    webhook=None,
+    webhook_url: str = "",
+) -> ShardRouter:
+    """
+    Фронт-процесс шардированного режима.
+
+    Запускает shards воркеров, получает апдейты (из Telegram или из файла)
+    и раздаёт их по chat_id. Когда источник закончился (или Ctrl+C),
+    воркеры дообрабатывают свои очереди и завершаются.
+    webhook — WebhookServer: апдейты приходят на него, а не через getUpdates
+    (с updates_file — отправляются на него из файла).
+    """
+    ctx = multiprocessing.get_context("spawn")
+    queues = [ctx.Queue(maxsize=queue_size) for _ in range(shards)]
+    workers = [
+        ctx.Process(
+            target=run_worker,
+            args=(index, shards, queues[index], fake_api),
+            name=f"mafia-bot-shard-{index}",
+        )
+        for index in range(shards)
+    ]
+    for worker in workers:
+        worker.start()
+
+    router = ShardRouter(queues, workers, on_error=log)
+    try:
+        if webhook is not None:
+            asyncio.run(
+                receive_webhook(webhook, router, token, webhook_url, replay_file=updates_file)
+            )
+        elif updates_file:
+            for data in read_updates_file(updates_file):
+                router.route(data)
+        else:
+            asyncio.run(poll_updates(token, router))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        router.close()
+        for worker in workers:
+            worker.join()
+
+    return router
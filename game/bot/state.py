@@ -0,0 +1,284 @@
+"""
+Состояние партии бота в памяти: компактные классы со __slots__.
+
+Роли и стороны — целые коды, кто жив — битовая маска партии
+(бит i — игрок i), поэтому подсчёт сторон — это AND масок и bit_count().
+В журнал и снимки (GameEvent) состояние пишется словарём в прежнем
+формате — со строковыми кодами ролей (to_dict / from_dict).
+"""
+
+import sys
+
+# Коды ролей
+ROLE_NONE = 0       # роль неизвестна (раздача по карточкам)
+ROLE_TOWN = 1
+ROLE_MAFIA = 2
+ROLE_DON = 3
+ROLE_DETECTIVE = 4
+ROLE_DOCTOR = 5
+
+# Строковые коды ролей в журнале/снимках; индекс — код роли
+ROLE_NAMES = (None, "town", "mafia", "don", "detective", "doctor")
+ROLE_BY_NAME = {name: code for code, name in enumerate(ROLE_NAMES) if name}
+
+# Стороны
+SIDE_TOWN = 0
+SIDE_MAFIA = 1
+SIDE_NAMES = ("town", "mafia")
+
+# Сторона каждой роли; индекс — код роли (у неизвестной роли стороны нет)
+ROLE_SIDE = (None, SIDE_TOWN, SIDE_MAFIA, SIDE_MAFIA, SIDE_TOWN, SIDE_TOWN)
+
+
+class PlayerState:
+    """Игрок партии: место (номер бита в масках), имя, код роли, Player.id."""
+
+    # tg_user_id — Telegram-аккаунт игрока (/join), role_dm — доставка роли в личку:
+    # None / "pending" / "sent" / "failed"
+    __slots__ = ("seat", "name", "role", "db_id", "tg_user_id", "role_dm")
+
+    def __init__(self, seat: int, name: str, role: int = ROLE_NONE, db_id=None):
+        self.seat = seat
+        self.name = name
+        self.role = role
+        self.db_id = db_id
+        self.tg_user_id = None
+        self.role_dm = None
+
+    @property
+    def bit(self) -> int:
+        return 1 << self.seat
+
+    def __repr__(self):
+        return f"PlayerState({self.seat}, {self.name!r}, {ROLE_NAMES[self.role]})"
+
+
+class GameState:
+    """Партия одного чата."""
+
+    __slots__ = (
+        "planned_players",
+        "players",
+        "roles_assigned",
+        "roles_mode",        # 'random' или 'cards'
+        "phase",             # night/day/vote/finished
+        "round",
+        "pending_kill",
+        "pending_heal",
+        "pending_check",
+        "last_night_killed",
+        "db_session_id",
+        "game_mode",
+        "adding_players",
+        "winner_side",
+        "mafia_alive",
+        "town_alive",
+        "event_seq",         # последний записанный GameEvent.seq
+        "snapshot_seq",      # seq последнего снимка состояния
+        "web_change",        # id последней применённой правки с сайта (SessionChange)
+        "host_id",           # Telegram id ведущего (кто начал партию): подтверждает /join
+        "table",             # номер стола в чате (Session.tg_table), в снимок не пишется
+        # производные данные: не попадают в снимки, пересобираются reindex()
+        "index",             # имя (casefold) -> игрок
+        "alive_mask",        # бит seat — игрок жив
+        "role_masks",        # код роли -> биты игроков с этой ролью
+    )
+
+    # поля, которые пишутся в снимок как есть
+    SNAPSHOT_FIELDS = (
+        "planned_players",
+        "roles_assigned",
+        "roles_mode",
+        "phase",
+        "round",
+        "pending_kill",
+        "pending_heal",
+        "pending_check",
+        "last_night_killed",
+        "db_session_id",
+        "game_mode",
+        "adding_players",
+        "winner_side",
+        "mafia_alive",
+        "town_alive",
+        "event_seq",
+        "snapshot_seq",
+        "web_change",
+        "host_id",
+    )
+
+    def __init__(self, planned_players: int, game_mode: str, db_session_id=None):
+        self.planned_players = planned_players
+        self.players: list[PlayerState] = []
+        self.roles_assigned = False
+        self.roles_mode = None
+        self.phase = None
+        self.round = 0
+        self.pending_kill = None
+        self.pending_heal = None
+        self.pending_check = None
+        self.last_night_killed = None
+        self.db_session_id = db_session_id
+        self.game_mode = game_mode
+        self.adding_players = False
+        self.winner_side = None
+        self.mafia_alive = 0
+        self.town_alive = 0
+        self.event_seq = 0
+        self.snapshot_seq = 0
+        self.web_change = 0
+        self.host_id = None
+        self.table = 1
+        self.index: dict[str, PlayerState] = {}
+        self.alive_mask = 0
+        self.role_masks = [0] * len(ROLE_NAMES)
+
+    # Игроки
+
+    @staticmethod
+    def name_key(name: str) -> str:
+        """Ключ имени игрока для поиска без учёта регистра (как Player.name_key в БД)."""
+        return name.strip().casefold()
+
+    def add_player(self, name: str, db_id=None, role: int = ROLE_NONE, alive: bool = True):
+        player = PlayerState(len(self.players), name, role, db_id)
+        self.players.append(player)
+        self.index[self.name_key(name)] = player
+        self.role_masks[role] |= player.bit
+        if alive:
+            self.alive_mask |= player.bit
+        return player
+
+    def find_player(self, name: str):
+        return self.index.get(self.name_key(name))
+
+    def set_roles(self, roles):
+        """Роли всех игроков по порядку (коды), маски ролей пересобираются."""
+        masks = [0] * len(ROLE_NAMES)
+        for player, role in zip(self.players, roles):
+            player.role = role
+            masks[role] |= player.bit
+        self.role_masks = masks
+
+    def reindex(self):
+        """Пересобрать индекс имён и маски ролей из players (после загрузки снимка)."""
+        self.index = {}
+        self.role_masks = [0] * len(ROLE_NAMES)
+        for seat, player in enumerate(self.players):
+            player.seat = seat
+            self.index[self.name_key(player.name)] = player
+            self.role_masks[player.role] |= player.bit
+
+    # Живые
+
+    def is_alive(self, player: PlayerState) -> bool:
+        return bool(self.alive_mask & player.bit)
+
+    def kill(self, player: PlayerState) -> bool:
+        """Игрок выбыл. False — он уже был выбывшим."""
+        if not self.alive_mask & player.bit:
+            return False
+        self.alive_mask &= ~player.bit
+        return True
+
+    def revive(self, player: PlayerState) -> bool:
+        """Игрок снова в игре (правка ведущего). False — он и так был жив."""
+        if self.alive_mask & player.bit:
+            return False
+        self.alive_mask |= player.bit
+        return True
+
+    def roles_mask(self, *roles: int) -> int:
+        mask = 0
+        for role in roles:
+            mask |= self.role_masks[role]
+        return mask
+
+    def alive_players(self, *roles: int) -> list[PlayerState]:
+        """Живые игроки по порядку (только указанных ролей, если заданы)."""
+        mask = self.alive_mask
+        if roles:
+            mask &= self.roles_mask(*roles)
+        return [p for p in self.players if mask & p.bit]
+
+    def alive_count(self, *roles: int) -> int:
+        mask = self.alive_mask
+        if roles:
+            mask &= self.roles_mask(*roles)
+        return mask.bit_count()
+
+    def side_mask(self, side: int) -> int:
+        return self.roles_mask(
+            *(role for role, role_side in enumerate(ROLE_SIDE) if role_side == side)
+        )
+
+    def alive_counts(self) -> tuple[int, int]:
+        """(живых мафий, живых остальных); дон считается мафией."""
+        mafia = (self.alive_mask & self.side_mask(SIDE_MAFIA)).bit_count()
+        return mafia, self.alive_mask.bit_count() - mafia
+
+    # Снимок
+
+    def to_dict(self) -> dict:
+        """Состояние для снимка в журнале (формат с именами ролей, без индексов)."""
+        data = {field: getattr(self, field) for field in self.SNAPSHOT_FIELDS}
+        data["players"] = [
+            {
+                "name": p.name,
+                "role": ROLE_NAMES[p.role],
+                "alive": self.is_alive(p),
+                "db_id": p.db_id,
+                "tg_user_id": p.tg_user_id,
+                "role_dm": p.role_dm,
+            }
+            for p in self.players
+        ]
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "GameState":
+        game = cls(data["planned_players"], data.get("game_mode"), data.get("db_session_id"))
+        for field in cls.SNAPSHOT_FIELDS:
+            if field in data:
+                setattr(game, field, data[field])
+        for p in data.get("players", []):
+            player = game.add_player(
+                p["name"],
+                db_id=p.get("db_id"),
+                role=ROLE_BY_NAME.get(p.get("role"), ROLE_NONE),
+                alive=p.get("alive", True),
+            )
+            player.tg_user_id = p.get("tg_user_id")
+            player.role_dm = p.get("role_dm")
+        return game
+
+    def player_of_user(self, user_id: int):
+        """Место, к которому привязан Telegram-аккаунт user_id (или None)."""
+        for player in self.players:
+            if player.tg_user_id == user_id:
+                return player
+        return None
+
+
+def deep_sizeof(obj) -> int:
+    """Сколько байт занимает объект вместе со всем, на что он ссылается."""
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        elif hasattr(type(item), "__slots__"):
+            for cls in type(item).__mro__:
+                for name in getattr(cls, "__slots__", ()):
+                    if hasattr(item, name):
+                        stack.append(getattr(item, name))
+    return total
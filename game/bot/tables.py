@@ -0,0 +1,57 @@
+from collections.abc import MutableMapping
+
+# стол по умолчанию: в чате с одной партией номер стола нигде не нужен
+DEFAULT_TABLE = 1
+
+_NO_TABLES: dict = {}
+
+
+class TableMap(MutableMapping):
+    """
+    Партии бота по ключу (chat_id, стол) с индексом «чат -> его столы».
+
+    Снаружи — обычный словарь с ключами-кортежами. Внутри партии лежат
+    по чатам, поэтому все столы чата (tables()) находятся одним поиском
+    по chat_id, без обхода всех партий бота. Чат без партий из индекса
+    удаляется.
+    """
+
+    def __init__(self):
+        self._chats: dict[int, dict[int, object]] = {}
+        self._count = 0
+
+    def __getitem__(self, key):
+        chat_id, table = key
+        return self._chats.get(chat_id, _NO_TABLES)[table]
+
+    def __setitem__(self, key, game):
+        chat_id, table = key
+        tables = self._chats.setdefault(chat_id, {})
+        if table not in tables:
+            self._count += 1
+        tables[table] = game
+
+    def __delitem__(self, key):
+        chat_id, table = key
+        tables = self._chats.get(chat_id, _NO_TABLES)
+        del tables[table]
+        self._count -= 1
+        if not tables:
+            del self._chats[chat_id]
+
+    def __iter__(self):
+        for chat_id, tables in list(self._chats.items()):
+            for table in list(tables):
+                yield chat_id, table
+
+    def __len__(self):
+        return self._count
+
+    def tables(self, chat_id: int) -> dict:
+        """Столы чата: {номер стола: партия} (только для чтения)."""
+        return self._chats.get(chat_id, _NO_TABLES)
+
+    @property
+    def by_chat(self) -> dict:
+        """Индекс chat_id -> {стол: партия} (только для чтения)."""
+        return self._chats
@@ -0,0 +1,99 @@
+import asyncio
+import math
+import time
+
+
+class TimerEntry:
+    """Заведённый таймер: ключ (chat_id, стол), момент срабатывания (epoch, сек) и данные."""
+
+    __slots__ = ("key", "deadline", "payload", "tick", "fired")
+
+    def __init__(self, key, deadline: float, payload, tick: int):
+        self.key = key
+        self.deadline = deadline
+        self.payload = payload
+        self.tick = tick
+        self.fired = False
+
+    @property
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.time())
+
+
+class TimerWheel:
+    """
+    Один общий таймер на все чаты (hashed timing wheel).
+
+    Время делится на тики по resolution секунд, таймеры раскладываются
+    по slots ячейкам колеса по номеру тика срабатывания. Одна фоновая
+    задача раз в тик просматривает только текущую ячейку, так что тысячи
+    столов с таймерами стоят одну задачу и O(1) на постановку/отмену.
+
+    На ключ — не больше одного таймера: schedule() заменяет прежний.
+    Сработавший таймер передаётся в on_expire(entry) и остаётся доступен
+    через get(), пока его не заберут cancel() — так обработчик может
+    проверить, что таймер не заменили, пока он ждал своей очереди.
+    Время — настенное (time.time): дедлайны хранятся в БД и переживают
+    перезапуск.
+    """
+
+    def __init__(self, on_expire, resolution: float = 1.0, slots: int = 512, clock=time.time):
+        self.on_expire = on_expire
+        self.resolution = resolution
+        self.clock = clock
+        self._slots: list[dict] = [{} for _ in range(slots)]
+        self._entries: dict = {}
+        self._tick = int(clock() // resolution)
+        self._task: asyncio.Task | None = None
+
+        # для /stats
+        self.fired = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key) -> TimerEntry | None:
+        return self._entries.get(key)
+
+    def schedule(self, key, deadline: float, payload=None) -> TimerEntry:
+        """Завести таймер key на момент deadline (прошедший — сработает на ближайшем тике)."""
+        self.cancel(key)
+        tick = max(math.ceil(deadline / self.resolution), self._tick)
+        entry = TimerEntry(key, deadline, payload, tick)
+        self._slots[tick % len(self._slots)][key] = entry
+        self._entries[key] = entry
+        return entry
+
+    def cancel(self, key) -> TimerEntry | None:
+        entry = self._entries.pop(key, None)
+        if entry is not None and not entry.fired:
+            self._slots[entry.tick % len(self._slots)].pop(key, None)
+        return entry
+
+    def advance(self, now: float | None = None):
+        """Сработать всем таймерам с тиком не позже now."""
+        target = int((self.clock() if now is None else now) // self.resolution)
+        while self._tick <= target:
+            slot = self._slots[self._tick % len(self._slots)]
+            due = [entry for entry in slot.values() if entry.tick <= self._tick]
+            for entry in due:
+                del slot[entry.key]
+                entry.fired = True
+                self.fired += 1
+                self.on_expire(entry)
+            self._tick += 1
+
+    async def _run(self):
+        while True:
+            now = self.clock()
+            await asyncio.sleep(self.resolution - now % self.resolution)
+            self.advance()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
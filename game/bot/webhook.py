@@ -0,0 +1,196 @@
+import asyncio
+import hmac
+import json
+import time
+
+from .sharding import read_updates_file
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+
+_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    503: "Service Unavailable",
+}
+
+
+class WebhookServer:
+    """
+    Приём апдейтов Telegram через webhook: небольшой HTTP/1.1-сервер на asyncio.
+
+    Telegram отправляет каждый апдейт POST-запросом на path с заголовком
+    X-Telegram-Bot-Api-Secret-Token; запросы с другим секретом отклоняются
+    (403). Принятый апдейт (dict из Bot API) передаётся в intake(data):
+    он кладёт апдейт в ограниченную очередь и возвращает False, если места
+    нет. Тогда сервер отвечает 503, и Telegram повторит апдейт позже —
+    так очередь не растёт без предела, а апдейты не теряются.
+
+    200 уходит сразу после постановки в очередь, не дожидаясь обработчика:
+    Telegram не ждёт бота, а соединение (keep-alive) готово к следующему
+    апдейту. Сервер слушает локальный адрес; TLS и публичный адрес —
+    на обратном прокси перед ним.
+    """
+
+    def __init__(
+        self,
+        secret_token: str,
+        path: str = "/telegram",
+        listen: str = "127.0.0.1",
+        port: int = 8443,
+        intake=None,
+        max_body: int = 1024 * 1024,
+        idle_timeout: float = 60.0,
+    ):
+        self.secret_token = secret_token
+        self.path = path
+        self.listen = listen
+        self.port = port
+        self.intake = intake
+        self.max_body = max_body
+        self.idle_timeout = idle_timeout
+        self._server: asyncio.base_events.Server | None = None
+
+        # для /stats
+        self.accepted = 0
+        self.overflows = 0
+        self.forbidden = 0
+        self.bad = 0
+
+    @property
+    def url(self) -> str:
+        """Локальный адрес приёма апдейтов (для прогонов с replay_updates)."""
+        return f"http://{self.listen}:{self.port}{self.path}"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.listen, self.port)
+        # port=0 — свободный порт, его выбрала ОС
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(
+                        self._read_request(reader), self.idle_timeout
+                    )
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+                    # молчит дольше idle_timeout, оборвал запрос или прислал не HTTP
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+
+                status = self._accept(method, target, headers, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                response = (
+                    f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+                    "Content-Length: 0\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+                    "\r\n"
+                )
+                writer.write(response.encode("ascii"))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        """(метод, путь, заголовки, тело) очередного запроса или None, если соединение закрыто."""
+        line = await reader.readline()
+        if not line:
+            return None
+        method, target, _ = line.decode("latin-1").split(" ", 2)
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length") or 0)
+        if length > self.max_body:
+            raise ValueError("тело запроса слишком большое")
+        body = await reader.readexactly(length) if length else b""
+        return method, target, headers, body
+
+    def _accept(self, method: str, target: str, headers: dict, body: bytes) -> int:
+        """Проверить запрос и передать апдейт в intake; вернуть HTTP-статус ответа."""
+        if target.split("?", 1)[0] != self.path:
+            return 404
+        if method != "POST":
+            return 405
+        secret = headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(secret.encode(), self.secret_token.encode()):
+            self.forbidden += 1
+            return 403
+
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict) or "update_id" not in data:
+            self.bad += 1
+            return 400
+
+        try:
+            queued = self.intake(data)
+        except (KeyError, TypeError, ValueError):
+            # апдейт не разбирается (не тот формат Bot API)
+            self.bad += 1
+            return 400
+        if not queued:
+            self.overflows += 1
+            return 503
+        self.accepted += 1
+        return 200
+
+
+async def register_webhook(bot, url: str, secret_token: str, max_connections: int = 40):
+    """Сообщить Telegram публичный адрес webhook и секрет для заголовка."""
+    from telegram import Update
+
+    await bot.set_webhook(
+        url=url,
+        secret_token=secret_token,
+        max_connections=max_connections,
+        allowed_updates=Update.ALL_TYPES,
+    )
+
+
+async def replay_updates(url: str, path: str, secret_token: str, retry_delay: float = 0.05):
+    """
+    Подменный Telegram: отправить апдейты из файла JSON Lines на webhook.
+
+    Апдейты идут по одному через одно keep-alive соединение, в порядке
+    файла; на 503 апдейт повторяется после паузы, как это делает Telegram.
+    Возвращает время ответа сервера на каждый апдейт (сек).
+    """
+    import httpx
+
+    latencies = []
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret_token}
+    async with httpx.AsyncClient(timeout=10) as client:
+        for data in read_updates_file(path):
+            while True:
+                started = time.perf_counter()
+                response = await client.post(url, json=data, headers=headers)
+                if response.status_code != 503:
+                    break
+                await asyncio.sleep(retry_delay)
+            latencies.append(time.perf_counter() - started)
+            response.raise_for_status()
+    return latencies
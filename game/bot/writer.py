@@ -0,0 +1,266 @@
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+
+from .metrics import timed
+
+
+class _Segment:
+    """
+    Часть очереди записи: склеенные INSERT/UPDATE, затем операции call().
+    touched — модели, которые трогают операции сегмента (None — любые):
+    более поздние изменения этих моделей идут уже в следующий сегмент.
+    """
+
+    __slots__ = ("updates", "inserts", "calls", "touched")
+
+    def __init__(self):
+        # model -> {filter (кортеж пар поле/значение) -> поля для UPDATE}
+        self.updates: dict = {}
+        # model -> [объекты для bulk_create]
+        self.inserts: dict = {}
+        self.calls: list = []
+        self.touched: set | None = set()
+
+    def touches(self, model) -> bool:
+        return self.touched is None or model in self.touched
+
+
+class WriteBehindQueue:
+    """
+    Отложенная запись в БД для бота (write-behind).
+
+    Обработчики не ждут SQLite: они только кладут изменения в очередь,
+    а фоновая задача раз в flush_interval секунд (или сразу, когда набралось
+    batch_size изменений) пишет всё накопленное одной транзакцией.
+
+    Повторные обновления одной и той же строки склеиваются:
+    три смены фазы одной Session за интервал дадут один UPDATE
+    с последними значениями полей. Порядок постановки соблюдается для
+    операций call(): изменения моделей, которые операция трогает,
+    поставленные до неё, пишутся до неё, а поставленные после — после
+    (и не склеиваются с более ранними).
+
+    Если в очереди больше max_pending изменений (БД не успевает),
+    добавление ждёт ближайшей записи — так обработчики притормаживают,
+    а память не растёт без ограничений.
+    """
+
+    def __init__(
+        self,
+        flush_interval: float = 0.5,
+        batch_size: int = 100,
+        max_pending: int = 1000,
+        on_error=None,
+        executor=None,
+    ):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.on_error = on_error
+        # DatabaseExecutor; без него пачка пишется через sync_to_async
+        self.executor = executor
+
+        # сегменты очереди по порядку постановки (_Segment)
+        self._segments: list[_Segment] = [_Segment()]
+        self._pending = 0
+
+        # пачки пишутся по одной: с пулом потоков БД (threads > 0) две
+        # параллельные записи могли бы закоммититься не в том порядке
+        self._flush_lock = asyncio.Lock()
+        self._wakeup: asyncio.Event | None = None
+        self._flushed: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._closing = False
+
+        # статистика для логов / /stats
+        self.flushes = 0
+        self.written = 0
+        self.last_flush_seconds = 0.0
+
+    # Постановка изменений в очередь
+
+    async def update(self, model, fields: dict, **lookup):
+        """
+        UPDATE model SET fields WHERE lookup — с склейкой по lookup.
+
+        Значения-функции вычисляются в момент записи (в потоке БД).
+        """
+        key = tuple(sorted(lookup.items()))
+        for segment in reversed(self._segments):
+            if segment.touches(model):
+                # за этой строкой уже стоит операция с моделью — склеивать нельзя
+                break
+            rows = segment.updates.get(model)
+            if rows is not None and key in rows:
+                rows[key].update(fields)
+                return
+        self._segment(model).updates.setdefault(model, {})[key] = dict(fields)
+        await self._added()
+
+    async def insert(self, objs: list):
+        """Добавить объекты для bulk_create (по модели)."""
+        for obj in objs:
+            self._segment(type(obj)).inserts.setdefault(type(obj), []).append(obj)
+        if objs:
+            await self._added(len(objs))
+
+    async def call(self, func, models=None):
+        """
+        Синхронная операция с БД, которую нельзя склеить (выполняется по порядку).
+        models — модели, которые она читает или пишет; None — любые.
+        """
+        segment = self._segments[-1]
+        segment.calls.append(func)
+        if models is None:
+            segment.touched = None
+        elif segment.touched is not None:
+            segment.touched.update(models)
+        await self._added()
+
+    def _segment(self, model) -> "_Segment":
+        """Сегмент для изменения model: новый, если последний уже трогает model операцией."""
+        if self._segments[-1].touches(model):
+            self._segments.append(_Segment())
+        return self._segments[-1]
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def _added(self, count: int = 1):
+        self._pending += count
+
+        if self._wakeup is None:
+            # фоновая задача не запущена — запись только через flush()
+            return
+
+        if self._pending >= self.batch_size:
+            self._wakeup.set()
+
+        # backpressure: ждём, пока фоновая задача разгрузит очередь
+        # (для метрик обработчика это время БД)
+        if self._pending >= self.max_pending and not self._closing:
+            with timed("db"):
+                while self._pending >= self.max_pending and not self._closing:
+                    self._wakeup.set()
+                    self._flushed.clear()
+                    await self._flushed.wait()
+
+    # Запись
+
+    def _take_batch(self):
+        batch = self._segments
+        self._segments = [_Segment()]
+        self._pending = 0
+        return batch
+
+    def _units(self, batch):
+        """Разбить пачку на операции (для повтора по одной) в порядке сегментов."""
+        units = []
+        for segment in batch:
+            for model, objs in segment.inserts.items():
+                units.append((len(objs), lambda m=model, o=objs: m.objects.bulk_create(o)))
+
+            for model, rows in segment.updates.items():
+                for key, fields in rows.items():
+                    def _update(m=model, k=key, f=fields):
+                        values = {
+                            name: value() if callable(value) else value
+                            for name, value in f.items()
+                        }
+                        m.objects.filter(**dict(k)).update(**values)
+                    units.append((1, _update))
+
+            for func in segment.calls:
+                units.append((1, func))
+
+        return units
+
+    def _write(self, batch) -> int:
+        """Записать пачку одной транзакцией (вызывается в потоке БД)."""
+        units = self._units(batch)
+        try:
+            with transaction.atomic():
+                for _, func in units:
+                    func()
+            return sum(size for size, _ in units)
+        except Exception as e:
+            self._report(f"пачка не записана целиком ({e}), пишем по одной операции")
+
+        # одна битая операция не должна терять всю пачку
+        written = 0
+        for size, func in units:
+            try:
+                with transaction.atomic():
+                    func()
+                written += size
+            except Exception as e:
+                self._report(str(e))
+        return written
+
+    def _report(self, message: str):
+        if self.on_error:
+            self.on_error(f"Отложенная запись в БД: {message}")
+
+    async def flush(self):
+        """
+        Записать всё, что накопилось, и дождаться окончания записи —
+        в том числе пачки, которую сейчас пишет другой вызов flush().
+        """
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch = self._take_batch()
+            started = time.perf_counter()
+            try:
+                if self.executor is not None:
+                    self.written += await self.executor.run(self._write, batch)
+                else:
+                    self.written += await sync_to_async(self._write)(batch)
+            finally:
+                self.flushes += 1
+                self.last_flush_seconds = time.perf_counter() - started
+                if self._flushed is not None:
+                    self._flushed.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            try:
+                await self.flush()
+            except Exception as e:
+                self._report(str(e))
+
+            if self._closing and not self._pending:
+                return
+
+    # Жизненный цикл
+
+    def start(self):
+        """Запустить фоновую запись (внутри работающего event loop)."""
+        if self._task is not None:
+            return
+        self._closing = False
+        self._wakeup = asyncio.Event()
+        self._flushed = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Остановить фоновую запись, предварительно записав всю очередь."""
+        self._closing = True
+        if self._task is not None:
+            self._wakeup.set()
+            self._flushed.set()
+            await self._task
+            self._task = None
+            self._wakeup = None
+            self._flushed = None
+        await self.flush()
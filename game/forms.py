@@ -1,7 +1,8 @@
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 from django import forms
-from .models import Session, Player
+from .models import Session, Player, player_name_key
+from .logic import split_player_names
 
 
 class SessionForm(forms.ModelForm):
@@ -61,6 +62,36 @@ class PlayerForm(forms.ModelForm):
             'notes': 'Примечание',
         }
 
+    def __init__(self, *args, session=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.session = session
+
+    def clean_name(self):
+        # сессии нет среди полей формы, поэтому ограничение уникальности
+        # имени в партии Django здесь сам не проверит
+        name = self.cleaned_data['name'].strip()
+        if self.session is not None:
+            others = self.session.players.filter(name_key=player_name_key(name))
+            if self.instance.pk:
+                others = others.exclude(pk=self.instance.pk)
+            if others.exists():
+                raise forms.ValidationError('В этой партии уже есть игрок с таким именем.')
+        return name
+
+
+class PlayersBulkForm(forms.Form):
+    names = forms.CharField(
+        label='Имена игроков',
+        widget=forms.Textarea(attrs={'rows': 6}),
+        help_text='Через запятую или каждое имя с новой строки.',
+    )
+
+    def clean_names(self):
+        names = split_player_names(self.cleaned_data['names'])
+        if not names:
+            raise forms.ValidationError('Не нашлось ни одного имени.')
+        return names
+
 
 class RegisterForm(UserCreationForm):
     class Meta:
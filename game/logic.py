@@ -2,7 +2,8 @@ from django.core.exceptions import ValidationError
 from django.db import transaction
 import math
 import random
-from .models import Session, Player, Result, Phase, Role
+from .models import Session, Player, Result, Role, SessionChange, player_name_key
+from .registry import registry
 
 SPORT_MODE_KEYWORD = "спортив"   # подстрока в названии спортивного режима
 
@@ -19,16 +20,26 @@ def build_default_role_pool(players_count: int) -> list[Role]:
       - 13+ : появляется маньяк
       - 14+ : появляется красотка
     Остальные места заполняем мирными жителями.
+
+    Набор считается один раз на каждое число игроков и хранится в кэше
+    справочников (сбрасывается при изменении ролей).
     """
-    roles_by_name = {r.name.lower(): r for r in Role.objects.all()}
+    pool = registry.memo(
+        ("role_pool", players_count),
+        lambda: tuple(_compose_role_pool(players_count)),
+    )
+    return list(pool)
+
 
-    mafia_role = roles_by_name.get("мафия")
-    don_role = roles_by_name.get("дон мафии")
-    town_role = roles_by_name.get("мирный житель")
-    cop_role = roles_by_name.get("комиссар")
-    doctor_role = roles_by_name.get("доктор")
-    maniac_role = roles_by_name.get("маньяк")
-    beauty_role = roles_by_name.get("красотка")
+def _compose_role_pool(players_count: int) -> list[Role]:
+    """Собрать набор ролей для build_default_role_pool() по справочнику ролей."""
+    mafia_role = registry.role("мафия")
+    don_role = registry.role("дон мафии")
+    town_role = registry.role("мирный житель")
+    cop_role = registry.role("комиссар")
+    doctor_role = registry.role("доктор")
+    maniac_role = registry.role("маньяк")
+    beauty_role = registry.role("красотка")
 
     pool: list[Role] = []
 
@@ -86,13 +97,24 @@ def assign_roles_sport(session, players):
         )
 
     # Ищем роли по названиям
-    try:
-        peaceful = Role.objects.get(name="Мирный житель")
-        cop = Role.objects.get(name="Комиссар")
-        mafia = Role.objects.get(name="Мафия")
-        don = Role.objects.get(name="Дон мафии")
-    except Role.DoesNotExist as e:
-        raise ValidationError(f"Не найдена одна из ролей для спортивной мафии: {e}")
+    peaceful = registry.role("Мирный житель")
+    cop = registry.role("Комиссар")
+    mafia = registry.role("Мафия")
+    don = registry.role("Дон мафии")
+    missing = [
+        name
+        for name, role in (
+            ("Мирный житель", peaceful),
+            ("Комиссар", cop),
+            ("Мафия", mafia),
+            ("Дон мафии", don),
+        )
+        if role is None
+    ]
+    if missing:
+        raise ValidationError(
+            f"Не найдена одна из ролей для спортивной мафии: {', '.join(missing)}"
+        )
 
     roles_pool = (
         [peaceful] * 6 +
@@ -129,7 +151,7 @@ def assign_roles_randomly(session, players):
     pool = build_default_role_pool(len(players))
     if not pool:
         # запасной вариант — просто крутим все роли
-        roles = list(Role.objects.all())
+        roles = registry.roles()
         if not roles:
             return
         random.shuffle(roles)
@@ -143,6 +165,82 @@ def assign_roles_randomly(session, players):
         player.save()
 
 
+# 2. Добавление игроков списком
+
+def split_player_names(raw: str) -> list[str]:
+    """Имена игроков из текста: через запятую или с новой строки."""
+    normalized = raw.replace("\n", ",")
+    return [name.strip() for name in normalized.split(",") if name.strip()]
+
+
+def select_new_player_names(names, existing_names, free_slots: int):
+    """
+    Отбор имён для добавления в партию (без запросов к БД).
+
+    Пропускаем имена, которые уже есть (без учёта регистра), в том числе
+    повторы внутри самого списка, и не выходим за free_slots.
+    Возвращает (added, skipped_existing, skipped_full).
+    """
+    seen = {player_name_key(name) for name in existing_names}
+    added: list[str] = []
+    skipped_existing: list[str] = []
+    skipped_full = False
+
+    for name in names:
+        if len(added) >= free_slots:
+            skipped_full = True
+            break
+
+        key = player_name_key(name)
+        if key in seen:
+            skipped_existing.append(name)
+            continue
+
+        seen.add(key)
+        added.append(name)
+
+    return added, skipped_existing, skipped_full
+
+
+def build_players(session_id: int, names: list[str]) -> list[Player]:
+    """Несохранённые объекты Player сессии (живые, без ролей) — для bulk_create."""
+    return [
+        Player(
+            session_id=session_id,
+            name=name,
+            # bulk_create не вызывает save(), ключ имени — здесь
+            name_key=player_name_key(name),
+            status=Player.PlayerStatus.ALIVE,
+        )
+        for name in names
+    ]
+
+
+@transaction.atomic
+def add_players_bulk(session_id: int, names: list[str]) -> list[Player]:
+    """
+    Создать игроков сессии одним INSERT (bulk_create) в одной транзакции.
+    Возвращает созданные объекты Player с заполненными pk.
+    """
+    return Player.objects.bulk_create(build_players(session_id, names))
+
+
+def record_session_change(session: Session, kind: str, **payload):
+    """
+    Записать правку партии в ленту SessionChange, чтобы её подхватил бот.
+    Для сессий без Telegram-чата ничего не пишем.
+    """
+    if session.tg_chat_id is None:
+        return None
+    return SessionChange.objects.create(
+        session_id=session.id,
+        tg_chat_id=session.tg_chat_id,
+        tg_table=session.tg_table,
+        kind=kind,
+        payload=payload,
+    )
+
+
 # Подсчёт живых и определение победителя
 def get_alive_players(session: Session):
     return Player.objects.filter(
@@ -226,6 +324,14 @@ def finish_game_if_needed(session: Session):
     )
     session.status = Session.Status.FINISHED
     session.save()
+    record_session_change(
+        session,
+        SessionChange.Kind.STATUS,
+        status=session.status,
+        winner_side=winner,
+        mafia_count=mafia_count,
+        town_count=town_count,
+    )
 
 # 4. Переход по фазам
 @transaction.atomic
@@ -235,7 +341,7 @@ def advance_phase(session: Session):
       - фазы берём из Phase.order,
       - на последней фазе круга проверяем победителя.
     """
-    phases = list(Phase.objects.order_by("order"))
+    phases = registry.phases()
     if not phases:
         return
 
@@ -243,6 +349,7 @@ def advance_phase(session: Session):
     if session.current_phase is None:
         session.current_phase = phases[0]
         session.save()
+        _record_phase(session)
         return
 
     # ищем индекс текущей фазы
@@ -251,6 +358,7 @@ def advance_phase(session: Session):
     except ValueError:
         session.current_phase = phases[0]
         session.save()
+        _record_phase(session)
         return
 
     is_last_phase = (idx == len(phases) - 1)
@@ -269,3 +377,13 @@ def advance_phase(session: Session):
         # просто идём к следующей фазе
         session.current_phase = phases[idx + 1]
         session.save()
+    _record_phase(session)
+
+
+def _record_phase(session: Session):
+    record_session_change(
+        session,
+        SessionChange.Kind.PHASE,
+        phase_id=session.current_phase_id,
+        round=session.current_round,
+    )
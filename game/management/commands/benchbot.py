@@ -0,0 +1,415 @@
+import asyncio
+import hashlib
+import json
+import random
+import sys
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.backends.signals import connection_created
+
+from game.bot.fake_api import FakeBotAPI
+from game.bot.flood import FloodGuard
+from game.bot.outbound import OutboundRateLimiter, TokenBucket
+from game.bot.state import deep_sizeof
+from game.bot.tables import DEFAULT_TABLE
+from game.management.commands.runbot import Command as BotCommand
+from game.models import Mode, Phase, Role
+from game.registry import registry
+
+from telegram import Update
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+User = get_user_model()
+
+NAMES = [
+    "Аня", "Боря", "Вера", "Гена", "Даша", "Егор", "Женя", "Зоя",
+    "Илья", "Катя", "Лёша", "Маша", "Нина", "Олег", "Петя", "Рита",
+]
+
+# лимиты Telegram в прогоне не нужны: меряем сам процесс бота
+UNLIMITED = 1e9
+
+
+class _QueryCounter:
+    """execute_wrapper: считает запросы к БД во всех потоках (в т.ч. sync_to_async)."""
+
+    WRITE_PREFIXES = ("INSERT", "UPDATE", "DELETE")
+
+    def __init__(self):
+        self.queries = 0
+        self.writes = 0
+
+    def attach(self, sender=None, connection=None, **kwargs):
+        connection.execute_wrappers.append(self)
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        if sql.lstrip()[:6].upper() in self.WRITE_PREFIXES:
+            self.writes += 1
+        return execute(sql, params, many, context)
+
+
+def _percentile(values: list, q: float) -> float:
+    """Перцентиль по ближайшему рангу (values отсортирован)."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный прогон бота без Telegram: тысячи чатов играют партии целиком "
+        "(startgame → addplayer → assign → ночь/день/голосование → итог) через "
+        "обработчики runbot. Работает на временной тестовой БД. "
+        "Сценарий партий воспроизводится по --seed (задержки от запуска к запуску, конечно, плавают)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--games", type=int, default=1000, help="Сколько партий сыграть.")
+        parser.add_argument(
+            "--tables", type=int, default=200,
+            help="Сколько партий (чатов) идёт одновременно.",
+        )
+        parser.add_argument("--seed", type=int, default=1, help="Зерно сценария.")
+        parser.add_argument("--min-players", type=int, default=6)
+        parser.add_argument("--max-players", type=int, default=12)
+        parser.add_argument(
+            "--sport-share", type=float, default=0.2,
+            help="Доля партий в спортивном режиме (10 игроков).",
+        )
+        parser.add_argument(
+            "--max-rounds", type=int, default=30,
+            help="После стольких кругов партия сбрасывается (/reset).",
+        )
+        parser.add_argument(
+            "--control-panel", action="store_true",
+            help="Режим панели (TG_BOT_CONTROL_PANEL): фазы правят одно сообщение.",
+        )
+        parser.add_argument(
+            "--join", action="store_true",
+            help="Игроки привязываются через /join и получают роли в личку.",
+        )
+        parser.add_argument("--json", help="Сохранить результаты в JSON-файл (для сравнения коммитов).")
+
+    # Тестовая БД
+
+    def _read_reference_data(self):
+        """Справочники из рабочей БД — прогон идёт на тех же ролях, фазах и режимах."""
+        host_id = getattr(settings, "TG_BOT_HOST_USER_ID", None)
+        return {
+            "roles": list(Role.objects.all()),
+            "phases": list(Phase.objects.all()),
+            "modes": list(Mode.objects.all()),
+            "host": User.objects.filter(id=host_id).first(),
+        }
+
+    def _load_reference_data(self, data):
+        Role.objects.bulk_create(data["roles"])
+        Phase.objects.bulk_create(data["phases"])
+        Mode.objects.bulk_create(data["modes"])
+        host = data["host"]
+        if host is not None:
+            User.objects.create(id=host.id, username=host.username)
+        # bulk_create не шлёт сигналы — сбрасываем кэш справочников сами
+        registry.invalidate()
+        registry.invalidate_users()
+
+    def handle(self, *args, **options):
+        reference = self._read_reference_data()
+        if not (reference["roles"] and reference["phases"] and reference["modes"]):
+            self.stderr.write(
+                self.style.ERROR(
+                    "В БД нет ролей, фаз или режимов — прогону не на чем играть."
+                )
+            )
+            return
+
+        counter = _QueryCounter()
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self._load_reference_data(reference)
+            counter.attach(connection=connection)
+            connection_created.connect(counter.attach)
+            report = asyncio.run(self._run(options, counter))
+        finally:
+            connection_created.disconnect(counter.attach)
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self._print_report(report)
+        if options.get("json"):
+            with open(options["json"], "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+
+    # Сценарий партии
+
+    def _update(self, chat_id: int, text: str = None, data: str = None, user: int = 7) -> dict:
+        self._update_id += 1
+        message = {
+            "message_id": self._update_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "group"},
+            "from": {"id": user, "is_bot": False, "first_name": "Ведущий"},
+        }
+        if data:
+            message["from"] = FakeBotAPI.BOT_USER
+            message["text"] = "Кнопки"
+            return {
+                "update_id": self._update_id,
+                "callback_query": {
+                    "id": str(self._update_id),
+                    "from": {"id": 7, "is_bot": False, "first_name": "Ведущий"},
+                    "chat_instance": str(chat_id),
+                    "data": data,
+                    "message": message,
+                },
+            }
+
+        message["text"] = text
+        if text.startswith("/"):
+            command = text.split()[0]
+            message["entities"] = [
+                {"type": "bot_command", "offset": 0, "length": len(command)}
+            ]
+        return {"update_id": self._update_id, "message": message}
+
+    def _command(self, chat_id, text):
+        return text.split()[0], self._update(chat_id, text)
+
+    def _choice(self, chat_id, kind, target, rng):
+        """Ночной выбор / исключение: командой с именем или кнопкой."""
+        idx, player = target
+        if rng.random() < 0.5:
+            return self._command(chat_id, f"/{kind} {player.name}")
+        return f"{kind}:button", self._update(chat_id, data=f"{kind}:{DEFAULT_TABLE}:{idx}")
+
+    def _game_script(self, chat_id: int, rng: random.Random, options):
+        """
+        Партия одного чата: генератор апдейтов (метка, dict апдейта).
+        Следующий ход выбирается по состоянию игры после предыдущего апдейта.
+        """
+        bot = self.runbot
+        sport = rng.random() < options["sport_share"]
+        planned = 10 if sport else rng.randint(options["min_players"], options["max_players"])
+
+        yield self._command(chat_id, f"/startgame {planned} {'sport' if sport else 'classic'}")
+        yield self._command(chat_id, "/addplayer")
+
+        names = [f"{rng.choice(NAMES)} {i + 1}" for i in range(planned)]
+        parts = rng.randint(1, 3)
+        for start in range(parts):
+            chunk = names[start::parts]
+            yield "text", self._update(chat_id, "\n".join(chunk))
+
+        if options["join"]:
+            for name in names:
+                self._user_id += 1
+                yield "/join", self._update(chat_id, f"/join {name}", user=self._user_id)
+                # место привязывается после подтверждения ведущего
+                seat = bot.games[chat_id, DEFAULT_TABLE].find_player(name).seat
+                yield "join:button", self._update(
+                    chat_id, data=f"join:{DEFAULT_TABLE}:{seat}:{self._user_id}"
+                )
+
+        yield self._command(chat_id, "/assign random")
+        yield self._command(chat_id, "/next")
+
+        lynched_round = None
+        while True:
+            game = bot.games.get((chat_id, DEFAULT_TABLE))
+            if not game or game.phase in (None, bot.PHASE_FINISHED):
+                return
+
+            alive = [(p.seat, p) for p in game.alive_players()]
+            roles = {p.role for _, p in alive}
+
+            if game.phase == bot.PHASE_NIGHT:
+                targets = [
+                    (i, p) for i, p in alive
+                    if p.role not in (bot.ROLE_MAFIA, bot.ROLE_DON)
+                ]
+                if targets:
+                    yield self._choice(chat_id, "kill", rng.choice(targets), rng)
+                if bot.ROLE_DOCTOR in roles and not sport:
+                    yield self._choice(chat_id, "heal", rng.choice(alive), rng)
+                if bot.ROLE_DETECTIVE in roles:
+                    yield self._choice(chat_id, "check", rng.choice(alive), rng)
+                yield self._command(chat_id, "/next")
+
+            elif game.phase == bot.PHASE_DAY:
+                yield self._command(chat_id, "/next")
+
+            elif game.phase == bot.PHASE_VOTE:
+                if lynched_round == game.round:
+                    yield self._command(chat_id, "/next")
+                elif game.round > options["max_rounds"]:
+                    yield self._command(chat_id, "/reset")
+                    return
+                else:
+                    lynched_round = game.round
+                    yield self._choice(chat_id, "lynch", rng.choice(alive), rng)
+
+    # Прогон
+
+    async def _run(self, options, counter) -> dict:
+        seed = options["seed"]
+        # роли раздаются через модуль random — фиксируем и его
+        random.seed(seed)
+        rng = random.Random(seed)
+        self._update_id = 0
+        self._user_id = 1000
+
+        api = FakeBotAPI(record=False)
+        self.runbot = BotCommand(stdout=self.stdout, stderr=self.stderr)
+        if options["control_panel"]:
+            self.runbot.control_panel = True
+        # лимиты Telegram не меряем — рассылке ролей тоже без ограничения
+        self.runbot.roles_dm.bucket = TokenBucket(UNLIMITED, UNLIMITED)
+        # сценарий шлёт апдейты без пауз — входящие лимиты его бы обрезали
+        self.runbot.flood = FloodGuard(chat_rate=0, user_rate=0, debounce=0)
+        self.api = api
+        app = self.runbot.build_application(
+            "0:bench",
+            request=api,
+            rate_limiter=OutboundRateLimiter(
+                global_rate=UNLIMITED,
+                chat_rate=UNLIMITED,
+                group_rate=UNLIMITED,
+                chat_burst=UNLIMITED,
+            ),
+        )
+        await app.initialize()
+        await self.runbot._post_init(app)
+
+        games = options["games"]
+        started = 0
+        latencies: dict[str, list[float]] = {}
+        outcomes = []
+
+        def new_table():
+            nonlocal started
+            chat_id = -(10 ** 12) - started
+            started += 1
+            # у каждой партии своё зерно: порядок столов на сценарий не влияет
+            script = self._game_script(chat_id, random.Random(rng.random()), options)
+            return chat_id, script
+
+        active = [new_table() for _ in range(min(options["tables"], games))]
+        began = time.perf_counter()
+        while active:
+            still_active = []
+            for chat_id, script in active:
+                item = next(script, None)
+                if item is None:
+                    game = self.runbot.games.get((chat_id, DEFAULT_TABLE))
+                    outcomes.append(
+                        (chat_id, game.winner_side, game.round) if game else (chat_id, None, None)
+                    )
+                    if started < games:
+                        still_active.append(new_table())
+                    continue
+
+                label, data = item
+                update = Update.de_json(data, app.bot)
+                handler_began = time.perf_counter()
+                await app.process_update(update)
+                latencies.setdefault(label, []).append(time.perf_counter() - handler_began)
+                still_active.append((chat_id, script))
+            active = still_active
+        wall = time.perf_counter() - began
+
+        # завершённые партии остаются в памяти бота — меряем их
+        sizes = [deep_sizeof(game) for game in self.runbot.games.values()]
+
+        await self.runbot._post_stop(app)
+        await app.shutdown()
+        await self.runbot._post_shutdown(app)
+
+        return self._build_report(options, latencies, outcomes, sizes, wall, counter)
+
+    def _build_report(self, options, latencies, outcomes, sizes, wall, counter) -> dict:
+        games = len(outcomes) or 1
+        everything = sorted(v for values in latencies.values() for v in values)
+        digest = hashlib.sha1(json.dumps(outcomes).encode()).hexdigest()[:12]
+
+        def stats(values):
+            values = sorted(values)
+            return {
+                "count": len(values),
+                "p50_ms": round(_percentile(values, 0.50) * 1000, 3),
+                "p99_ms": round(_percentile(values, 0.99) * 1000, 3),
+                "max_ms": round((values[-1] if values else 0) * 1000, 3),
+            }
+
+        peak_rss_mb = None
+        if resource is not None:
+            # ru_maxrss: Linux — КБ, macOS — байты
+            scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+            peak_rss_mb = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)
+
+        outbound = self.runbot.outbound
+        return {
+            "seed": options["seed"],
+            "games": len(outcomes),
+            "tables": options["tables"],
+            "finished": sum(1 for _, winner, _ in outcomes if winner),
+            "scenario_digest": digest,
+            "updates": len(everything),
+            "wall_seconds": round(wall, 3),
+            "updates_per_second": round(len(everything) / wall, 1) if wall else None,
+            "latency": stats(everything),
+            "latency_by_handler": {label: stats(v) for label, v in sorted(latencies.items())},
+            "db_writes_per_game": round(counter.writes / games, 2),
+            "db_queries_per_game": round(counter.queries / games, 2),
+            "db_flushes": self.runbot.writer.flushes,
+            "db_handoffs_per_update": (
+                round(self.runbot.db.handoffs / len(everything), 3) if everything else 0
+            ),
+            "memory_per_game_bytes": round(sum(sizes) / len(sizes)) if sizes else 0,
+            "peak_rss_mb": peak_rss_mb,
+            "messages_sent": outbound.sent,
+            "messages_merged": outbound.merged,
+            "messages_edited": outbound.edited,
+            "roles_dm_sent": self.runbot.roles_dm.sent,
+            "roles_dm_failed": self.runbot.roles_dm.failed,
+            "api_calls_per_game": round(
+                sum(n for method, n in self.api.counts.items() if method != "getMe") / games, 2
+            ),
+        }
+
+    def _print_report(self, r: dict):
+        out = self.stdout.write
+        out(self.style.SUCCESS(
+            f"Партий: {r['games']} (до победы: {r['finished']}), "
+            f"одновременно: {r['tables']}, seed: {r['seed']}, сценарий: {r['scenario_digest']}"
+        ))
+        out(
+            f"Апдейтов: {r['updates']} за {r['wall_seconds']} с "
+            f"({r['updates_per_second']} в секунду)"
+        )
+        lat = r["latency"]
+        out(f"Задержка обработчика, мс: p50 {lat['p50_ms']}, p99 {lat['p99_ms']}, max {lat['max_ms']}")
+        for label, s in r["latency_by_handler"].items():
+            out(f"  {label:<14} {s['count']:>8}  p50 {s['p50_ms']:>8}  p99 {s['p99_ms']:>8}")
+        out(
+            f"БД на партию: записей {r['db_writes_per_game']}, "
+            f"запросов всего {r['db_queries_per_game']} (сбросов очереди: {r['db_flushes']})"
+        )
+        out(f"Передач работы с БД в поток на апдейт: {r['db_handoffs_per_update']}")
+        rss = f", пиковый RSS: {r['peak_rss_mb']} МБ" if r["peak_rss_mb"] is not None else ""
+        out(f"Память на партию: {r['memory_per_game_bytes']} байт{rss}")
+        out(
+            f"Сообщений бота: {r['messages_sent']} (склеено: {r['messages_merged']}), "
+            f"правок: {r['messages_edited']}, вызовов Bot API на партию: {r['api_calls_per_game']}"
+        )
+        if r["roles_dm_sent"] or r["roles_dm_failed"]:
+            out(f"Ролей в личку: {r['roles_dm_sent']} (не доставлено: {r['roles_dm_failed']})")
@@ -1,14 +1,55 @@
+import asyncio
+import contextvars
 import random
+import re
+import secrets
+import signal
+import time
+from datetime import timedelta
+from functools import partial
 
 from django.core.management.base import BaseCommand
 from django.conf import settings
 
-from asgiref.sync import sync_to_async
-from django.contrib.auth import get_user_model
+from django.db.models import Max
+from django.db.models.functions import Coalesce, Mod
 from django.utils import timezone
-from game.models import Session, Player, Mode, Phase, Result, Role
+from game.models import Session, Player, Result, GameEvent, PhaseTimer, SessionChange
+from game.registry import registry
+from game.logic import build_players, select_new_player_names, split_player_names
+from game.bot.changes import ChangeCursor, TableChanges
+from game.bot.database import DatabaseExecutor
+from game.bot.delivery import RoleDelivery, RoleMessage
+from game.bot.eviction import IdleGamePolicy
+from game.bot.fake_api import FakeBotAPI
+from game.bot.flood import FloodGuard
+from game.bot.memprof import MemoryProfiler, game_sizes
+from game.bot.metrics import BotMetrics
+from game.bot.outbound import OutboundRateLimiter, OutboundScheduler
+from game.bot.panel import ControlPanel
+from game.bot.processing import ChatOrderedUpdateProcessor
+from game.bot.reconcile import ReconcileStats, chunked, diff_rows
+from game.bot.sharding import run_sharded, shard_for
+from game.bot.tables import DEFAULT_TABLE, TableMap
+from game.bot.state import (
+    GameState,
+    ROLE_BY_NAME,
+    ROLE_DETECTIVE,
+    ROLE_DOCTOR,
+    ROLE_DON,
+    ROLE_MAFIA,
+    ROLE_NAMES,
+    ROLE_NONE,
+    ROLE_TOWN,
+)
+from game.bot.timers import TimerEntry, TimerWheel
+from game.bot.webhook import WebhookServer, register_webhook, replay_updates
+from game.bot.writer import WriteBehindQueue
 
 from telegram import (
+    Chat,
+    Message,
+    MessageEntity,
     Update,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
@@ -16,15 +57,15 @@ from telegram import (
 )
 from telegram.ext import (
     ApplicationBuilder,
+    ApplicationHandlerStop,
     CommandHandler,
     ContextTypes,
     CallbackQueryHandler,
     MessageHandler,
+    TypeHandler,
     filters,
 )
 
-User = get_user_model()
-
 
 class Command(BaseCommand):
     """
@@ -32,7 +73,7 @@ class Command(BaseCommand):
 
     Телеграм-бот для ведущего мафии.
     Логика:
-      - в памяти (self.games) — текущее состояние партий по чатам,
+      - в памяти (self.games) — текущее состояние партий по (чат, стол),
       - в БД (Session / Player) — чтобы сессии и игроки были видны на сайте.
     """
 
@@ -44,22 +85,174 @@ class Command(BaseCommand):
     PHASE_VOTE = "vote"
     PHASE_FINISHED = "finished"
 
-    # Роли
-    ROLE_MAFIA = "mafia"
-    ROLE_DON = "don"
-    ROLE_TOWN = "town"
-    ROLE_DETECTIVE = "detective"
-    ROLE_DOCTOR = "doctor"
+    # Роли (целые коды, см. game/bot/state.py)
+    ROLE_MAFIA = ROLE_MAFIA
+    ROLE_DON = ROLE_DON
+    ROLE_TOWN = ROLE_TOWN
+    ROLE_DETECTIVE = ROLE_DETECTIVE
+    ROLE_DOCTOR = ROLE_DOCTOR
+
+    # соответствие внутренних кодов ролей -> названиям в таблице Role
+    ROLE_DB_NAMES = {
+        ROLE_TOWN: "Мирный житель",
+        ROLE_MAFIA: "Мафия",
+        ROLE_DON: "Дон мафии",
+        ROLE_DETECTIVE: "Комиссар",
+        ROLE_DOCTOR: "Доктор",
+    }
 
     # Режимы игры
     GAME_MODE_CLASSIC = "classic"
     GAME_MODE_SPORT = "sport"
 
+    # Клавиатуры ведущего по состоянию партии (см. _keyboard_state)
+    KEYBOARD_LAYOUTS = {
+        "idle": [
+            ["/start", "/help"],
+            ["/startgame 10"],
+        ],
+        "adding": [
+            ["/addplayer"],
+            ["/players", "/help"],
+            ["/reset"],
+        ],
+        "assign": [
+            ["/assign random", "/assign cards"],
+            ["/players"],
+            ["/help", "/reset"],
+        ],
+        "night_sport": [
+            ["/players", "/next"],
+            ["/check", "/kill"],
+            ["/help", "/reset"],
+        ],
+        "night_classic": [
+            ["/players", "/next"],
+            ["/check", "/kill", "/heal"],
+            ["/help", "/reset"],
+        ],
+        "day": [
+            ["/players", "/next"],
+            ["/help", "/reset"],
+        ],
+        "vote": [
+            ["/players", "/next"],
+            ["/lynch"],
+            ["/help", "/reset"],
+        ],
+        "fallback": [
+            ["/players", "/next"],
+            ["/check", "/kill"],
+            ["/help", "/reset"],
+        ],
+        # режим панели: одна клавиатура на всю игру, чтобы не слать её с каждой фазой
+        "panel": [
+            ["/players", "/next"],
+            ["/check", "/kill", "/heal"],
+            ["/lynch"],
+            ["/help", "/reset"],
+        ],
+    }
+    # собираются один раз на процесс и переиспользуются во всех чатах
+    KEYBOARDS = {
+        key: ReplyKeyboardMarkup(layout, resize_keyboard=True)
+        for key, layout in KEYBOARD_LAYOUTS.items()
+    }
+    _KEYBOARD_KEYS = {id(markup): key for key, markup in KEYBOARDS.items()}
+
     MAX_PLAYERS = 20
 
+    # Через сколько событий журнала партии сохранять снимок состояния
+    SNAPSHOT_EVERY = 50
+
+    # Явный номер стола в аргументах команды: /kill #2 Имя
+    TABLE_ARG = re.compile(r"^#(\d{1,3})$")
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.games: dict[int, dict] = {}
+        # партии по (chat_id, стол) с индексом «чат -> столы»
+        self.games = TableMap()
+        # chat_id -> {user_id: стол}, выбранный пользователем через /table
+        self._user_tables: dict[int, dict[int, int]] = {}
+        # чаты, для которых уже искали незавершённые партии в БД
+        self._restored_chats: set[int] = set()
+        # какая клавиатура ведущего последней отправлена в чат
+        self._last_keyboard: dict[int, str] = {}
+        # запросы к БД: async-API ORM и пул потоков для многошаговых операций
+        self.db = DatabaseExecutor(threads=getattr(settings, "TG_BOT_DB_THREADS", 0))
+        # отложенная запись изменений партий в БД
+        self.writer = WriteBehindQueue(
+            executor=self.db,
+            flush_interval=getattr(settings, "TG_BOT_DB_FLUSH_INTERVAL", 0.5),
+            batch_size=getattr(settings, "TG_BOT_DB_BATCH_SIZE", 100),
+            max_pending=getattr(settings, "TG_BOT_DB_MAX_PENDING", 1000),
+            on_error=self._db_warning,
+        )
+        # метрики обработчиков (/stats и периодический лог)
+        self.metrics = BotMetrics()
+        self._stats_task: asyncio.Task | None = None
+        # апдейты разных чатов — параллельно, одного чата — по очереди
+        self.update_processor = ChatOrderedUpdateProcessor(
+            max_in_flight=getattr(settings, "TG_BOT_MAX_IN_FLIGHT", 64),
+            max_queued=getattr(settings, "TG_BOT_MAX_QUEUED_UPDATES", 4096),
+        )
+        # исходящие сообщения: очередь по чатам со склейкой текстов
+        self.outbound = OutboundScheduler(
+            merge_delay=getattr(settings, "TG_BOT_OUTBOUND_MERGE_DELAY", 0.05),
+            on_error=self._bot_warning,
+        )
+        # роли игрокам в личку (/join) — отдельной неспешной очередью
+        self.roles_dm = RoleDelivery(
+            self.outbound,
+            rate=getattr(settings, "TG_BOT_ROLE_DM_RATE", 10),
+            max_attempts=getattr(settings, "TG_BOT_ROLE_DM_ATTEMPTS", 3),
+            on_status=self._role_dm_status,
+        )
+        # user_id -> роли, которые не удалось доставить (уйдут после /start в личке)
+        self._failed_dms: dict[int, list[RoleMessage]] = {}
+        # режим панели: одно закреплённое сообщение партии, которое правится
+        self.control_panel = getattr(settings, "TG_BOT_CONTROL_PANEL", False)
+        self._panels: dict[tuple[int, int], ControlPanel] = {}
+        # таймеры дня всех чатов — одно общее колесо (game/bot/timers.py)
+        self.timers = TimerWheel(
+            self._on_timer, resolution=getattr(settings, "TG_BOT_TIMER_RESOLUTION", 1.0)
+        )
+        self._app = None
+        # шард этого процесса (index, shards): таймеры заводим только своим чатам
+        self.shard = (0, 1)
+        # мелкие фоновые задачи (закрепление панели и т.п.)
+        self._background: set[asyncio.Task] = set()
+        # выгрузка молчащих партий из памяти (снимок остаётся в журнале)
+        self.eviction = IdleGamePolicy(
+            ttl=getattr(settings, "TG_BOT_GAME_IDLE_TTL", 6 * 60 * 60),
+            memory_budget=getattr(settings, "TG_BOT_GAMES_MEMORY_BUDGET", 64 * 1024 * 1024),
+        )
+        self._eviction_task: asyncio.Task | None = None
+        # лента правок партий с сайта (SessionChange) и её курсор
+        self.changes = ChangeCursor()
+        self._changes_task: asyncio.Task | None = None
+        self.web_edits = 0
+        # сверка партий в памяти с Session / Player в БД
+        self.reconcile_stats = ReconcileStats()
+        self._reconcile_task: asyncio.Task | None = None
+        # лимиты входящих команд и нажатий кнопок (на чат и на пользователя)
+        self.flood = FloodGuard(
+            chat_rate=getattr(settings, "TG_BOT_FLOOD_CHAT_RATE", 2),
+            chat_burst=getattr(settings, "TG_BOT_FLOOD_CHAT_BURST", 30),
+            user_rate=getattr(settings, "TG_BOT_FLOOD_USER_RATE", 1),
+            user_burst=getattr(settings, "TG_BOT_FLOOD_USER_BURST", 15),
+            debounce=getattr(settings, "TG_BOT_BUTTON_DEBOUNCE", 1.0),
+        )
+        # профилировщик памяти (tracemalloc): TG_BOT_MEMPROF, /memprof, SIGUSR2
+        self.memprof = MemoryProfiler(
+            frames=getattr(settings, "TG_BOT_MEMPROF_FRAMES", 1),
+            top=getattr(settings, "TG_BOT_MEMPROF_TOP", 10),
+        )
+        self._memprof_task: asyncio.Task | None = None
+        # приём апдейтов через webhook (runbot --webhook), иначе None
+        self.webhook: WebhookServer | None = None
+        self.evicted = 0
+        self.cancelled_sessions = 0
 
     # Вспомогательные методы
 
@@ -69,12 +262,939 @@ class Command(BaseCommand):
             return update.effective_chat.id
         return None
 
-    def _get_game(self, update: Update):
-        """Возвращаем состояние игры для текущего чата (или None)."""
+    def _table_of(self, update: Update) -> int:
+        """
+        Стол, к которому относится апдейт:
+        1) явно — в данных кнопки (kill:<стол>:<игрок>) или аргументом #N команды;
+        2) стол, выбранный этим пользователем в чате через /table;
+        3) единственный стол чата;
+        4) иначе — стол по умолчанию.
+        """
+        query = update.callback_query
+        if query is not None and query.data:
+            parts = query.data.split(":")
+            if len(parts) >= 3 and parts[1].isdigit():
+                return int(parts[1])
+
+        message = update.effective_message
+        text = message.text if message is not None else None
+        if text and text.startswith("/"):
+            for arg in text.split()[1:]:
+                match = self.TABLE_ARG.match(arg)
+                if match:
+                    return int(match.group(1))
+
+        chat_id = self._get_chat_id(update)
+        user = update.effective_user
+        if user is not None:
+            table = self._user_tables.get(chat_id, {}).get(user.id)
+            if table is not None:
+                return table
+
+        tables = self.games.tables(chat_id)
+        if len(tables) == 1:
+            return next(iter(tables))
+        return DEFAULT_TABLE
+
+    def _game_key(self, update: Update):
+        """Ключ партии апдейта в self.games: (chat_id, стол) или None."""
         chat_id = self._get_chat_id(update)
         if chat_id is None:
             return None
-        return self.games.get(chat_id)
+        return chat_id, self._table_of(update)
+
+    def _args(self, context) -> list[str]:
+        """Аргументы команды без номера стола (#N)."""
+        return [arg for arg in context.args or () if not self.TABLE_ARG.match(arg)]
+
+    def _get_game(self, update: Update):
+        """Возвращаем состояние игры для текущего стола чата (или None)."""
+        key = self._game_key(update)
+        if key is None:
+            return None
+        return self.games.get(key)
+
+    def _new_game(self, planned: int, game_mode: str, db_session_id=None) -> GameState:
+        """Начальное состояние партии в памяти."""
+        return GameState(planned, game_mode, db_session_id)
+
+    # Журнал событий партии (GameEvent)
+
+    def _finished_event(self, game: GameState):
+        """Событие окончания партии с итогами из game."""
+        return (
+            GameEvent.Kind.FINISHED,
+            {
+                "winner_side": game.winner_side,
+                "mafia_alive": game.mafia_alive,
+                "town_alive": game.town_alive,
+            },
+        )
+
+    async def _record_events(self, game: GameState, events: list, snapshot: bool = False):
+        """
+        Дописать события [(kind, payload), ...] в журнал партии.
+
+        События уходят в очередь отложенной записи и пишутся пачкой
+        (bulk_create) вместе с остальными изменениями. Каждые SNAPSHOT_EVERY
+        событий (или при snapshot=True) следом пишется снимок состояния,
+        чтобы восстановление не проигрывало журнал с самого начала.
+        """
+        session_id = game.db_session_id
+        if not session_id:
+            return
+
+        seq = game.event_seq
+        objs = []
+        for kind, payload in events:
+            seq += 1
+            objs.append(
+                GameEvent(session_id=session_id, seq=seq, kind=kind, payload=payload)
+            )
+
+        if snapshot or seq - game.snapshot_seq >= self.SNAPSHOT_EVERY:
+            seq += 1
+            game.snapshot_seq = seq
+            game.event_seq = seq
+            objs.append(
+                GameEvent(
+                    session_id=session_id,
+                    seq=seq,
+                    kind=GameEvent.Kind.SNAPSHOT,
+                    payload=game.to_dict(),
+                )
+            )
+        game.event_seq = seq
+
+        await self.writer.insert(objs)
+
+    # Правки партий с сайта (SessionChange)
+
+    def _apply_web_edit(self, game: GameState, payload: dict):
+        """
+        Применить правку с сайта (событие WEB_EDIT) к партии.
+        None — сессию удалили на сайте, партии больше нет.
+        """
+        kind = payload["kind"]
+        if kind == SessionChange.Kind.STATUS:
+            if payload["status"] != Session.Status.FINISHED:
+                return None
+            game.phase = self.PHASE_FINISHED
+            game.winner_side = payload.get("winner_side")
+            game.mafia_alive = payload.get("mafia_count", 0)
+            game.town_alive = payload.get("town_count", 0)
+
+        elif kind == SessionChange.Kind.PLAYER_STATUS:
+            player = next(
+                (p for p in game.players if p.db_id == payload["player_id"]), None
+            ) or self._find_player(game, payload["name"])
+            if player is not None:
+                if payload["alive"]:
+                    game.revive(player)
+                else:
+                    game.kill(player)
+
+        elif kind == SessionChange.Kind.PLAYERS_ADDED:
+            for name, db_id in zip(payload["names"], payload["ids"]):
+                if self._find_player(game, name) is None:
+                    game.add_player(name, db_id=db_id)
+
+        elif kind == SessionChange.Kind.PHASE:
+            phase = self._phase_code(payload["phase_id"])
+            if phase != game.phase:
+                # ночные выборы относятся к прошлой фазе
+                game.pending_kill = game.pending_heal = game.pending_check = None
+            game.phase = phase
+            game.round = payload["round"]
+
+        game.web_change = payload["change"]
+        return game
+
+    def _web_edit_text(self, game, payload: dict) -> str:
+        """Строка о правке с сайта для сообщения в чат."""
+        kind = payload["kind"]
+        if kind == SessionChange.Kind.PLAYER_STATUS:
+            state = "снова в игре" if payload["alive"] else "выбывает"
+            return f"{payload['name']} {state}"
+        if kind == SessionChange.Kind.PLAYERS_ADDED:
+            return "добавлены игроки: " + ", ".join(payload["names"])
+        if kind == SessionChange.Kind.PHASE:
+            return self._phase_headline(game)
+        if game is None:
+            return "партия удалена на сайте"
+        return "игра завершена"
+
+    async def _apply_web_changes(self, bot, key, changes: list) -> int:
+        """
+        Применить правки с сайта к партии стола key и записать их в журнал.
+
+        Правки других сессий (стол уже ведёт новую партию) и уже
+        применённые (id <= game.web_change) пропускаются. В чат уходит
+        одно сообщение со всеми правками.
+        """
+        game = self.games.get(key)
+        if game is None:
+            return 0
+
+        events = []
+        lines = []
+        current = game
+        for change in changes:
+            if change["session_id"] != game.db_session_id or change["id"] <= game.web_change:
+                continue
+            payload = {"change": change["id"], "kind": change["kind"], **change["payload"]}
+            current = self._apply_web_edit(game, payload)
+            events.append((GameEvent.Kind.WEB_EDIT, payload))
+            lines.append(self._web_edit_text(current, payload))
+            if current is None:
+                break
+        if not events:
+            return 0
+
+        self.web_edits += len(events)
+        if current is not None:
+            # удалённой сессии журнал уже не нужен (и писать его некуда)
+            await self._record_events(game, events)
+        chat_id, table = key
+        update = self._host_update(bot, chat_id, table)
+        # фаза поменялась без бота — таймер дня больше не к месту
+        if current is None or any(
+            payload["kind"] != SessionChange.Kind.PLAYER_STATUS for _, payload in events
+        ):
+            await self._cancel_timer(chat_id, table)
+
+        await self._reply(
+            update,
+            "✏️ Ведущий изменил партию на сайте:\n" + "\n".join(f"• {line}" for line in lines),
+            quote=False,
+            reply_markup=self._control_keyboard(current),
+        )
+        if current is None:
+            del self.games[key]
+            self._panels.pop(key, None)
+        else:
+            await self._refresh_panel(update, current, headline=self._phase_headline(current))
+        return len(events)
+
+    async def _changes_received(self, update: TableChanges, context: ContextTypes.DEFAULT_TYPE):
+        await self._apply_web_changes(context.bot, update.key, update.changes)
+
+    def _last_change_id(self) -> int:
+        return SessionChange.objects.aggregate(last=Max("id"))["last"] or 0
+
+    @staticmethod
+    def _fetch_changes(position: int, missing: list[int], limit: int) -> list[dict]:
+        """Порция ленты: строки после курсора и пропуски, которые ещё ждём."""
+        changes = SessionChange.objects.filter(id__gt=position)
+        if missing:
+            changes = changes | SessionChange.objects.filter(id__in=missing)
+        return list(
+            changes.order_by("id").values(
+                "id", "session_id", "tg_chat_id", "tg_table", "kind", "payload"
+            )[:limit]
+        )
+
+    async def _poll_changes(self) -> int:
+        """
+        Прочитать ленту правок с сайта от курсора и раздать правки
+        в очереди чатов. Правки партий, которых нет в памяти, пропускаются:
+        партия догонит их сама, когда поднимется из БД.
+        """
+        limit = getattr(settings, "TG_BOT_CHANGE_FEED_BATCH", 500)
+        total = 0
+        while True:
+            changes = await self.db.run(
+                self._fetch_changes, self.changes.position, self.changes.missing(), limit
+            )
+            self.changes.advance(change["id"] for change in changes)
+            total += len(changes)
+
+            by_table: dict[tuple[int, int], list] = {}
+            for change in changes:
+                key = (change["tg_chat_id"], change["tg_table"])
+                if key in self.games:
+                    by_table.setdefault(key, []).append(change)
+
+            queue = self._app.update_queue
+            for key, table_changes in by_table.items():
+                item = TableChanges(key, table_changes)
+                try:
+                    queue.put_nowait(item)
+                except asyncio.QueueFull:
+                    self._spawn(queue.put(item))
+
+            if len(changes) < limit:
+                return total
+
+    async def _poll_changes_forever(self, interval: float):
+        """Раз в interval секунд читаем ленту правок с сайта."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self._poll_changes()
+            except Exception as e:
+                self._db_warning(f"Не удалось прочитать правки с сайта: {e}")
+
+    @staticmethod
+    def _session_changes(session_ids: list[int], after: int) -> list[dict]:
+        return list(
+            SessionChange.objects
+            .filter(session_id__in=session_ids, id__gt=after)
+            .order_by("id")
+            .values("id", "session_id", "tg_chat_id", "tg_table", "kind", "payload")
+        )
+
+    async def _catch_up_changes(self, bot, chat_id: int):
+        """Догнать ленту правок для партий чата, только что поднятых из БД."""
+        games = {
+            game.db_session_id: (chat_id, table)
+            for table, game in self.games.tables(chat_id).items()
+            if game.db_session_id
+        }
+        if not games:
+            return
+        after = min(self.games[key].web_change for key in games.values())
+        try:
+            changes = await self.db.run(self._session_changes, list(games), after)
+        except Exception as e:
+            self._db_warning(f"Не удалось прочитать правки с сайта: {e}")
+            return
+
+        by_session: dict[int, list] = {}
+        for change in changes:
+            by_session.setdefault(change["session_id"], []).append(change)
+        for session_id, session_changes in by_session.items():
+            await self._apply_web_changes(bot, games[session_id], session_changes)
+
+    async def _prune_changes(self, retention: float) -> int:
+        """Удалить старые строки ленты: все партии, которым они нужны, давно их применили."""
+        cutoff = timezone.now() - timedelta(seconds=retention)
+        deleted, _ = await self.db.query(
+            SessionChange.objects.filter(created_at__lt=cutoff).adelete()
+        )
+        return deleted
+
+    # Сверка партий в памяти с БД
+
+    def _expected_session_row(self, game: GameState) -> dict:
+        """Какой должна быть строка Session партии по её состоянию в памяти."""
+        if game.phase == self.PHASE_FINISHED:
+            return {"status": Session.Status.FINISHED, "current_round": game.round}
+        if game.phase:
+            return {
+                "status": Session.Status.ACTIVE,
+                "current_round": game.round,
+                "current_phase_id": self._phase_id_for_code(game.phase),
+            }
+        return {"status": Session.Status.ACTIVE if game.roles_mode else Session.Status.PLANNED}
+
+    def _expected_player_row(self, game: GameState, player) -> dict:
+        """Какой должна быть строка Player игрока (сверяемые поля)."""
+        row = {
+            "status": (
+                Player.PlayerStatus.ALIVE if game.is_alive(player) else Player.PlayerStatus.DEAD
+            ),
+            "tg_user_id": player.tg_user_id,
+        }
+        if game.roles_mode == "random" and game.roles_assigned:
+            role = registry.role(self.ROLE_DB_NAMES.get(player.role, ""))
+            if role is not None:
+                row["role_id"] = role.id
+        return row
+
+    def _new_player_row(self, game: GameState, player) -> Player:
+        """Несохранённая строка Player для игрока, которого нет в БД."""
+        obj = build_players(game.db_session_id, [player.name])[0]
+        for field, value in self._expected_player_row(game, player).items():
+            setattr(obj, field, value)
+        if obj.status == Player.PlayerStatus.DEAD:
+            obj.fail_round = game.round
+            obj.fail_phase_id = self._phase_id_for_code(game.phase)
+        return obj
+
+    def _read_reconcile_rows(self, session_ids: list[int]) -> dict:
+        """
+        Строки БД для сверки партий session_ids (синхронно): по одному
+        запросу к Session, Player, Result и ленте правок на каждые
+        TG_BOT_RECONCILE_BATCH сессий.
+        """
+        batch = getattr(settings, "TG_BOT_RECONCILE_BATCH", 500)
+        rows = {"sessions": {}, "players": {}, "results": set(), "changes": {}, "statements": 0}
+        for ids in chunked(session_ids, batch):
+            for row in Session.objects.filter(id__in=ids).values(
+                "id", "status", "current_round", "current_phase_id"
+            ):
+                rows["sessions"][row.pop("id")] = row
+            for row in Player.objects.filter(session_id__in=ids).values(
+                "id", "session_id", "name", "status", "role_id", "tg_user_id"
+            ):
+                rows["players"][row.pop("id")] = row
+            rows["results"].update(
+                Result.objects.filter(session_id__in=ids).values_list("session_id", flat=True)
+            )
+            rows["changes"].update(
+                SessionChange.objects.filter(session_id__in=ids)
+                .values("session_id").annotate(last=Max("id"))
+                .values_list("session_id", "last")
+            )
+            rows["statements"] += 4
+        return rows
+
+    @staticmethod
+    def _repair_rows(sessions: dict, players: dict, new_players: list, results: list):
+        """
+        Исправить расхождения одной пачкой UPDATE/INSERT на каждый набор полей.
+        sessions / players — {id: {поле: значение}} из diff_rows,
+        new_players — [(игрок в памяти, несохранённый Player)]: после
+        вставки игрок в памяти получает id своей строки.
+        """
+        for model, changed in ((Session, sessions), (Player, players)):
+            by_fields: dict[tuple, list] = {}
+            for row_id, fields in changed.items():
+                by_fields.setdefault(tuple(sorted(fields)), []).append(model(id=row_id, **fields))
+            for fields, objs in by_fields.items():
+                model.objects.bulk_update(objs, fields)
+        if new_players:
+            Player.objects.bulk_create([obj for _, obj in new_players])
+            for player, obj in new_players:
+                player.db_id = obj.pk
+        if results:
+            Result.objects.bulk_create(results, ignore_conflicts=True)
+
+    async def _reconcile(self) -> ReconcileStats:
+        """
+        Сверить партии в памяти с Session / Player в БД и исправить БД.
+
+        Правда — состояние в памяти: в БД оно попадает отложенной записью,
+        и ошибки той записи только пишутся в консоль. Сверяются только
+        партии в памяти (стоимость линейна по ним, история не читается),
+        пропускаются:
+        - чаты, апдейты которых сейчас в работе;
+        - партии, у которых на сайте есть ещё не применённые правки;
+        - сессии, удалённые или сброшенные в БД (их бот не воскрешает).
+        """
+        stats = self.reconcile_stats
+        stats.start()
+        started = time.perf_counter()
+
+        # всё, что бот уже решил записать, должно быть в БД до сравнения
+        if self.writer.pending:
+            await self.writer.flush()
+        await self._reference_data()
+
+        games = {}
+        for key, game in list(self.games.items()):
+            if not game.db_session_id or self.update_processor.is_busy(key[0]):
+                stats.skipped += 1
+                continue
+            games[game.db_session_id] = game
+        if not games:
+            stats.last_seconds = time.perf_counter() - started
+            return stats
+
+        rows = await self.db.run(self._read_reconcile_rows, list(games))
+        stats.statements = rows["statements"]
+
+        session_expected = {}
+        player_expected = {}
+        new_players = []
+        results = []
+        names_by_session: dict[int, dict[str, int]] = {}
+        for db_id, row in rows["players"].items():
+            names_by_session.setdefault(row["session_id"], {})[GameState.name_key(row["name"])] = db_id
+
+        for session_id, game in games.items():
+            session = rows["sessions"].get(session_id)
+            if session is None or session["status"] == Session.Status.CANCELLED:
+                stats.count("сессия удалена или сброшена")
+                continue
+            if rows["changes"].get(session_id, 0) > game.web_change:
+                # правку с сайта бот ещё не применил — сверим в следующий раз
+                stats.skipped += 1
+                continue
+            stats.games += 1
+
+            session_expected[session_id] = self._expected_session_row(game)
+
+            # игроки без строки в БД (не удалось создать): находим по имени или создаём
+            names = names_by_session.get(session_id, {})
+            for player in game.players:
+                if player.db_id:
+                    continue
+                db_id = names.get(GameState.name_key(player.name))
+                if db_id is not None:
+                    player.db_id = db_id
+                else:
+                    new_players.append((player, self._new_player_row(game, player)))
+
+            for player in game.players:
+                if player.db_id:
+                    player_expected[player.db_id] = self._expected_player_row(game, player)
+
+            if game.phase == self.PHASE_FINISHED and game.winner_side and session_id not in rows["results"]:
+                results.append(Result(
+                    session_id=session_id,
+                    winner_side=(
+                        Result.WinnerSide.MAFIA if game.winner_side == "mafia"
+                        else Result.WinnerSide.TOWN
+                    ),
+                    rounds_count=game.round,
+                    mafia_count=game.mafia_alive,
+                    town_count=game.town_alive,
+                ))
+
+        sessions, _ = diff_rows(session_expected, rows["sessions"])
+        players, missing_players = diff_rows(player_expected, rows["players"])
+
+        for fields in sessions.values():
+            if fields.get("status") == Session.Status.FINISHED:
+                fields["finished_at"] = timezone.now()
+
+        # выбывшим при исправлении ставим текущий круг и фазу партии
+        game_of_player = {
+            player.db_id: (game, player) for game in games.values() for player in game.players
+        }
+        for db_id, fields in players.items():
+            if "status" in fields:
+                game, _ = game_of_player[db_id]
+                dead = fields["status"] == Player.PlayerStatus.DEAD
+                fields["fail_round"] = game.round if dead else None
+                fields["fail_phase_id"] = self._phase_id_for_code(game.phase) if dead else None
+
+        for field in ("status", "current_round", "current_phase_id"):
+            stats.count(f"Session.{field}", sum(field in diff for diff in sessions.values()))
+        for field in ("status", "role_id", "tg_user_id"):
+            stats.count(f"Player.{field}", sum(field in diff for diff in players.values()))
+
+        # строку игрока удалили из БД в обход бота — создаём заново
+        for db_id in missing_players:
+            game, player = game_of_player[db_id]
+            new_players.append((player, self._new_player_row(game, player)))
+        stats.count("нет строки Player", len(new_players))
+        stats.count("нет Result", len(results))
+
+        if sessions or players or new_players or results:
+            # в очереди записи после изменений, уже поставленных обработчиками,
+            # и до более поздних — исправление не затирает новые значения
+            await self.writer.call(
+                partial(self._repair_rows, sessions, players, new_players, results),
+                models=(Session, Player, Result),
+            )
+            if stats.mismatches:
+                self._db_warning(f"Сверка с БД: исправлено — {stats.render()}")
+
+        stats.last_seconds = time.perf_counter() - started
+        return stats
+
+    async def _reconcile_forever(self, interval: float):
+        """Раз в interval секунд сверяем партии в памяти с БД."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self._reconcile()
+            except Exception as e:
+                self._db_warning(f"Не удалось сверить партии с БД: {e}")
+
+    # Выгрузка молчащих партий из памяти
+
+    async def _evict_idle_games(self) -> int:
+        """
+        Выгрузить из памяти партии молчащих чатов (см. IdleGamePolicy).
+
+        Незавершённые партии сначала пишутся снимком в журнал, и из памяти
+        их убираем только после записи: следующий апдейт из чата поднимет
+        партию из БД через _restore_game. Чаты, в которых за это время
+        что-то произошло или апдейты которых сейчас в работе, не трогаем.
+        """
+        processor = self.update_processor
+        # выгружаем чат целиком, со всеми столами: он и поднимается из БД целиком
+        victims = self.eviction.select(self.games.by_chat, busy=processor.busy_chats)
+        spilled = False
+        for chat_id in victims:
+            for game in self.games.tables(chat_id).values():
+                if game.phase == self.PHASE_FINISHED:
+                    continue
+                if not game.db_session_id:
+                    # партию без сессии в БД не из чего будет восстановить
+                    self.eviction.touch(chat_id)
+                    continue
+                if game.event_seq != game.snapshot_seq:
+                    await self._record_events(game, [], snapshot=True)
+                    spilled = True
+        if spilled:
+            await self.writer.flush()
+
+        evicted = 0
+        for chat_id in victims:
+            if processor.is_busy(chat_id):
+                continue
+            tables = self.games.tables(chat_id)
+            if any(
+                game.phase != self.PHASE_FINISHED
+                and (not game.db_session_id or game.event_seq != game.snapshot_seq)
+                for game in tables.values()
+            ):
+                continue
+            for table in list(tables):
+                del self.games[chat_id, table]
+                self._panels.pop((chat_id, table), None)
+                evicted += 1
+            self._restored_chats.discard(chat_id)
+            self._last_keyboard.pop(chat_id, None)
+            self._user_tables.pop(chat_id, None)
+            self.eviction.forget(chat_id)
+
+        self.evicted += evicted
+        return evicted
+
+    async def _cancel_abandoned_sessions(self, cutoff) -> list[int]:
+        """
+        Отменить (одним UPDATE) брошенные партии бота: PLANNED / ACTIVE,
+        без событий журнала с момента cutoff. Возвращает id сессий.
+
+        Трогаем только чаты своего шарда (у каждого воркера свои) и не
+        трогаем чаты, апдейты которых сейчас в работе: партия могла как
+        раз подниматься из БД.
+        """
+        stale = (
+            Session.objects
+            .filter(
+                tg_chat_id__isnull=False,
+                status__in=[Session.Status.PLANNED, Session.Status.ACTIVE],
+            )
+            .annotate(last_activity=Coalesce(Max("events__created_at"), "created_at"))
+            .filter(last_activity__lt=cutoff)
+        )
+        index, shards = self.shard
+        if shards > 1:
+            # остаток как в shard_for (Python): у групп chat_id отрицательный,
+            # а MOD в SQL сохраняет знак делимого
+            stale = stale.annotate(
+                shard=Mod(Mod("tg_chat_id", shards) + shards, shards)
+            ).filter(shard=index)
+        rows = await self.db.query(
+            self._alist(stale.values_list("id", "tg_chat_id"))
+        )
+        ids = [
+            session_id for session_id, chat_id in rows
+            if not self.update_processor.is_busy(chat_id)
+        ]
+        if ids:
+            await self.db.query(
+                Session.objects.filter(id__in=ids).aupdate(status=Session.Status.CANCELLED)
+            )
+        return ids
+
+    @staticmethod
+    async def _alist(queryset) -> list:
+        return [item async for item in queryset]
+
+    async def _drop_abandoned_games(self, abandoned_after: float) -> int:
+        # события брошенных партий могут ещё стоять в очереди записи
+        if self.writer.pending:
+            await self.writer.flush()
+        cutoff = timezone.now() - timedelta(seconds=abandoned_after)
+        ids = set(await self._cancel_abandoned_sessions(cutoff))
+        if ids:
+            for key, game in list(self.games.items()):
+                if game.db_session_id in ids and not self.update_processor.is_busy(key[0]):
+                    del self.games[key]
+                    self._panels.pop(key, None)
+            self.cancelled_sessions += len(ids)
+        return len(ids)
+
+    async def _evict_forever(self, interval: float, abandoned_after: float):
+        """Раз в interval секунд выгружаем молчащие партии и отменяем брошенные."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self._evict_idle_games()
+                if abandoned_after:
+                    await self._drop_abandoned_games(abandoned_after)
+                retention = getattr(settings, "TG_BOT_CHANGE_FEED_RETENTION", 8 * 24 * 60 * 60)
+                # ленту чистит один процесс, а не каждый воркер
+                if retention and self.shard[0] == 0:
+                    await self._prune_changes(retention)
+            except Exception as e:
+                self._db_warning(f"Не удалось выгрузить молчащие партии: {e}")
+
+    def _apply_event(self, game, session_id: int, kind: str, payload: dict):
+        """
+        Применить одно событие журнала к состоянию партии.
+        Возвращает новое состояние (None — партии нет или она сброшена).
+        """
+        if kind == GameEvent.Kind.SNAPSHOT:
+            return GameState.from_dict(payload)
+
+        if kind == GameEvent.Kind.STARTED:
+            game = self._new_game(
+                payload["planned_players"],
+                payload["game_mode"],
+                session_id,
+            )
+            game.host_id = payload.get("host_id")
+            return game
+
+        if game is None or kind == GameEvent.Kind.RESET:
+            return None
+
+        if kind == GameEvent.Kind.PLAYERS_ADDED:
+            names = payload.get("names", [])
+            ids = payload.get("ids") or [None] * len(names)
+            for name, db_id in zip(names, ids):
+                game.add_player(name, db_id=db_id)
+            if len(game.players) >= game.planned_players:
+                game.adding_players = False
+
+        elif kind == GameEvent.Kind.ROLES_ASSIGNED:
+            game.roles_mode = payload["mode"]
+            game.adding_players = False
+            roles = payload.get("roles")
+            if roles:
+                game.set_roles(ROLE_BY_NAME.get(role, ROLE_NONE) for role in roles)
+                game.roles_assigned = True
+            else:
+                game.roles_assigned = False
+
+        elif kind == GameEvent.Kind.PHASE:
+            game.phase = payload["phase"]
+            game.round = payload["round"]
+
+        elif kind == GameEvent.Kind.NIGHT_CHOICE:
+            setattr(game, "pending_" + payload["action"], payload["name"])
+
+        elif kind == GameEvent.Kind.NIGHT_RESULT:
+            killed = payload.get("killed")
+            if killed:
+                player = self._find_player(game, killed)
+                if player:
+                    game.kill(player)
+            game.last_night_killed = killed
+            game.pending_kill = None
+            game.pending_heal = None
+            game.pending_check = None
+
+        elif kind == GameEvent.Kind.LYNCH:
+            player = self._find_player(game, payload["name"])
+            if player:
+                game.kill(player)
+
+        elif kind == GameEvent.Kind.LINKED:
+            self._link_player(game, payload["name"], payload["user_id"])
+
+        elif kind == GameEvent.Kind.WEB_EDIT:
+            return self._apply_web_edit(game, payload)
+
+        elif kind == GameEvent.Kind.FINISHED:
+            game.phase = self.PHASE_FINISHED
+            game.winner_side = payload.get("winner_side")
+            game.mafia_alive = payload.get("mafia_alive", 0)
+            game.town_alive = payload.get("town_alive", 0)
+
+        return game
+
+    def _replay_events(self, session_id: int, events, snapshot: dict | None = None):
+        """
+        Собрать состояние партии из журнала.
+
+        snapshot — состояние из последнего снимка (None, если снимков нет),
+        events — события после снимка по возрастанию seq.
+        """
+        game = None
+        if snapshot:
+            game = GameState.from_dict(snapshot)
+        for event in events:
+            game = self._apply_event(game, session_id, event.kind, event.payload)
+            if game is not None:
+                game.event_seq = event.seq
+        return game
+
+    def _load_game_from_events(self, session_id: int):
+        """
+        Восстановить партию из журнала (синхронно): последний снимок
+        + события после него. None — если журнал у сессии пуст.
+        """
+        snapshot = (
+            GameEvent.objects
+            .filter(session_id=session_id, kind=GameEvent.Kind.SNAPSHOT)
+            .order_by("-seq")
+            .first()
+        )
+        events = GameEvent.objects.filter(session_id=session_id).order_by("seq")
+        if snapshot:
+            events = events.filter(seq__gt=snapshot.seq)
+        events = list(events)
+
+        if snapshot is None and not events:
+            return None
+
+        # события после снимка должны идти подряд: если пачка отложенной
+        # записи с частью из них не записалась, остальное проигрывать нельзя
+        expected = snapshot.seq if snapshot else 0
+        for event in events:
+            expected += 1
+            if event.seq != expected:
+                self.stderr.write(
+                    self.style.WARNING(
+                        f"Журнал партии {session_id}: нет событий с seq {expected}"
+                        f"–{event.seq - 1}, партия поднимается из Session / Player"
+                    )
+                )
+                return None
+
+        game = self._replay_events(
+            session_id, events, snapshot.payload if snapshot else None
+        )
+        if game is not None:
+            game.event_seq = events[-1].seq if events else snapshot.seq
+            game.snapshot_seq = snapshot.seq if snapshot else 0
+
+            # журналы старых партий могут не знать id игроков — находим их по имени
+            if any(p.db_id is None for p in game.players):
+                for db_id, name in Player.objects.filter(session_id=session_id).values_list("id", "name"):
+                    player = game.find_player(name)
+                    if player is not None and player.db_id is None:
+                        player.db_id = db_id
+
+            # доставка ролей в личку в журнал не пишется — берём её из Player
+            linked = {p.db_id: p for p in game.players if p.tg_user_id and p.db_id}
+            if linked:
+                delivery = Player.objects.filter(id__in=linked).values_list("id", "role_delivery")
+                for db_id, status in delivery:
+                    linked[db_id].role_dm = status or None
+        return game
+
+    def _load_games_from_db(self, chat_id: int) -> dict[int, GameState]:
+        """
+        Восстановить партии всех столов чата (синхронно): {стол: партия}.
+
+        Незавершённые сессии чата берём одним запросом по индексу
+        (tg_chat_id, status), история завершённых партий не читается.
+        На каждом столе поднимаем последнюю из них.
+        """
+        sessions = (
+            Session.objects
+            .filter(
+                tg_chat_id=chat_id,
+                status__in=[Session.Status.PLANNED, Session.Status.ACTIVE],
+            )
+            .select_related("current_phase")
+            .order_by("-id")
+        )
+        games = {}
+        for session in sessions:
+            if session.tg_table in games:
+                continue
+            game = self._load_session_game(session)
+            game.table = session.tg_table
+            games[session.tg_table] = game
+        return games
+
+    def _load_session_game(self, session: Session) -> GameState:
+        """
+        Партия одной сессии бота (синхронно).
+        Если у сессии есть целый журнал событий — состояние собирается из
+        него (вместе с ночными выборами pending_*), иначе — из Session / Player.
+        """
+        game = self._load_game_from_events(session.id)
+        if game is not None:
+            return game
+
+        sport_mode_id = getattr(settings, "TG_BOT_MODE_SPORT_ID", None)
+        game_mode = (
+            self.GAME_MODE_SPORT
+            if sport_mode_id and session.mode_id == sport_mode_id
+            else self.GAME_MODE_CLASSIC
+        )
+        game = self._new_game(session.players_count, game_mode, session.id)
+
+        # названия ролей из БД -> внутренние коды бота
+        name_to_code = {
+            name.lower(): code for code, name in self.ROLE_DB_NAMES.items()
+        }
+        players = session.players.select_related("role").order_by("id")
+        for p in players:
+            player = game.add_player(
+                p.name,
+                db_id=p.id,
+                role=name_to_code.get(p.role.name.lower(), ROLE_NONE) if p.role else ROLE_NONE,
+                alive=p.status == Player.PlayerStatus.ALIVE,
+            )
+            player.tg_user_id = p.tg_user_id
+            player.role_dm = p.role_delivery or None
+
+        if session.status == Session.Status.ACTIVE:
+            # роли в БД есть только в режиме random
+            if any(p.role for p in game.players):
+                game.roles_mode = "random"
+                game.roles_assigned = True
+            else:
+                game.roles_mode = "cards"
+
+            game.phase = self._phase_code(session.current_phase_id)
+            game.round = session.current_round
+        else:
+            # недобранная партия: до перезапуска ведущий, скорее всего, был
+            # в режиме /addplayer — продолжаем принимать имена
+            game.adding_players = 0 < len(game.players) < game.planned_players
+
+        # у журнала с дырой нумерация продолжается после последнего события
+        game.event_seq = (
+            GameEvent.objects.filter(session_id=session.id).aggregate(last=Max("seq"))["last"]
+            or 0
+        )
+        return game
+
+    def _phase_code(self, phase_id) -> str:
+        """Фаза бота (night/day/vote) по id фазы сайта (Phase, по порядку)."""
+        phase_codes = [self.PHASE_NIGHT, self.PHASE_DAY, self.PHASE_VOTE]
+        phase_ids = [phase.id for phase in registry.phases()]
+        if phase_id in phase_ids:
+            idx = phase_ids.index(phase_id)
+            if idx < len(phase_codes):
+                return phase_codes[idx]
+        return self.PHASE_NIGHT
+
+    async def _restore_game(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """
+        Ленивое восстановление партии после перезапуска бота.
+
+        Вызывается перед всеми обработчиками (группа -1). В БД идём только
+        при первом апдейте из чата, которого нет в self.games, и поднимаем
+        сразу все его столы.
+        """
+        chat_id = self._get_chat_id(update)
+        if chat_id is None:
+            return
+        self.eviction.touch(chat_id)
+        if self.games.tables(chat_id) or chat_id in self._restored_chats:
+            return
+
+        self._restored_chats.add(chat_id)
+        try:
+            games = await self.db.run(self._load_games_from_db, chat_id)
+        except Exception as e:
+            # со следующим апдейтом чата попробуем ещё раз
+            self._restored_chats.discard(chat_id)
+            self.stderr.write(
+                self.style.WARNING(f"Не удалось восстановить игру из БД: {e}")
+            )
+            return
+
+        for table, game in games.items():
+            # пока шёл запрос, за этим столом могли успеть создать новую игру
+            if (chat_id, table) in self.games:
+                continue
+            self.games[chat_id, table] = game
+
+            # партия без снимка (создана до журнала, журнал с дырой или
+            # ещё короткий) — сохраняем снимок, чтобы дальше восстанавливаться
+            # по нему и событиям после него
+            if not game.snapshot_seq:
+                await self._record_events(game, [], snapshot=True)
+
+        # правки с сайта, сделанные, пока партии не было в памяти
+        await self._catch_up_changes(update.get_bot(), chat_id)
 
     async def _ensure_game(self, update: Update):
         """
@@ -83,7 +1203,8 @@ class Command(BaseCommand):
         """
         game = self._get_game(update)
         if not game and update.message:
-            await update.message.reply_text(
+            await self._reply(
+                update,
                 "В этом чате игра ещё не создана.\n"
                 "Сначала запусти команду: /startgame 10"
             )
@@ -91,32 +1212,19 @@ class Command(BaseCommand):
         return game
 
     def _find_player(self, game, name: str):
-        """Находим игрока по имени (без учёта регистра)."""
-        name_lower = name.strip().lower()
-        for p in game["players"]:
-            if p["name"].lower() == name_lower:
-                return p
-        return None
+        """Находим игрока по имени (без учёта регистра) — по индексу партии."""
+        return game.find_player(name)
 
-    def _alive_players(self, game):
-        """Список живых игроков."""
-        return [p for p in game["players"] if p["alive"]]
+    def _alive_total(self, game) -> int:
+        """Сколько игроков ещё в игре."""
+        return game.alive_count()
 
     def _alive_counts(self, game):
         """
-        Подсчёт живых мафий и мирных по внутреннему состоянию бота.
+        Подсчёт живых мафий и мирных по битовым маскам партии (без обхода игроков).
         Дон считается мафией.
         """
-        alive_mafia = 0
-        alive_town = 0
-        for p in game["players"]:
-            if not p["alive"]:
-                continue
-            if p["role"] in (self.ROLE_MAFIA, self.ROLE_DON):
-                alive_mafia += 1
-            else:
-                alive_town += 1
-        return alive_mafia, alive_town
+        return game.alive_counts()
 
     def _censor_name(self, name: str) -> str:
         """
@@ -130,7 +1238,7 @@ class Command(BaseCommand):
         """
         Простая логика раздачи ролей.
 
-        Если game["game_mode"] == 'sport' и игроков ровно 10 —
+        Если game.game_mode == 'sport' и игроков ровно 10 —
         используем "спортивную" раскладку:
           6 мирных, 2 мафии, 1 дон, 1 комиссар.
 
@@ -138,12 +1246,12 @@ class Command(BaseCommand):
           1/3 игроков — мафия (не меньше 2),
           + по одному комиссару и доктору.
         """
-        players = game["players"]
+        players = game.players
         n = len(players)
         indices = list(range(n))
         random.shuffle(indices)
 
-        game_mode = game.get("game_mode") or self.GAME_MODE_CLASSIC
+        game_mode = game.game_mode or self.GAME_MODE_CLASSIC
 
         # по умолчанию все мирные
         roles = [self.ROLE_TOWN] * n
@@ -190,13 +1298,12 @@ class Command(BaseCommand):
             idx += 1
 
         # записываем роли в игроков
-        for i, player in enumerate(players):
-            player["role"] = roles[i]
+        game.set_roles(roles)
 
         # помечаем, что роли выданы
-        game["roles_assigned"] = True
+        game.roles_assigned = True
 
-    def _format_role_ru(self, role: str | None) -> str:
+    def _format_role_ru(self, role: int) -> str:
         """Человеческое название роли."""
         if role == self.ROLE_MAFIA:
             return "Мафия"
@@ -216,24 +1323,13 @@ class Command(BaseCommand):
         Показываем имена ролей.
         Доктор упоминается только если он реально есть в игре.
         """
-        round_num = game["round"]
-        players = game["players"]
-
-        detectives = [
-            p for p in players
-            if p["alive"] and p["role"] == self.ROLE_DETECTIVE
-        ]
-        mafias = [
-            p for p in players
-            if p["alive"] and p["role"] in (self.ROLE_MAFIA, self.ROLE_DON)
-        ]
-        doctors = [
-            p for p in players
-            if p["alive"] and p["role"] == self.ROLE_DOCTOR
-        ]
+        round_num = game.round
+        detectives = game.alive_players(self.ROLE_DETECTIVE)
+        mafias = game.alive_players(self.ROLE_MAFIA) + game.alive_players(self.ROLE_DON)
+        doctors = game.alive_players(self.ROLE_DOCTOR)
 
         def names_line(lst):
-            return ", ".join(p["name"] for p in lst) or "—"
+            return ", ".join(p.name for p in lst) or "—"
 
         text_lines = [
             f"🌙 Ночь, круг {round_num}. Все игроки засыпают.",
@@ -262,89 +1358,266 @@ class Command(BaseCommand):
         ]
         return "\n".join(text_lines)
 
-    def _control_keyboard(self, game: dict | None):
+    def _keyboard_state(self, game: GameState | None) -> str:
+        """Какая клавиатура ведущего нужна для текущего состояния партии."""
+        # Нет активной игры для чата или игра уже завершена
+        if not game or game.phase == self.PHASE_FINISHED:
+            return "idle"
+
+        players_count = len(game.players)
+        planned = game.planned_players
+        roles_mode = game.roles_mode
+        phase = game.phase
+
+        # Ещё набираем игроков, режим ролей ещё не выбран
+        if players_count < planned and not roles_mode:
+            return "adding"
+        # Игроки уже набраны, но роли ещё не выбраны
+        if players_count == planned and not roles_mode:
+            return "assign"
+
+        # Роли уже выбраны, игра идёт: в режиме панели клавиатура одна,
+        # иначе кнопки зависят от фазы
+        if self.control_panel and phase in (
+            self.PHASE_NIGHT, self.PHASE_DAY, self.PHASE_VOTE
+        ):
+            return "panel"
+        if phase == self.PHASE_NIGHT:
+            game_mode = game.game_mode or self.GAME_MODE_CLASSIC
+            # Спортивная мафия — без доктора, /heal не показываем
+            if game_mode == self.GAME_MODE_SPORT:
+                return "night_sport"
+            return "night_classic"
+        if phase == self.PHASE_DAY:
+            return "day"
+        if phase == self.PHASE_VOTE:
+            return "vote"
+        # На всякий случай – общий вариант
+        return "fallback"
+
+    def _control_keyboard(self, game: GameState | None):
         """
         Быстрые кнопки внизу экрана.
         Кнопка = уже готовая команда, которая сразу отправляется.
+
+        Набор клавиатур конечный, поэтому все они собраны заранее (KEYBOARDS),
+        здесь только выбираем нужную.
         """
-        # Нет активной игры для чата
-        if not game:
-            keyboard = [
-                ["/start", "/help"],
-                ["/startgame 10"],
-            ]
-            return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+        return self.KEYBOARDS[self._keyboard_state(game)]
 
-        # Игра уже завершена
-        if game.get("phase") == self.PHASE_FINISHED:
-            keyboard = [
-                ["/start", "/help"],
-                ["/startgame 10"],
-            ]
-            return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+    async def _reply(
+        self, update: Update, text: str, reply_markup=None, quote=True, merge=True
+    ):
+        """
+        Ответ в чат апдейта.
 
-        players_count = len(game["players"])
-        planned = game["planned_players"]
-        roles_mode = game.get("roles_mode")
-        phase = game.get("phase")
+        Клавиатуру ведущего (из KEYBOARDS) не отправляем повторно,
+        если в этом чате уже показана такая же: она и так остаётся на экране.
 
-        # Ещё набираем игроков, режим ролей ещё не выбран
-        if players_count < planned and not roles_mode:
-            keyboard = [
-                ["/addplayer"],
-                ["/players", "/help"],
-                ["/reset"],
-            ]
-        # Игроки уже набраны, но роли ещё не выбраны
-        elif players_count == planned and not roles_mode:
-            keyboard = [
-                ["/assign random", "/assign cards"],
-                ["/players"],
-                ["/help", "/reset"],
-            ]
-        else:
-            # Роли уже выбраны, игра идёт.
-            game_mode = game.get("game_mode") or self.GAME_MODE_CLASSIC
-
-            # Разные кнопки в зависимости от фазы.
-            if phase == self.PHASE_NIGHT:
-                # НОЧЬ
-                if game_mode == self.GAME_MODE_SPORT:
-                    # Спортивная мафия — без доктора, /heal не показываем
-                    keyboard = [
-                        ["/players", "/next"],
-                        ["/check", "/kill"],
-                        ["/help", "/reset"],
-                    ]
-                else:
-                    # Классика — есть доктор
-                    keyboard = [
-                        ["/players", "/next"],
-                        ["/check", "/kill", "/heal"],
-                        ["/help", "/reset"],
-                    ]
-            elif phase == self.PHASE_DAY:
-                # ДЕНЬ: обсуждение, только /next
-                keyboard = [
-                    ["/players", "/next"],
-                    ["/help", "/reset"],
-                ]
-            elif phase == self.PHASE_VOTE:
-                # ГОЛОСОВАНИЕ
-                keyboard = [
-                    ["/players", "/next"],
-                    ["/lynch"],
-                    ["/help", "/reset"],
-                ]
-            else:
-                # На всякий случай – общий вариант
-                keyboard = [
-                    ["/players", "/next"],
-                    ["/check", "/kill"],
-                    ["/help", "/reset"],
-                ]
+        Сообщение не отправляется сразу, а встаёт в очередь чата
+        (OutboundScheduler): подряд идущие ответы уйдут одним сообщением
+        (merge=False — отдельным). quote=False — без цитаты в группах.
+        Возвращает future с отправленным Message.
+        """
+        message = update.effective_message
+        if message is None:
+            return None
+
+        chat_id = message.chat_id
+        if len(self.games.tables(chat_id)) > 1:
+            # в чате несколько столов — подписываем, к какому относится ответ
+            text = f"[Стол {self._table_of(update)}] {text}"
+        keyboard_key = self._KEYBOARD_KEYS.get(id(reply_markup))
+        if keyboard_key is not None and self._last_keyboard.get(chat_id) == keyboard_key:
+            reply_markup = None
+
+        # как reply_text: в группах отвечаем цитатой на сообщение
+        # message_id 0 — апдейт таймера или правки с сайта (_host_update), цитировать нечего
+        reply_to = (
+            message.message_id
+            if quote and message.message_id and message.chat.type != Chat.PRIVATE
+            else None
+        )
+        sent = self.outbound.send(
+            message.get_bot(),
+            chat_id,
+            text,
+            reply_markup=reply_markup,
+            reply_to=reply_to,
+            merge=merge,
+        )
+
+        if keyboard_key is not None:
+            # считаем клавиатуру показанной сразу, чтобы ответы, вставшие в очередь
+            # следом, её не повторяли; если сообщение не дошло — забываем её
+            self._last_keyboard[chat_id] = keyboard_key
+            if reply_markup is not None:
+                sent.add_done_callback(
+                    lambda future: not future.cancelled() and future.exception() is None
+                    or self._forget_keyboard(chat_id, keyboard_key)
+                )
+        return sent
+
+    def _forget_keyboard(self, chat_id: int, keyboard_key: str):
+        # следующий ответ с этой клавиатурой отправит её заново
+        if self._last_keyboard.get(chat_id) == keyboard_key:
+            del self._last_keyboard[chat_id]
+
+    # Панель партии (TG_BOT_CONTROL_PANEL)
+
+    def _phase_headline(self, game: GameState) -> str:
+        """Короткий заголовок фазы — для панели, когда текста фазы нет."""
+        if game.phase == self.PHASE_NIGHT:
+            return f"🌙 Ночь, круг {game.round}."
+        if game.phase == self.PHASE_DAY:
+            return f"🌞 День, круг {game.round}."
+        if game.phase == self.PHASE_VOTE:
+            return f"🗳 Голосование, круг {game.round}."
+        if game.phase == self.PHASE_FINISHED:
+            return "🏁 Игра окончена."
+        return ""
+
+    def _panel_text(self, game: GameState, headline: str, prompt=None) -> str:
+        """Текст панели: текст фазы, под ним состояние партии и вопрос к кнопкам."""
+        alive = game.alive_players()
+        dropped = [p.name for p in game.players if not game.is_alive(p)]
+        lines = [
+            headline,
+            "",
+            f"📋 Круг {game.round}, в игре {len(alive)} из {len(game.players)}",
+            "Живы: " + (", ".join(p.name for p in alive) or "—"),
+        ]
+        if dropped:
+            lines.append("Выбыли: " + ", ".join(dropped))
+
+        if game.phase == self.PHASE_NIGHT:
+            choices = []
+            if game.pending_kill:
+                choices.append(f"жертва мафии — {game.pending_kill}")
+            if game.pending_heal:
+                choices.append(f"лечение — {game.pending_heal}")
+            if game.pending_check:
+                checked = self._find_player(game, game.pending_check)
+                role = (
+                    f" ({self._format_role_ru(checked.role)})"
+                    if checked and game.roles_mode == "random"
+                    else ""
+                )
+                choices.append(f"проверка — {game.pending_check}{role}")
+            if choices:
+                lines.append("Ночью: " + "; ".join(choices))
+        if prompt:
+            lines += ["", prompt]
+        return "\n".join(lines)
+
+    async def _refresh_panel(
+        self, update: Update, game: GameState, headline=None, prompt=None, picker=None
+    ) -> bool:
+        """
+        Показать состояние партии в панели чата.
+
+        Панели ещё нет — отправляем новую и закрепляем, иначе правим её текст
+        (headline=None — заголовок остаётся прежним). picker — inline-кнопки
+        выбора игрока с вопросом prompt: они показываются прямо в панели
+        вместо отдельного сообщения и пропадают при следующей правке.
+        Правки идут через очередь исходящих: несколько правок подряд уйдут одной.
+        Возвращает False, если режим панели выключен.
+        """
+        if not self.control_panel:
+            return False
+        message = update.effective_message
+        if message is None:
+            return True
+
+        chat_id = message.chat_id
+        key = (chat_id, game.table)
+        panel = self._panels.get(key)
+        if headline is None:
+            headline = panel.headline if panel else self._phase_headline(game)
+        text = self._panel_text(game, headline, prompt)
+        digest = hash(text)
+
+        if panel is None:
+            sent = await self._reply(
+                update,
+                text,
+                reply_markup=picker or self._control_keyboard(game),
+                quote=False,
+                merge=False,
+            )
+            panel = self._panels[key] = ControlPanel(sent, headline, digest)
+            self._spawn(self._pin_panel(message.get_bot(), key, panel))
+            return True
+
+        panel.headline = headline
+        if panel.digest == digest and picker is None:
+            return True
+        panel.digest = digest
+        edited = self.outbound.edit(
+            message.get_bot(), chat_id, panel.message, text, reply_markup=picker
+        )
+        edited.add_done_callback(
+            lambda future: future.cancelled()
+            or future.exception() is None
+            or self._forget_panel(key, panel)
+        )
+        return True
+
+    def _spawn(self, coroutine):
+        """Фоновая задача вне метрик обработчика; ссылка держится до её окончания."""
+        task = asyncio.create_task(coroutine, context=contextvars.Context())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    def _forget_panel(self, key, panel: ControlPanel):
+        # панель не отправилась или её удалили — следующее обновление пришлёт новую
+        if self._panels.get(key) is panel:
+            del self._panels[key]
+
+    async def _pin_panel(self, bot, key, panel: ControlPanel):
+        chat_id = key[0]
+        try:
+            message = await panel.message
+        except Exception:
+            self._forget_panel(key, panel)
+            return
+        panel.message = message.message_id
+        try:
+            await bot.pin_chat_message(chat_id, message.message_id, disable_notification=True)
+        except Exception as e:
+            self._bot_warning(f"Не удалось закрепить панель в чате {chat_id}: {e}")
 
-        return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+    async def _button_error(self, update: Update, game, text: str):
+        """
+        Ответ на нажатие кнопки, которое уже нельзя выполнить.
+
+        Кнопки панели просто убираем, перерисовав её (текст панели не трогаем),
+        кнопки отдельного сообщения заменяем текстом ошибки.
+        """
+        query = update.callback_query
+        panel = (
+            self._panels.get((query.message.chat_id, game.table)) if query.message else None
+        )
+        if (
+            panel is not None
+            and isinstance(panel.message, int)
+            and panel.message == query.message.message_id
+        ):
+            panel.digest = None
+            await self._refresh_panel(update, game)
+            return
+        await query.edit_message_text(text)
+
+    async def _show_phase(self, update: Update, game: GameState, text: str):
+        """Текст новой фазы: в панель партии, а без неё — новым сообщением."""
+        if not await self._refresh_panel(update, game, text):
+            await self._reply(update, text, reply_markup=self._control_keyboard(game))
+
+    async def _announce_win(self, update: Update, game: GameState, win_text: str):
+        """Итоги партии — всегда отдельным сообщением (и в панель, если она есть)."""
+        await self._reply(update, win_text, reply_markup=self._control_keyboard(game))
+        await self._refresh_panel(update, game, self._phase_headline(game))
 
     def _check_win_and_build_message(self, game):
         """
@@ -354,7 +1627,7 @@ class Command(BaseCommand):
         Возвращает строку с итогами или None, если игра не окончена.
         Плюс кладёт в game информацию winner_side / mafia_alive / town_alive.
         """
-        if not (game.get("roles_mode") == "random" and game.get("roles_assigned")):
+        if not (game.roles_mode == "random" and game.roles_assigned):
             return None
 
         alive_mafia, alive_town = self._alive_counts(game)
@@ -369,10 +1642,10 @@ class Command(BaseCommand):
             return None
 
         # помечаем игру как завершённую
-        game["phase"] = self.PHASE_FINISHED
-        game["winner_side"] = winner
-        game["mafia_alive"] = alive_mafia
-        game["town_alive"] = alive_town
+        game.phase = self.PHASE_FINISHED
+        game.winner_side = winner
+        game.mafia_alive = alive_mafia
+        game.town_alive = alive_town
 
         lines: list[str] = []
         if winner == "mafia":
@@ -382,10 +1655,10 @@ class Command(BaseCommand):
         lines.append("")
         lines.append("Итоги партии:")
 
-        for p in game["players"]:
-            role_ru = self._format_role_ru(p["role"])
-            status = "в игре" if p["alive"] else "выбыл"
-            lines.append(f" - {p['name']}: {role_ru}, {status}")
+        for p in game.players:
+            role_ru = self._format_role_ru(p.role)
+            status = "в игре" if game.is_alive(p) else "выбыл"
+            lines.append(f" - {p.name}: {role_ru}, {status}")
 
         lines.append("")
         lines.append(
@@ -395,208 +1668,235 @@ class Command(BaseCommand):
         return "\n".join(lines)
 
 
-    async def _sync_roles_to_db(self, game: dict):
+    def _db_warning(self, message: str):
+        """Предупреждение о проблеме с БД — в консоль, бот продолжает работу."""
+        self.stderr.write(self.style.WARNING(message))
+
+    def _bot_warning(self, message: str):
+        """Предупреждение о проблеме с Telegram — в консоль, бот продолжает работу."""
+        self.stderr.write(self.style.WARNING(message))
+
+    async def _reference_data(self):
+        """
+        Кэш справочников (роли, фазы, режимы, ведущий).
+        Если он ещё не прогрет или был сброшен — один раз читаем из БД.
+        """
+        if not registry.ready:
+            host_id = getattr(settings, "TG_BOT_HOST_USER_ID", None)
+            await self.db.run(registry.warm, user_ids=[host_id])
+        return registry
+
+    def _phase_id_for_code(self, phase_code: str | None):
+        """
+        id объекта Phase по коду фазы бота (из кэша справочников):
+        ночь — первая фаза по order, день — вторая, голосование — третья.
+        """
+        phases = [phase.id for phase in registry.phases()]
+        if not phases:
+            return None
+        if phase_code == self.PHASE_DAY and len(phases) >= 2:
+            return phases[1]
+        if phase_code == self.PHASE_VOTE and len(phases) >= 3:
+            return phases[2]
+        return phases[0]
+
+    async def _sync_roles_to_db(self, game: GameState):
         """
         Синхронизировать роли из players в поле Player.role в БД.
         Работает только для режима random, когда бот знает роли.
         """
-        session_id = game.get("db_session_id")
+        session_id = game.db_session_id
         if not session_id:
             return
 
-        # соответствие внутренних кодов ролей -> названиям в таблице Role
-        code_to_role_name = {
-            self.ROLE_TOWN: "Мирный житель",
-            self.ROLE_MAFIA: "Мафия",
-            self.ROLE_DON: "Дон мафии",
-            self.ROLE_DETECTIVE: "Комиссар",
-            self.ROLE_DOCTOR: "Доктор",
-        }
-
-        def _do_sync():
-            try:
-                session = Session.objects.get(id=session_id)
-            except Session.DoesNotExist:
-                return
-
-            # кэшируем роли по имени (lower)
-            roles_by_name = {
-                r.name.lower(): r
-                for r in Role.objects.all()
-            }
-
-            for p in game["players"]:
-                code = p.get("role")
-                if not code:
-                    continue
-
-                role_name = code_to_role_name.get(code)
-                if not role_name:
-                    continue
+        # роли фиксируем сейчас, а пишем при ближайшей записи очереди
+        assigned = [(p.db_id, p.role) for p in game.players if p.role and p.db_id]
 
-                role_obj = roles_by_name.get(role_name.lower())
+        def _do_sync():
+            players = []
+            for db_id, code in assigned:
+                role_obj = registry.role(self.ROLE_DB_NAMES.get(code, ""))
                 if not role_obj:
                     # если нет такой роли в БД — просто пропускаем
                     continue
+                players.append(Player(id=db_id, role=role_obj))
 
-                Player.objects.filter(
-                    session=session,
-                    name=p["name"],
-                ).update(role=role_obj)
+            # все роли партии — одним UPDATE по первичным ключам
+            Player.objects.bulk_update(players, ["role"])
 
-        try:
-            await sync_to_async(_do_sync)()
-        except Exception as e:
-            self.stderr.write(
-                self.style.WARNING(
-                    f"Не удалось записать роли игроков в БД: {e}"
-                )
-            )
+        await self.writer.call(_do_sync, models=(Player,))
 
+    # Роли в личные сообщения
 
-    async def _update_session_phase(self, game: dict, phase_code: str):
+    def _link_player(self, game: GameState, name: str, user_id: int):
         """
-        Синхронизируем в БД текущий круг и фазу
-        (Session.current_round / Session.current_phase),
-        чтобы это отражалось в кабинете ведущего
+        Привязать Telegram-аккаунт к месту игрока name.
+        Возвращает (игрок, место, от которого аккаунт отвязан, или None).
         """
-        session_id = game.get("db_session_id")
-        if not session_id:
-            return
+        player = self._find_player(game, name)
+        if player is None:
+            return None, None
+        previous = game.player_of_user(user_id)
+        if previous is player:
+            previous = None
+        elif previous is not None:
+            previous.tg_user_id = None
+            previous.role_dm = None
+        player.tg_user_id = user_id
+        return player, previous
+
+    def _role_text(self, game: GameState, player, chat_title: str) -> str:
+        """Текст роли для лички игрока; мафия видит свою команду."""
+        where = f" в партии «{chat_title}»" if chat_title else ""
+        lines = [f"🎭 Твоя роль{where}: {self._format_role_ru(player.role)}."]
+        if player.role in (self.ROLE_MAFIA, self.ROLE_DON):
+            team = [
+                f"{p.name} ({self._format_role_ru(p.role)})"
+                for p in game.players
+                if p is not player and p.role in (self.ROLE_MAFIA, self.ROLE_DON)
+            ]
+            if team:
+                lines.append("Твоя команда: " + ", ".join(team) + ".")
+        lines.append("Никому не показывай это сообщение.")
+        return "\n".join(lines)
 
-        round_num = game.get("round", 1)
+    def _deliver_roles(self, update: Update, game: GameState, players=None) -> int:
+        """
+        Поставить роли привязанных игроков (/join) в очередь на отправку в личку.
+        Обработчик не ждёт доставки. Возвращает, скольким игрокам роль отправляется.
+        """
+        if not game.roles_assigned:
+            return 0
+        chat = update.effective_chat
+        messages = []
+        for player in game.players if players is None else players:
+            if player.tg_user_id is None or player.role == ROLE_NONE:
+                continue
+            player.role_dm = "pending"
+            messages.append(RoleMessage(
+                player.tg_user_id,
+                self._role_text(game, player, chat.title or ""),
+                (chat.id, game.table),
+                game.db_session_id,
+                player.seat,
+                player.db_id,
+            ))
+        if messages:
+            self.roles_dm.submit(update.get_bot(), messages)
+        return len(messages)
+
+    async def _role_dm_status(self, message: RoleMessage, status: str):
+        """Итог отправки роли: в состояние партии, в Player.role_delivery и в список повторов."""
+        game = self.games.get(message.game_key)
+        if (
+            game is not None
+            and game.db_session_id == message.session_id
+            and message.seat < len(game.players)
+            and game.players[message.seat].tg_user_id == message.user_id
+        ):
+            game.players[message.seat].role_dm = status
+
+        failed = self._failed_dms.get(message.user_id)
+        if failed:
+            # более старая попытка той же роли больше не нужна
+            failed[:] = [
+                m for m in failed
+                if (m.session_id, m.seat) != (message.session_id, message.seat)
+            ]
+        if status == RoleDelivery.FAILED:
+            message.attempts = 0
+            self._failed_dms.setdefault(message.user_id, []).append(message)
+        elif failed is not None and not failed:
+            del self._failed_dms[message.user_id]
 
-        def _do_update():
-            try:
-                session = Session.objects.get(id=session_id)
-            except Session.DoesNotExist:
-                return
+        if message.db_id:
+            await self.writer.update(Player, {"role_delivery": status}, id=message.db_id)
 
-            phases = list(Phase.objects.order_by("order"))
-            phase_obj = None
-            if phases:
-                if phase_code == self.PHASE_NIGHT:
-                    phase_obj = phases[0]
-                elif phase_code == self.PHASE_DAY and len(phases) >= 2:
-                    phase_obj = phases[1]
-                elif phase_code == self.PHASE_VOTE and len(phases) >= 3:
-                    phase_obj = phases[2]
-                else:
-                    phase_obj = phases[0]
+    async def _update_session_phase(self, game: GameState, phase_code: str):
+        """
+        Синхронизируем в БД текущий круг и фазу
+        (Session.current_round / Session.current_phase),
+        чтобы это отражалось в кабинете ведущего.
 
-            session.current_round = round_num
-            session.current_phase = phase_obj
-            session.save()
+        Запись отложенная: несколько смен фазы подряд дадут один UPDATE.
+        """
+        session_id = game.db_session_id
+        if not session_id:
+            return
 
-        try:
-            await sync_to_async(_do_update)()
-        except Exception as e:
-            self.stderr.write(
-                self.style.WARNING(f"Не удалось обновить фазу сессии в БД: {e}")
-            )
+        await self._reference_data()
+        await self.writer.update(
+            Session,
+            {
+                "current_round": game.round,
+                "current_phase_id": self._phase_id_for_code(phase_code),
+            },
+            id=session_id,
+        )
 
-    async def _set_player_dead(self, session_id: int, player_name: str, game: dict):
+    async def _set_player_dead(self, game: GameState, player):
         """
-        Помечаем игрока мёртвым в БД и фиксируем:
+        Помечаем игрока мёртвым в БД (по первичному ключу) и фиксируем:
         - fail_round  — текущий круг,
         - fail_phase  — фазу, на которой он выбыл.
         """
-        if not session_id or not player_name:
+        if not player.db_id:
             return
 
-        round_num = game.get("round", 1)
-        phase_code = game.get("phase")
-
-        def _do_update():
-            # определяем объект Phase по коду фазы бота
-            phases = list(Phase.objects.order_by("order"))
-            phase_obj = None
-            if phases:
-                if phase_code == self.PHASE_NIGHT:
-                    phase_obj = phases[0]
-                elif phase_code == self.PHASE_DAY and len(phases) >= 2:
-                    phase_obj = phases[1]
-                elif phase_code == self.PHASE_VOTE and len(phases) >= 3:
-                    phase_obj = phases[2]
-                else:
-                    phase_obj = phases[0]
-
-            update_kwargs = {
+        await self._reference_data()
+        await self.writer.update(
+            Player,
+            {
                 "status": Player.PlayerStatus.DEAD,
-                "fail_round": round_num,
-            }
-            if phase_obj:
-                update_kwargs["fail_phase"] = phase_obj
-
-            Player.objects.filter(
-                session_id=session_id,
-                name=player_name,
-            ).update(**update_kwargs)
-
-        try:
-            await sync_to_async(_do_update)()
-        except Exception as e:
-            self.stderr.write(
-                self.style.WARNING(
-                    f"Не удалось обновить Player в БД (смерть игрока): {e}"
-                )
-            )
-
+                "fail_round": game.round,
+                "fail_phase_id": self._phase_id_for_code(game.phase),
+            },
+            id=player.db_id,
+        )
 
-    async def _finish_session_in_db(self, game: dict):
+    async def _finish_session_in_db(self, game: GameState):
         """
         Создать Result и пометить Session как завершенную,
         используя winner_side / mafia_alive / town_alive из game.
         """
-        session_id = game.get("db_session_id")
-        winner = game.get("winner_side")
+        session_id = game.db_session_id
+        winner = game.winner_side
         if not session_id or not winner:
             return
 
-        mafia_alive = game.get("mafia_alive", 0)
-        town_alive = game.get("town_alive", 0)
-        round_num = game.get("round", 1)
-
-        def _finish():
-            try:
-                session = Session.objects.select_related("result").get(id=session_id)
-            except Session.DoesNotExist:
-                return
+        mafia_alive = game.mafia_alive
+        town_alive = game.town_alive
+        round_num = game.round
 
-            # Если результат уже существует — просто доводим статус
-            if hasattr(session, "result"):
-                if session.status != Session.Status.FINISHED:
-                    session.status = Session.Status.FINISHED
-                    if not session.finished_at:
-                        session.finished_at = timezone.now()
-                    session.save()
-                return
+        winner_side = (
+            Result.WinnerSide.MAFIA if winner == "mafia" else Result.WinnerSide.TOWN
+        )
 
-            winner_side = (
-                Result.WinnerSide.MAFIA if winner == "mafia" else Result.WinnerSide.TOWN
-            )
+        await self.writer.update(
+            Session,
+            {
+                "status": Session.Status.FINISHED,
+                "current_round": round_num,
+                "finished_at": timezone.now(),
+            },
+            id=session_id,
+        )
 
-            Result.objects.create(
-                session=session,
-                winner_side=winner_side,
-                rounds_count=round_num,
-                mafia_count=mafia_alive,
-                town_count=town_alive,
+        def _create_result():
+            # результат мог уже появиться (например, с сайта)
+            Result.objects.get_or_create(
+                session_id=session_id,
+                defaults={
+                    "winner_side": winner_side,
+                    "rounds_count": round_num,
+                    "mafia_count": mafia_alive,
+                    "town_count": town_alive,
+                },
             )
 
-            session.status = Session.Status.FINISHED
-            session.current_round = round_num
-            session.finished_at = timezone.now()
-            session.save()
-
-        try:
-            await sync_to_async(_finish)()
-        except Exception as e:
-            self.stderr.write(
-                self.style.WARNING(f"Не удалось сохранить результат в БД: {e}")
-            )
+        await self.writer.call(_create_result, models=(Result,))
 
-    async def _handle_players_input(self, game: dict, raw_text: str, update: Update):
+    async def _handle_players_input(self, game: GameState, raw_text: str, update: Update):
         """
         Разбор произвольного текста с именами игроков и добавление их в игру.
         Можно через запятую, с новой строки или всё вместе.
@@ -604,88 +1904,78 @@ class Command(BaseCommand):
         if not update.message:
             return
 
-        if game.get("phase") == self.PHASE_FINISHED:
-            await update.message.reply_text(
+        if game.phase == self.PHASE_FINISHED:
+            await self._reply(
+                update,
                 "Игра уже завершена. Запусти /startgame N, чтобы начать новую.",
                 reply_markup=self._control_keyboard(game),
             )
             return
 
-        if game.get("roles_mode"):
-            await update.message.reply_text(
+        if game.roles_mode:
+            await self._reply(
+                update,
                 "Роли уже выбраны, добавить новых игроков нельзя.",
                 reply_markup=self._control_keyboard(game),
             )
             return
 
         # Если уже всё набрали — сразу выходим
-        if len(game["players"]) >= game["planned_players"]:
-            game["adding_players"] = False
-            await update.message.reply_text(
+        if len(game.players) >= game.planned_players:
+            game.adding_players = False
+            await self._reply(
+                update,
                 "Уже добавлено запланированное количество игроков.",
                 reply_markup=self._control_keyboard(game),
             )
             return
 
-        # Приводим к формату "имена через запятую"
-        normalized = raw_text.replace("\n", ",")
-        names = [name.strip() for name in normalized.split(",") if name.strip()]
+        # Имена через запятую или с новой строки
+        names = split_player_names(raw_text)
 
         if not names:
-            await update.message.reply_text(
+            await self._reply(
+                update,
                 "Не нашлись имена в этом сообщении. Напиши игроков через запятую "
                 "или с новой строки.",
                 reply_markup=self._control_keyboard(game),
             )
             return
 
-        added: list[str] = []
-        skipped_existing: list[str] = []
-        skipped_full = False
+        # Проверяем лимит и дубликаты сразу для всего списка — в памяти
+        added, skipped_existing, skipped_full = select_new_player_names(
+            names,
+            (p.name for p in game.players),
+            game.planned_players - len(game.players),
+        )
+
+        new_players = [game.add_player(name) for name in added]
 
-        # Session для создания Player
-        session_id = game.get("db_session_id")
-        session = None
-        if session_id:
+        # Весь список — в БД одним bulk_create
+        session_id = game.db_session_id
+        if session_id and added:
             try:
-                session = await sync_to_async(Session.objects.get)(id=session_id)
+                created = await self.db.query(
+                    Player.objects.abulk_create(build_players(session_id, added))
+                )
+                for player, obj in zip(new_players, created):
+                    player.db_id = obj.pk
             except Exception as e:
                 self.stderr.write(
-                    self.style.WARNING(f"Не удалось получить Session из БД: {e}")
+                    self.style.WARNING(f"Не удалось создать игроков в БД: {e}")
                 )
 
-        for name in names:
-            # Проверка на лимит игроков
-            if len(game["players"]) >= game["planned_players"]:
-                skipped_full = True
-                break
-
-            # Проверка на дубликат
-            if self._find_player(game, name):
-                skipped_existing.append(name)
-                continue
-
-            # Добавляем во внутреннее состояние
-            game["players"].append(
-                {"name": name, "role": None, "alive": True}
+        if added:
+            await self._record_events(
+                game,
+                [(
+                    GameEvent.Kind.PLAYERS_ADDED,
+                    {"names": added, "ids": [p.db_id for p in new_players]},
+                )],
             )
-            added.append(name)
-
-            # Добавляем в БД, если есть Session
-            if session:
-                try:
-                    await sync_to_async(Player.objects.create)(
-                        session=session,
-                        name=name,
-                        status=Player.PlayerStatus.ALIVE,
-                    )
-                except Exception as e:
-                    self.stderr.write(
-                        self.style.WARNING(f"Не удалось создать Player в БД: {e}")
-                    )
 
-        total = len(game["players"])
-        planned = game["planned_players"]
+        total = len(game.players)
+        planned = game.planned_players
 
         lines: list[str] = []
 
@@ -716,9 +2006,10 @@ class Command(BaseCommand):
                 "  /assign cards — роли уже выданы по карточкам, бот их не знает."
             )
             # выключаем режим добора
-            game["adding_players"] = False
+            game.adding_players = False
 
-        await update.message.reply_text(
+        await self._reply(
+            update,
             "\n".join(lines),
             reply_markup=self._control_keyboard(game),
         )
@@ -748,14 +2039,24 @@ class Command(BaseCommand):
             "На голосовании:\n"
             "  /lynch — исключить игрока по кнопке\n"
             "  /lynch Имя — исключить игрока по имени\n"
+            "\n"
+            "Игрокам: /join Имя в чате партии — и роль придёт сюда, в личные сообщения.\n"
         )
         if update.message:
             game = self._get_game(update)
-            await update.message.reply_text(
+            await self._reply(
+                update,
                 text,
                 reply_markup=self._control_keyboard(game),
             )
 
+            # игрок впервые написал боту — отправляем роли, которые не дошли раньше
+            user = update.effective_user
+            if update.effective_chat.type == Chat.PRIVATE and user is not None:
+                failed = self._failed_dms.pop(user.id, None)
+                if failed:
+                    self.roles_dm.submit(update.get_bot(), failed)
+
     async def help_cmd(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
         /help — подробный список команд.
@@ -774,9 +2075,14 @@ class Command(BaseCommand):
             " /players — список всех игроков\n"
             " /assign random — раздать роли случайно\n"
             " /assign cards — роли по карточкам (бот их не знает)\n"
+            " /join Имя — игрок привязывает свой Telegram к месту (ведущий подтверждает) и получает роль в личку\n"
+            " /roles — кому роль дошла в личку, /roles resend — отправить недоставленные\n"
             "\n"
             "Ход игры:\n"
             " /next — переход по фазам (Ночь → День → Голосование → следующая Ночь)\n"
+            " /timer — таймер дня (речи и обсуждение, если включены): сколько осталось\n"
+            " /timer skip — следующий игрок / конец обсуждения, /timer stop — остановить,\n"
+            "    /timer start — запустить заново\n"
             "\n"
             "Ночь:\n"
             " /check — выбрать игрока для проверки кнопкой\n"
@@ -793,38 +2099,46 @@ class Command(BaseCommand):
             "Сброс текущей партии:\n"
             " /reset — сбросить игру в этом чате и пометить сессию как сброшенную.\n"
             "\n"
+            "Несколько столов в одном чате:\n"
+            " /startgame 10 #2 — партия за вторым столом\n"
+            " /table — столы чата, /table 2 — мои команды идут ко второму столу\n"
+            " #N в любой команде — к какому столу она относится: /next #2, /kill #2\n"
+            "\n"
             "Автор: Казарина Алёна Алексеевна\n"
         )
         if update.message:
             game = self._get_game(update)
-            await update.message.reply_text(
+            await self._reply(
+                update,
                 text,
                 reply_markup=self._control_keyboard(game),
             )
 
     async def startgame_cmd(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
-        /startgame N [classic|sport] — создать новую игру в чате.
+        /startgame N [classic|sport] [#стол] — создать новую игру в чате.
 
         Здесь:
-        - создаём/обновляем состояние в self.games[chat_id];
+        - создаём/обновляем состояние в self.games[chat_id, стол];
         - создаём Session в БД, чтобы её было видно на сайте.
         """
         chat_id = self._get_chat_id(update)
         if chat_id is None or not update.message:
             return
+        table = self._table_of(update)
 
         # читаем аргументы: число игроков и (опционально) режим
         planned = 10
         game_mode = self.GAME_MODE_CLASSIC  # по умолчанию
 
-        args = context.args or []
+        args = self._args(context)
 
         if len(args) >= 1:
             try:
                 planned = int(args[0])
             except ValueError:
-                await update.message.reply_text(
+                await self._reply(
+                    update,
                     "Нужно указать количество игроков числом.\n\n"
                     "Пример: /startgame 10\n"
                     "или: /startgame 10 sport",
@@ -834,7 +2148,8 @@ class Command(BaseCommand):
 
         # жёсткий глобальный максимум для бота
         if planned > self.MAX_PLAYERS:
-            await update.message.reply_text(
+            await self._reply(
+                update,
                 f"Максимум игроков в одной партии — {self.MAX_PLAYERS}.\n"
                 f"Сейчас указано: {planned}.",
                 reply_markup=self._control_keyboard(self._get_game(update)),
@@ -849,7 +2164,8 @@ class Command(BaseCommand):
             elif mode_raw in ("sport", "спорт", "спортивная"):
                 game_mode = self.GAME_MODE_SPORT
             else:
-                await update.message.reply_text(
+                await self._reply(
+                    update,
                     "Неизвестный режим.\n"
                     "Используй classic или sport.\n"
                     "Например: /startgame 10 classic",
@@ -866,7 +2182,8 @@ class Command(BaseCommand):
                 game_mode = self.GAME_MODE_CLASSIC
 
         if planned < 6:
-            await update.message.reply_text(
+            await self._reply(
+                update,
                 "Минимум игроков — 6. Попробуй ещё раз.\n"
                 "Например: /startgame 10",
                 reply_markup=self._control_keyboard(self._get_game(update)),
@@ -879,7 +2196,9 @@ class Command(BaseCommand):
         try:
             host_id = getattr(settings, "TG_BOT_HOST_USER_ID", None)
             if host_id is not None:
-                host_user = await sync_to_async(User.objects.get)(id=host_id)
+                # ведущий и режимы — из кэша справочников, без запросов к БД
+                refs = await self._reference_data()
+                host_user = refs.user(host_id)
 
                 sport_mode_id = getattr(settings, "TG_BOT_MODE_SPORT_ID", None)
                 classic_mode_id = getattr(settings, "TG_BOT_MODE_CLASSIC_ID", None)
@@ -887,15 +2206,13 @@ class Command(BaseCommand):
                 mode_obj = None
 
                 if game_mode == self.GAME_MODE_SPORT and sport_mode_id:
-                    mode_obj = await sync_to_async(Mode.objects.get)(id=sport_mode_id)
+                    mode_obj = refs.mode(sport_mode_id)
                 elif game_mode == self.GAME_MODE_CLASSIC and classic_mode_id:
-                    mode_obj = await sync_to_async(Mode.objects.get)(
-                        id=classic_mode_id
-                    )
+                    mode_obj = refs.mode(classic_mode_id)
 
                 if mode_obj is None:
                     # запасной вариант: берём первый попавшийся режим
-                    mode_obj = await sync_to_async(Mode.objects.first)()
+                    mode_obj = refs.first_mode()
 
                 # Проверяем players_count против min/max режима
                 if mode_obj:
@@ -903,7 +2220,8 @@ class Command(BaseCommand):
                     max_p = mode_obj.max_players
 
                     if planned < min_p or planned > max_p:
-                        await update.message.reply_text(
+                        await self._reply(
+                            update,
                             f"Для режима «{mode_obj.name}» нужно от {min_p} до {max_p} игроков.\n"
                             f"Сейчас указано: {planned}.",
                             reply_markup=self._control_keyboard(self._get_game(update)),
@@ -911,12 +2229,14 @@ class Command(BaseCommand):
                         return
 
                 if mode_obj and host_user:
-                    session = await sync_to_async(Session.objects.create)(
+                    session = await self.db.query(Session.objects.acreate(
                         mode=mode_obj,
                         host=host_user,
                         status=Session.Status.PLANNED,
                         players_count=planned,
-                    )
+                        tg_chat_id=chat_id,
+                        tg_table=table,
+                    ))
                     db_session_id = session.id
                     extra_line = (
                         f"Эта партия сохранена как сессия #{session.id} на сайте.\n"
@@ -934,27 +2254,28 @@ class Command(BaseCommand):
         )
 
         # Запоминаем состояние игры в памяти
-        game = {
-            "planned_players": planned,
-            "players": [],
-            "roles_assigned": False,
-            "roles_mode": None,  # 'random' или 'cards'
-            "phase": None,       # night/day/vote/finished
-            "round": 0,
-            "pending_kill": None,
-            "pending_heal": None,
-            "pending_check": None,
-            "last_night_killed": None,
-            "db_session_id": db_session_id,
-            "game_mode": game_mode,
-            "adding_players": False,
-            "winner_side": None,
-            "mafia_alive": 0,
-            "town_alive": 0,
-        }
-        self.games[chat_id] = game
+        user = update.effective_user
+        game = self._new_game(planned, game_mode, db_session_id)
+        game.table = table
+        game.host_id = user.id if user is not None else None
+        self.games[chat_id, table] = game
+        # панель и таймер прошлой партии этого стола больше не нужны
+        self._panels.pop((chat_id, table), None)
+        await self._cancel_timer(chat_id, table)
+        # ведущий нового стола дальше пишет ему без #N
+        if user is not None and len(self.games.tables(chat_id)) > 1:
+            self._user_tables.setdefault(chat_id, {})[user.id] = table
+
+        await self._record_events(
+            game,
+            [(
+                GameEvent.Kind.STARTED,
+                {"planned_players": planned, "game_mode": game_mode, "host_id": game.host_id},
+            )],
+        )
 
-        await update.message.reply_text(
+        await self._reply(
+            update,
             f"Создана новая игра в этом чате.\n"
             f"Запланировано игроков: {planned}.\n"
             f"Режим: {mode_human}.\n"
@@ -977,22 +2298,25 @@ class Command(BaseCommand):
         if not game or not update.message:
             return
 
-        if game.get("phase") == self.PHASE_FINISHED:
-            await update.message.reply_text(
+        if game.phase == self.PHASE_FINISHED:
+            await self._reply(
+                update,
                 "Игра уже завершена. Запусти /startgame N, чтобы начать новую.",
                 reply_markup=self._control_keyboard(game),
             )
             return
 
-        if game.get("roles_mode"):
-            await update.message.reply_text(
+        if game.roles_mode:
+            await self._reply(
+                update,
                 "Роли уже выбраны, добавить новых игроков нельзя.",
                 reply_markup=self._control_keyboard(game),
             )
             return
 
-        if len(game["players"]) >= game["planned_players"]:
-            await update.message.reply_text(
+        if len(game.players) >= game.planned_players:
+            await self._reply(
+                update,
                 "Уже добавлено запланированное количество игроков.\n"
                 "Если нужно начать заново, используй /startgame N.",
                 reply_markup=self._control_keyboard(game),
@@ -1000,16 +2324,20 @@ class Command(BaseCommand):
             return
 
         # Если в команде есть аргументы — обрабатываем их как список имён сразу
-        if context.args:
-            raw = " ".join(context.args)
+        if self._args(context):
+            raw = " ".join(self._args(context))
             await self._handle_players_input(game, raw, update)
             return
 
-        # Иначе включаем режим добавления игроков
-        game["adding_players"] = True
-        remaining = game["planned_players"] - len(game["players"])
+        # Иначе включаем режим добавления игроков. Событием он не пишется —
+        # пишем снимок, чтобы режим пережил перезапуск бота
+        if not game.adding_players:
+            game.adding_players = True
+            await self._record_events(game, [], snapshot=True)
+        remaining = game.planned_players - len(game.players)
 
-        await update.message.reply_text(
+        await self._reply(
+            update,
             "Режим добавления игроков включён.\n"
             "Теперь отправляй имена игроков:\n"
             " • списком через запятую:  Аня, Ваня, Петя\n"
@@ -1031,25 +2359,27 @@ class Command(BaseCommand):
         if not game or not update.message:
             return
 
-        players = game["players"]
+        players = game.players
         if not players:
-            await update.message.reply_text(
+            await self._reply(
+                update,
                 "Пока игроков нет. Добавь их: /addplayer",
                 reply_markup=self._control_keyboard(game),
             )
             return
 
-        show_roles = game.get("roles_assigned", False)
+        show_roles = game.roles_assigned
         lines = []
         for idx, p in enumerate(players, start=1):
-            status = "в игре" if p["alive"] else "выбыл"
+            status = "в игре" if game.is_alive(p) else "выбыл"
             if show_roles:
-                role_ru = self._format_role_ru(p["role"])
-                lines.append(f"{idx}. {p['name']} — {role_ru}, {status}")
+                role_ru = self._format_role_ru(p.role)
+                lines.append(f"{idx}. {p.name} — {role_ru}, {status}")
             else:
-                lines.append(f"{idx}. {p['name']} — {status}")
+                lines.append(f"{idx}. {p.name} — {status}")
 
-        await update.message.reply_text(
+        await self._reply(
+            update,
             "Игроки:\n" + "\n".join(lines),
             reply_markup=self._control_keyboard(game),
         )
@@ -1062,23 +2392,26 @@ class Command(BaseCommand):
         if not game or not update.message:
             return
 
-        if game.get("phase") == self.PHASE_FINISHED:
-            await update.message.reply_text(
+        if game.phase == self.PHASE_FINISHED:
+            await self._reply(
+                update,
                 "Игра уже завершена. Запусти /startgame N, чтобы начать новую.",
                 reply_markup=self._control_keyboard(game),
             )
             return
 
-        if len(game["players"]) != game["planned_players"]:
-            await update.message.reply_text(
+        if len(game.players) != game.planned_players:
+            await self._reply(
+                update,
                 "Сначала добавь всех запланированных игроков.\n"
                 "Потом можно выдавать роли.",
                 reply_markup=self._control_keyboard(game),
             )
             return
 
-        if not context.args:
-            await update.message.reply_text(
+        if not self._args(context):
+            await self._reply(
+                update,
                 "Укажи режим: random или cards.\n\n"
                 "Примеры:\n"
                 "  /assign random\n"
@@ -1087,51 +2420,63 @@ class Command(BaseCommand):
             )
             return
 
-        mode = context.args[0].lower()
+        mode = self._args(context)[0].lower()
         if mode not in ("random", "cards"):
-            await update.message.reply_text(
+            await self._reply(
+                update,
                 "Неизвестный режим. Используй:\n"
                 "  /assign random  — роли раздаёт бот\n"
                 "  /assign cards   — роли выданы по карточкам (бот их не знает)",
             )
             return
 
-        game["roles_mode"] = mode
+        game.roles_mode = mode
 
         # Обновить статус Session в БД (перевести в ACTIVE)
-        session_id = game.get("db_session_id")
+        session_id = game.db_session_id
         if session_id:
-            try:
-                def _activate():
-                    session = Session.objects.get(id=session_id)
-                    session.status = Session.Status.ACTIVE
-                    session.save()
-                await sync_to_async(_activate)()
-            except Exception as e:
-                self.stderr.write(
-                    self.style.WARNING(f"Не удалось обновить статус Session: {e}")
-                )
+            await self.writer.update(
+                Session, {"status": Session.Status.ACTIVE}, id=session_id
+            )
 
         if mode == "random":
             # раздаём роли и начинаем первую ночь
             self._assign_roles_random(game)
-            game["phase"] = self.PHASE_NIGHT
-            game["round"] = 1
+            game.phase = self.PHASE_NIGHT
+            game.round = 1
 
             # синхронизируем роли в БД
             await self._sync_roles_to_db(game)
 
+            await self._record_events(
+                game,
+                [
+                    (
+                        GameEvent.Kind.ROLES_ASSIGNED,
+                        {"mode": mode, "roles": [ROLE_NAMES[p.role] for p in game.players]},
+                    ),
+                    (GameEvent.Kind.PHASE, {"phase": self.PHASE_NIGHT, "round": 1}),
+                ],
+            )
+
             # показываем ведущему роли
             lines = ["Роли выданы случайно (НЕ показывай этот список игрокам):", ""]
-            for p in game["players"]:
-                role_ru = self._format_role_ru(p["role"])
-                lines.append(f" - {p['name']}: {role_ru}")
+            for p in game.players:
+                role_ru = self._format_role_ru(p.role)
+                lines.append(f" - {p.name}: {role_ru}")
 
             lines.append("")
+            sent = self._deliver_roles(update, game)
+            if sent:
+                lines.append(
+                    f"Роли отправлены в личку игрокам, которые привязались через /join: {sent}. "
+                    "Кому дошло — /roles."
+                )
             lines.append("Игра начинается с ночи.")
 
             # 1) список ролей
-            await update.message.reply_text(
+            await self._reply(
+                update,
                 "\n".join(lines),
                 reply_markup=self._control_keyboard(game),
             )
@@ -1140,26 +2485,182 @@ class Command(BaseCommand):
             await self._update_session_phase(game, self.PHASE_NIGHT)
 
             # 2) сразу даём подробные подсказки для НОЧИ (круг 1)
-            await update.message.reply_text(
-                self._night_instructions_text(game),
-                reply_markup=self._control_keyboard(game),
-            )
+            await self._show_phase(update, game, self._night_instructions_text(game))
 
         else:  # cards
             # В режиме "карточки" бот не знает ролей, но всё равно ведёт фазы.
-            game["roles_assigned"] = False
-            game["phase"] = self.PHASE_NIGHT
-            game["round"] = 1
+            game.roles_assigned = False
+            game.phase = self.PHASE_NIGHT
+            game.round = 1
 
             await self._update_session_phase(game, self.PHASE_NIGHT)
+            await self._record_events(
+                game,
+                [
+                    (GameEvent.Kind.ROLES_ASSIGNED, {"mode": mode}),
+                    (GameEvent.Kind.PHASE, {"phase": self.PHASE_NIGHT, "round": 1}),
+                ],
+            )
 
-            await update.message.reply_text(
+            await self._reply(
+                update,
                 "Режим «карточки»: роли уже выданы офлайн, бот их не знает.\n"
                 "Игра начинается с ночи.\n\n"
                 "Для подсказок ночью напиши: /next",
                 reply_markup=self._control_keyboard(game),
             )
 
+    async def join_cmd(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """
+        /join Имя — игрок привязывает свой Telegram к месту за столом,
+        чтобы получить роль в личные сообщения.
+
+        Место привязывается только после подтверждения ведущего (кнопкой
+        под запросом): иначе любой участник чата мог бы занять чужое место
+        и получить чужую роль. Ведущий (и администраторы бота) привязывают
+        себя сразу.
+        """
+        game = await self._ensure_game(update)
+        user = update.effective_user
+        if not game or not update.message or user is None:
+            return
+
+        if not self._args(context):
+            await self._reply(update, "Напиши своё имя в партии: /join Имя")
+            return
+
+        name = " ".join(self._args(context))
+        player = self._find_player(game, name)
+        if player is None:
+            await self._reply(
+                update,
+                f"Игрока «{name}» нет в списке. Список игроков: /players",
+            )
+            return
+        if player.tg_user_id not in (None, user.id):
+            await self._reply(update, f"Место «{player.name}» уже занято другим игроком.")
+            return
+
+        if self._is_game_host(game, user.id):
+            await self._reply(update, await self._confirm_link(update, game, player, user.id))
+            return
+
+        keyboard = InlineKeyboardMarkup([[
+            InlineKeyboardButton(
+                "✅ Подтвердить", callback_data=f"join:{game.table}:{player.seat}:{user.id}"
+            ),
+            InlineKeyboardButton(
+                "✖ Отклонить", callback_data=f"nojoin:{game.table}:{player.seat}:{user.id}"
+            ),
+        ]])
+        await self._reply(
+            update,
+            f"{user.full_name} хочет занять место «{player.name}» и получить его роль "
+            "в личные сообщения. Ведущий, подтверди:",
+            reply_markup=keyboard,
+        )
+
+    def _is_game_host(self, game: GameState, user_id: int) -> bool:
+        """Ведущий партии (начал её) или администратор бота."""
+        return user_id == game.host_id or user_id in getattr(settings, "TG_BOT_ADMIN_IDS", ())
+
+    async def _confirm_link(self, update: Update, game: GameState, player, user_id: int) -> str:
+        """Привязать аккаунт user_id к месту player (с записью в БД и журнал) и отправить роль."""
+        player, previous = self._link_player(game, player.name, user_id)
+        if previous is not None and previous.db_id:
+            await self.writer.update(
+                Player, {"tg_user_id": None, "role_delivery": ""}, id=previous.db_id
+            )
+        if player.db_id:
+            await self.writer.update(Player, {"tg_user_id": user_id}, id=player.db_id)
+        await self._record_events(
+            game, [(GameEvent.Kind.LINKED, {"name": player.name, "user_id": user_id})]
+        )
+
+        if self._deliver_roles(update, game, [player]):
+            text = f"✅ Место «{player.name}» привязано. Роль отправлена в личные сообщения."
+        else:
+            text = (
+                f"✅ Место «{player.name}» привязано. "
+                "Когда бот раздаст роли, она придёт в личные сообщения."
+            )
+        return text + "\nЕсли игрок ещё не писал боту — пусть откроет с ним личный чат и нажмёт «Start»."
+
+    async def _join_decision(self, update: Update, query):
+        """Кнопка под запросом /join: ведущий подтверждает или отклоняет привязку."""
+        action, _, seat, user_id = query.data.split(":")
+        seat, user_id = int(seat), int(user_id)
+        game = self.games.get(self._game_key(update))
+        tapper = update.effective_user
+        if game is None or seat >= len(game.players):
+            await query.answer()
+            await query.edit_message_text("Партия уже закончилась или сброшена.")
+            return
+        if tapper is None or not self._is_game_host(game, tapper.id):
+            await query.answer("Подтвердить может только ведущий партии.", show_alert=True)
+            return
+
+        await query.answer()
+        player = game.players[seat]
+        if action == "nojoin":
+            await query.edit_message_text(f"✖ Ведущий не подтвердил место «{player.name}».")
+            return
+        if player.tg_user_id not in (None, user_id):
+            await query.edit_message_text(f"Место «{player.name}» уже занято другим игроком.")
+            return
+        await query.edit_message_text(await self._confirm_link(update, game, player, user_id))
+
+    async def roles_cmd(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """
+        /roles — кому из игроков роль дошла в личку.
+        /roles resend — отправить заново всем, кому не дошла.
+        """
+        game = await self._ensure_game(update)
+        if not game or not update.message:
+            return
+
+        if not (game.roles_mode == "random" and game.roles_assigned):
+            await self._reply(
+                update,
+                "Бот знает роли только после /assign random.",
+                reply_markup=self._control_keyboard(game),
+            )
+            return
+
+        if self._args(context) and self._args(context)[0].lower() == "resend":
+            players = [
+                p for p in game.players
+                if p.tg_user_id is not None and p.role_dm != RoleDelivery.SENT
+            ]
+            count = self._deliver_roles(update, game, players)
+            await self._reply(
+                update,
+                f"Отправляю роли заново: {count}."
+                if count
+                else "Всем привязанным игрокам роли уже доставлены.",
+            )
+            return
+
+        marks = {
+            None: "—",
+            "pending": "⏳ отправляется",
+            RoleDelivery.SENT: "✅ доставлена",
+            RoleDelivery.FAILED: "❌ не доставлена",
+        }
+        lines = ["Роли в личные сообщения:", ""]
+        for p in game.players:
+            if p.tg_user_id is None:
+                lines.append(f" - {p.name}: не привязан (/join {p.name})")
+            else:
+                lines.append(f" - {p.name}: {marks.get(p.role_dm, '—')}")
+        if any(p.role_dm == RoleDelivery.FAILED for p in game.players):
+            lines.append("")
+            lines.append(
+                "Не доставлено, если игрок ещё не писал боту. Пусть откроет личный чат "
+                "с ботом и нажмёт «Start» — роль придёт сама. Или: /roles resend"
+            )
+        await self._reply(update, "\n".join(lines))
+
     async def check_cmd(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
         /check [Имя] — проверка комиссаром.
@@ -1173,32 +2674,35 @@ class Command(BaseCommand):
         if not game or not update.message:
             return
 
-        if game.get("phase") == self.PHASE_FINISHED:
-            await update.message.reply_text(
+        if game.phase == self.PHASE_FINISHED:
+            await self._reply(
+                update,
                 "Игра уже завершена. Запусти /startgame N, чтобы начать новую.",
                 reply_markup=self._control_keyboard(game),
             )
             return
 
-        if game["phase"] != self.PHASE_NIGHT:
-            await update.message.reply_text(
+        if game.phase != self.PHASE_NIGHT:
+            await self._reply(
+                update,
                 "Проверять можно только ночью.",
                 reply_markup=self._control_keyboard(game),
             )
             return
 
-        if not game.get("roles_mode") == "random" or not game.get("roles_assigned"):
-            await update.message.reply_text(
+        if not game.roles_mode == "random" or not game.roles_assigned:
+            await self._reply(
+                update,
                 "В режиме карточек бот не знает ролей игроков.",
                 reply_markup=self._control_keyboard(game),
             )
             return
 
         # если имя не указано — показываем кнопки
-        if not context.args:
-            alive = self._alive_players(game)
-            if not alive:
-                await update.message.reply_text(
+        if not self._args(context):
+            if not self._alive_total(game):
+                await self._reply(
+                    update,
                     "Нет живых игроков для проверки.",
                     reply_markup=self._control_keyboard(game),
                 )
@@ -1207,39 +2711,53 @@ class Command(BaseCommand):
             keyboard = [
                 [
                     InlineKeyboardButton(
-                        p["name"],
-                        callback_data=f"check:{idx}",
+                        p.name,
+                        callback_data=f"check:{game.table}:{idx}",
                     )
                 ]
-                for idx, p in enumerate(game["players"])
-                if p["alive"]
+                for idx, p in enumerate(game.players)
+                if game.is_alive(p)
             ]
             markup = InlineKeyboardMarkup(keyboard)
-            await update.message.reply_text(
-                "Кого проверяет комиссар?",
-                reply_markup=markup,
-            )
+            if not await self._refresh_panel(
+                update, game, prompt="Кого проверяет комиссар?", picker=markup
+            ):
+                await self._reply(
+                    update,
+                    "Кого проверяет комиссар?",
+                    reply_markup=markup,
+                )
             return
 
         # /check Имя
-        name = " ".join(context.args).strip()
+        name = " ".join(self._args(context)).strip()
         player = self._find_player(game, name)
         if not player:
-            await update.message.reply_text(
+            await self._reply(
+                update,
                 f"Игрок «{name}» не найден.",
                 reply_markup=self._control_keyboard(game),
             )
             return
 
-        role_ru = self._format_role_ru(player["role"])
-        game["pending_check"] = player["name"]
-
-        await update.message.reply_text(
-            f"Комиссар проверяет игрока: {player['name']}.\n"
-            f"Роль этого игрока: {role_ru}.",
-            reply_markup=self._control_keyboard(game),
+        role_ru = self._format_role_ru(player.role)
+        game.pending_check = player.name
+        await self._record_events(
+            game,
+            [(
+                GameEvent.Kind.NIGHT_CHOICE,
+                {"action": "check", "name": player.name},
+            )],
         )
 
+        if not await self._refresh_panel(update, game):
+            await self._reply(
+                update,
+                f"Комиссар проверяет игрока: {player.name}.\n"
+                f"Роль этого игрока: {role_ru}.",
+                reply_markup=self._control_keyboard(game),
+            )
+
     async def kill_cmd(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
         /kill [Имя] — выбор жертвы мафии.
@@ -1252,25 +2770,27 @@ class Command(BaseCommand):
         if not game or not update.message:
             return
 
-        if game.get("phase") == self.PHASE_FINISHED:
-            await update.message.reply_text(
+        if game.phase == self.PHASE_FINISHED:
+            await self._reply(
+                update,
                 "Игра уже завершена. Запусти /startgame N, чтобы начать новую.",
                 reply_markup=self._control_keyboard(game),
             )
             return
 
-        if game["phase"] != self.PHASE_NIGHT:
-            await update.message.reply_text(
+        if game.phase != self.PHASE_NIGHT:
+            await self._reply(
+                update,
                 "Жертву мафии можно выбирать только ночью.",
                 reply_markup=self._control_keyboard(game),
             )
             return
 
         # Если имя не указано — показать кнопки с живыми игроками
-        if not context.args:
-            alive = self._alive_players(game)
-            if not alive:
-                await update.message.reply_text(
+        if not self._args(context):
+            if not self._alive_total(game):
+                await self._reply(
+                    update,
                     "Все игроки уже выбыли 🙂",
                     reply_markup=self._control_keyboard(game),
                 )
@@ -1279,46 +2799,61 @@ class Command(BaseCommand):
             keyboard = [
                 [
                     InlineKeyboardButton(
-                        p["name"],
-                        callback_data=f"kill:{idx}",
+                        p.name,
+                        callback_data=f"kill:{game.table}:{idx}",
                     )
                 ]
-                for idx, p in enumerate(game["players"])
-                if p["alive"]
+                for idx, p in enumerate(game.players)
+                if game.is_alive(p)
             ]
             markup = InlineKeyboardMarkup(keyboard)
-            await update.message.reply_text(
-                "Выбери жертву мафии:",
-                reply_markup=markup,
-            )
+            if not await self._refresh_panel(
+                update, game, prompt="Выбери жертву мафии:", picker=markup
+            ):
+                await self._reply(
+                    update,
+                    "Выбери жертву мафии:",
+                    reply_markup=markup,
+                )
             return
 
         # Вариант: /kill Имя
-        name = " ".join(context.args).strip()
+        name = " ".join(self._args(context)).strip()
         player = self._find_player(game, name)
         if not player:
-            await update.message.reply_text(
+            await self._reply(
+                update,
                 f"Игрок «{name}» не найден.",
                 reply_markup=self._control_keyboard(game),
             )
             return
 
-        if not player["alive"]:
-            await update.message.reply_text(
-                f"Игрок «{player['name']}» уже выбыл.",
+        if not game.is_alive(player):
+            await self._reply(
+                update,
+                f"Игрок «{player.name}» уже выбыл.",
                 reply_markup=self._control_keyboard(game),
             )
             return
 
-        game["pending_kill"] = player["name"]
-
-        await update.message.reply_text(
-            f"Мафия выбрала жертву: {player['name']}.\n"
-            "Если нужно изменить выбор — просто вызови /kill ещё раз с другим именем "
-            "или выбери другого игрока через кнопки.",
-            reply_markup=self._control_keyboard(game),
+        game.pending_kill = player.name
+        await self._record_events(
+            game,
+            [(
+                GameEvent.Kind.NIGHT_CHOICE,
+                {"action": "kill", "name": player.name},
+            )],
         )
 
+        if not await self._refresh_panel(update, game):
+            await self._reply(
+                update,
+                f"Мафия выбрала жертву: {player.name}.\n"
+                "Если нужно изменить выбор — просто вызови /kill ещё раз с другим именем "
+                "или выбери другого игрока через кнопки.",
+                reply_markup=self._control_keyboard(game),
+            )
+
     async def heal_cmd(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
         /heal [Имя] — выбор лечения доктора.
@@ -1332,33 +2867,36 @@ class Command(BaseCommand):
             return
 
         # В спортивной мафии доктора нет
-        game_mode = game.get("game_mode") or self.GAME_MODE_CLASSIC
+        game_mode = game.game_mode or self.GAME_MODE_CLASSIC
         if game_mode == self.GAME_MODE_SPORT:
-            await update.message.reply_text(
+            await self._reply(
+                update,
                 "В спортивной мафии доктор не используется, команда /heal недоступна.",
                 reply_markup=self._control_keyboard(game),
             )
             return
 
-        if game.get("phase") == self.PHASE_FINISHED:
-            await update.message.reply_text(
+        if game.phase == self.PHASE_FINISHED:
+            await self._reply(
+                update,
                 "Игра уже завершена. Запусти /startgame N, чтобы начать новую.",
                 reply_markup=self._control_keyboard(game),
             )
             return
 
-        if game["phase"] != self.PHASE_NIGHT:
-            await update.message.reply_text(
+        if game.phase != self.PHASE_NIGHT:
+            await self._reply(
+                update,
                 "Доктор лечит только ночью.",
                 reply_markup=self._control_keyboard(game),
             )
             return
 
         # нет аргумента — показываем кнопки
-        if not context.args:
-            alive = self._alive_players(game)
-            if not alive:
-                await update.message.reply_text(
+        if not self._args(context):
+            if not self._alive_total(game):
+                await self._reply(
+                    update,
                     "Нет живых игроков для лечения.",
                     reply_markup=self._control_keyboard(game),
                 )
@@ -1367,44 +2905,59 @@ class Command(BaseCommand):
             keyboard = [
                 [
                     InlineKeyboardButton(
-                        p["name"],
-                        callback_data=f"heal:{idx}",
+                        p.name,
+                        callback_data=f"heal:{game.table}:{idx}",
                     )
                 ]
-                for idx, p in enumerate(game["players"])
-                if p["alive"]
+                for idx, p in enumerate(game.players)
+                if game.is_alive(p)
             ]
             markup = InlineKeyboardMarkup(keyboard)
-            await update.message.reply_text(
-                "Кого лечит доктор?",
-                reply_markup=markup,
-            )
+            if not await self._refresh_panel(
+                update, game, prompt="Кого лечит доктор?", picker=markup
+            ):
+                await self._reply(
+                    update,
+                    "Кого лечит доктор?",
+                    reply_markup=markup,
+                )
             return
 
-        name = " ".join(context.args).strip()
+        name = " ".join(self._args(context)).strip()
         player = self._find_player(game, name)
         if not player:
-            await update.message.reply_text(
+            await self._reply(
+                update,
                 f"Игрок «{name}» не найден.",
                 reply_markup=self._control_keyboard(game),
             )
             return
 
-        if not player["alive"]:
-            await update.message.reply_text(
-                f"Игрок «{player['name']}» уже выбыл.",
+        if not game.is_alive(player):
+            await self._reply(
+                update,
+                f"Игрок «{player.name}» уже выбыл.",
                 reply_markup=self._control_keyboard(game),
             )
             return
 
-        game["pending_heal"] = player["name"]
-
-        await update.message.reply_text(
-            f"Доктор будет лечить игрока: {player['name']}.\n"
-            "Если нужно изменить выбор — вызови /heal ещё раз.",
-            reply_markup=self._control_keyboard(game),
+        game.pending_heal = player.name
+        await self._record_events(
+            game,
+            [(
+                GameEvent.Kind.NIGHT_CHOICE,
+                {"action": "heal", "name": player.name},
+            )],
         )
 
+        if not await self._refresh_panel(update, game):
+            await self._reply(
+                update,
+                f"Доктор будет лечить игрока: {player.name}.\n"
+                "Если нужно изменить выбор — вызови /heal ещё раз.",
+                reply_markup=self._control_keyboard(game),
+            )
+
     async def lynch_cmd(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
         /lynch [Имя] — исключить игрока по результатам голосования.
@@ -1417,86 +2970,348 @@ class Command(BaseCommand):
         if not game or not update.message:
             return
 
-        if game.get("phase") == self.PHASE_FINISHED:
-            await update.message.reply_text(
-                "Игра уже завершена. Запусти /startgame N, чтобы начать новую.",
-                reply_markup=self._control_keyboard(game),
-            )
-            return
-
-        if game["phase"] != self.PHASE_VOTE:
-            await update.message.reply_text(
-                "Исключать игрока голосованием можно только на стадии голосования.",
-                reply_markup=self._control_keyboard(game),
-            )
-            return
+        if game.phase == self.PHASE_FINISHED:
+            await self._reply(
+                update,
+                "Игра уже завершена. Запусти /startgame N, чтобы начать новую.",
+                reply_markup=self._control_keyboard(game),
+            )
+            return
+
+        if game.phase != self.PHASE_VOTE:
+            await self._reply(
+                update,
+                "Исключать игрока голосованием можно только на стадии голосования.",
+                reply_markup=self._control_keyboard(game),
+            )
+            return
+
+        # Нет имени — показываем кнопки
+        if not self._args(context):
+            if not self._alive_total(game):
+                await self._reply(
+                    update,
+                    "Все уже выбыли из игры 🙂",
+                    reply_markup=self._control_keyboard(game),
+                )
+                return
+
+            keyboard = [
+                [
+                    InlineKeyboardButton(
+                        p.name,
+                        callback_data=f"lynch:{game.table}:{idx}",
+                    )
+                ]
+                for idx, p in enumerate(game.players)
+                if game.is_alive(p)
+            ]
+            markup = InlineKeyboardMarkup(keyboard)
+            if not await self._refresh_panel(
+                update, game, prompt="Кого исключают по итогам голосования?", picker=markup
+            ):
+                await self._reply(
+                    update,
+                    "Кого исключают по итогам голосования?",
+                    reply_markup=markup,
+                )
+            return
+
+        name = " ".join(self._args(context)).strip()
+        player = self._find_player(game, name)
+        if not player:
+            await self._reply(
+                update,
+                f"Игрок «{name}» не найден.",
+                reply_markup=self._control_keyboard(game),
+            )
+            return
+
+        if not game.is_alive(player):
+            await self._reply(
+                update,
+                f"Игрок «{player.name}» уже выбыл.",
+                reply_markup=self._control_keyboard(game),
+            )
+            return
+
+        # помечаем игрока "выбыл"
+        game.kill(player)
+
+        # фиксируем смерть в БД с кругом/фазой
+        if game.db_session_id:
+            await self._set_player_dead(game, player)
+
+        lynched_text = f"По итогам голосования из игры выбывает: {player.name}."
+        if not await self._refresh_panel(
+            update, game, f"{self._phase_headline(game)}\n{lynched_text}"
+        ):
+            await self._reply(
+                update,
+                lynched_text,
+                reply_markup=self._control_keyboard(game),
+            )
+
+        # Проверяем победу после голосования
+        win_text = self._check_win_and_build_message(game)
+
+        events = [(GameEvent.Kind.LYNCH, {"name": player.name})]
+        if win_text:
+            events.append(self._finished_event(game))
+        await self._record_events(game, events)
+
+        if win_text and update.message:
+            # сохраняем результат в БД
+            await self._finish_session_in_db(game)
+
+            await self._announce_win(update, game, win_text)
+
+    # Таймеры дня
+
+    def _timer_seconds(self, game: GameState, kind: str) -> int:
+        """Длительность речи / обсуждения для режима партии (0 — таймер выключен)."""
+        setting = (
+            "TG_BOT_SPEECH_SECONDS"
+            if kind == PhaseTimer.Kind.SPEECH
+            else "TG_BOT_DISCUSSION_SECONDS"
+        )
+        seconds = getattr(settings, setting, {})
+        return seconds.get(game.game_mode or self.GAME_MODE_CLASSIC, 0)
+
+    @staticmethod
+    def _format_seconds(seconds: float) -> str:
+        seconds = int(round(seconds))
+        minutes, seconds = divmod(seconds, 60)
+        if minutes and seconds:
+            return f"{minutes} мин {seconds} с"
+        if minutes:
+            return f"{minutes} мин"
+        return f"{seconds} с"
+
+    def _next_speaker(self, game: GameState, after: int | None = None):
+        """
+        Следующий говорящий днём: живые игроки по кругу.
+        Каждый новый круг начинает следующее место; after — место предыдущего.
+        """
+        n = len(game.players)
+        if not n:
+            return None
+        start = (game.round - 1) % n
+        order = [(start + i) % n for i in range(n)]
+        if after is not None and after in order:
+            order = order[order.index(after) + 1:]
+        for seat in order:
+            if game.is_alive(game.players[seat]):
+                return game.players[seat]
+        return None
+
+    async def _start_day_timers(self, update: Update, game: GameState) -> bool:
+        """
+        После ночи: речи игроков по очереди, затем общее обсуждение.
+        Возвращает False, если для режима партии таймеры не включены.
+        """
+        if self._timer_seconds(game, PhaseTimer.Kind.SPEECH):
+            speaker = self._next_speaker(game)
+            if speaker is not None:
+                await self._start_timer(update, game, PhaseTimer.Kind.SPEECH, speaker)
+                return True
+        if self._timer_seconds(game, PhaseTimer.Kind.DISCUSSION):
+            await self._start_timer(update, game, PhaseTimer.Kind.DISCUSSION)
+            return True
+        return False
+
+    async def _start_timer(self, update: Update, game: GameState, kind: str, speaker=None):
+        """Завести таймер стола в колесе и в БД (PhaseTimer) и объявить его."""
+        chat_id = update.effective_chat.id
+        seconds = self._timer_seconds(game, kind)
+        deadline = timezone.now() + timedelta(seconds=seconds)
+        seat = speaker.seat if speaker is not None else None
+
+        self.timers.schedule(
+            (chat_id, game.table),
+            deadline.timestamp(),
+            {
+                "session_id": game.db_session_id,
+                "kind": kind,
+                "round": game.round,
+                "speaker": seat,
+            },
+        )
+        if game.db_session_id:
+            # переживает перезапуск: при старте бота таймеры заводятся из БД
+            await self.writer.call(partial(
+                PhaseTimer.objects.update_or_create,
+                session_id=game.db_session_id,
+                defaults={
+                    "tg_chat_id": chat_id,
+                    "kind": kind,
+                    "round": game.round,
+                    "speaker": seat,
+                    "deadline": deadline,
+                },
+            ), models=(PhaseTimer,))
+
+        if kind == PhaseTimer.Kind.SPEECH:
+            text = (
+                f"🎤 Говорит {speaker.name} — {self._format_seconds(seconds)}.\n"
+                "Закончил раньше — /timer skip."
+            )
+        elif getattr(settings, "TG_BOT_TIMER_AUTO_VOTE", True):
+            text = (
+                f"⏱ Обсуждение — {self._format_seconds(seconds)}, "
+                "затем голосование начнётся само."
+            )
+        else:
+            text = f"⏱ Обсуждение — {self._format_seconds(seconds)}."
+        await self._reply(update, text, quote=False)
+
+    async def _cancel_timer(self, chat_id: int, table: int):
+        """Остановить таймер стола (если он идёт) и удалить его из БД."""
+        entry = self.timers.cancel((chat_id, table))
+        if entry is not None and entry.payload["session_id"]:
+            await self.writer.call(
+                PhaseTimer.objects.filter(session_id=entry.payload["session_id"]).delete,
+                models=(PhaseTimer,),
+            )
+
+    def _load_timers(self) -> list:
+        """Таймеры из БД для чатов этого шарда (синхронно)."""
+        index, shards = self.shard
+        return [
+            timer
+            for timer in PhaseTimer.objects.select_related("session")
+            if shards == 1 or shard_for(timer.tg_chat_id, shards) == index
+        ]
+
+    def _on_timer(self, entry: TimerEntry):
+        """
+        Колесо таймеров: сработавший таймер встаёт в очередь апдейтов
+        и обрабатывается по порядку вместе с сообщениями своего чата.
+        """
+        queue = self._app.update_queue
+        try:
+            queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            self._spawn(queue.put(entry))
+
+    @staticmethod
+    def _host_update(bot, chat_id: int, table: int) -> Update:
+        """
+        Апдейт от имени ведущего для событий без сообщения (сработавший
+        таймер, правка с сайта): «/next #стол» в чате. Через него они
+        пользуются обычными ответами и переходом фаз next_cmd.
+        message_id 0 — отвечать без цитаты.
+        """
+        message = Message(
+            message_id=0,
+            date=timezone.now(),
+            chat=Chat(chat_id, Chat.PRIVATE if chat_id > 0 else Chat.GROUP),
+            text=f"/next #{table}",
+            entities=(MessageEntity(MessageEntity.BOT_COMMAND, 0, len("/next")),),
+        )
+        message.set_bot(bot)
+        update = Update(0, message=message)
+        update.set_bot(bot)
+        return update
+
+    async def _timer_expired(self, entry: TimerEntry, context: ContextTypes.DEFAULT_TYPE):
+        """Сработал таймер дня: следующий говорящий, обсуждение или голосование."""
+        chat_id, table = entry.key
+        if self.timers.get(entry.key) is not entry:
+            # пока таймер ждал очереди, его остановили или завели заново
+            return
+
+        update = self._host_update(context.bot, chat_id, table)
+        await self._restore_game(update, context)
+        game = self.games.get(entry.key)
+        payload = entry.payload
+        if (
+            game is None
+            or game.db_session_id != payload["session_id"]
+            or game.phase != self.PHASE_DAY
+            or game.round != payload["round"]
+        ):
+            # партию сбросили или продвинули без бота — таймер устарел
+            await self._cancel_timer(chat_id, table)
+            return
+
+        await self._advance_timer(update, context, game, entry)
+
+    async def _advance_timer(self, update: Update, context, game: GameState, entry: TimerEntry):
+        """Закончить текущий отрезок дня (по таймеру или /timer skip)."""
+        payload = entry.payload
+        if payload["kind"] == PhaseTimer.Kind.SPEECH:
+            speaker = self._next_speaker(game, payload["speaker"])
+            if speaker is not None:
+                await self._start_timer(update, game, PhaseTimer.Kind.SPEECH, speaker)
+                return
+            if self._timer_seconds(game, PhaseTimer.Kind.DISCUSSION):
+                await self._start_timer(update, game, PhaseTimer.Kind.DISCUSSION)
+                return
+
+        chat_id = update.effective_chat.id
+        await self._cancel_timer(chat_id, game.table)
+        if getattr(settings, "TG_BOT_TIMER_AUTO_VOTE", True):
+            await self._reply(update, "⏰ Обсуждение окончено.", quote=False)
+            await self.next_cmd(self._host_update(update.get_bot(), chat_id, game.table), context)
+        else:
+            await self._reply(
+                update,
+                "⏰ Обсуждение окончено. Напиши /next, чтобы начать голосование.",
+                quote=False,
+                reply_markup=self._control_keyboard(game),
+            )
+
+    async def timer_cmd(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """
+        /timer — сколько осталось у таймера дня.
+        /timer skip — следующий говорящий (или конец обсуждения),
+        /timer stop — остановить, /timer start — запустить заново.
+        """
+        game = await self._ensure_game(update)
+        if not game or not update.message:
+            return
+
+        chat_id = update.effective_chat.id
+        args = self._args(context)
+        action = args[0].lower() if args else ""
+        entry = self.timers.get((chat_id, game.table))
 
-        # Нет имени — показываем кнопки
-        if not context.args:
-            alive = self._alive_players(game)
-            if not alive:
-                await update.message.reply_text(
-                    "Все уже выбыли из игры 🙂",
-                    reply_markup=self._control_keyboard(game),
-                )
+        if action == "start":
+            if game.phase != self.PHASE_DAY:
+                await self._reply(update, "Таймеры работают только днём.")
                 return
-
-            keyboard = [
-                [
-                    InlineKeyboardButton(
-                        p["name"],
-                        callback_data=f"lynch:{idx}",
-                    )
-                ]
-                for idx, p in enumerate(game["players"])
-                if p["alive"]
-            ]
-            markup = InlineKeyboardMarkup(keyboard)
-            await update.message.reply_text(
-                "Кого исключают по итогам голосования?",
-                reply_markup=markup,
-            )
+            await self._cancel_timer(chat_id, game.table)
+            if not await self._start_day_timers(update, game):
+                await self._reply(
+                    update,
+                    "Таймеры дня выключены "
+                    "(TG_BOT_SPEECH_SECONDS / TG_BOT_DISCUSSION_SECONDS в настройках).",
+                )
             return
 
-        name = " ".join(context.args).strip()
-        player = self._find_player(game, name)
-        if not player:
-            await update.message.reply_text(
-                f"Игрок «{name}» не найден.",
-                reply_markup=self._control_keyboard(game),
+        if entry is None:
+            await self._reply(
+                update,
+                "Таймер сейчас не идёт. Днём его можно запустить: /timer start",
             )
             return
 
-        if not player["alive"]:
-            await update.message.reply_text(
-                f"Игрок «{player['name']}» уже выбыл.",
-                reply_markup=self._control_keyboard(game),
-            )
+        if action == "stop":
+            await self._cancel_timer(chat_id, game.table)
+            await self._reply(update, "Таймер остановлен. Когда закончите — /next.")
             return
 
-        # помечаем игрока "выбыл"
-        player["alive"] = False
-
-        # фиксируем смерть в БД с кругом/фазой
-        session_id = game.get("db_session_id")
-        if session_id:
-            await self._set_player_dead(session_id, player["name"], game)
-
-        await update.message.reply_text(
-            f"По итогам голосования из игры выбывает: {player['name']}.",
-            reply_markup=self._control_keyboard(game),
-        )
-
-        # Проверяем победу после голосования
-        win_text = self._check_win_and_build_message(game)
-        if win_text and update.message:
-            # сохраняем результат в БД
-            await self._finish_session_in_db(game)
+        if action == "skip":
+            await self._advance_timer(update, context, game, entry)
+            return
 
-            await update.message.reply_text(
-                win_text,
-                reply_markup=self._control_keyboard(game),
-            )
+        left = self._format_seconds(entry.remaining)
+        if entry.payload["kind"] == PhaseTimer.Kind.SPEECH:
+            name = game.players[entry.payload["speaker"]].name
+            await self._reply(update, f"🎤 Говорит {name}, осталось {left}.")
+        else:
+            await self._reply(update, f"⏱ Обсуждение, осталось {left}.")
 
     async def next_cmd(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
@@ -1507,97 +3322,122 @@ class Command(BaseCommand):
         if not game or not update.message:
             return
 
-        if game.get("phase") == self.PHASE_FINISHED:
-            await update.message.reply_text(
+        if game.phase == self.PHASE_FINISHED:
+            await self._reply(
+                update,
                 "Игра уже завершена. Запусти /startgame N, чтобы начать новую.",
                 reply_markup=self._control_keyboard(game),
             )
             return
 
+        # любая смена фазы останавливает таймер дня
+        await self._cancel_timer(update.effective_chat.id, game.table)
+
         # если игра только что настроена — запускаем первую ночь
-        if game["phase"] is None:
-            game["phase"] = self.PHASE_NIGHT
-            game["round"] = 1
+        if game.phase is None:
+            game.phase = self.PHASE_NIGHT
+            game.round = 1
 
             await self._update_session_phase(game, self.PHASE_NIGHT)
-
-            await update.message.reply_text(
-                self._night_instructions_text(game),
-                reply_markup=self._control_keyboard(game),
+            await self._record_events(
+                game,
+                [(GameEvent.Kind.PHASE, {"phase": self.PHASE_NIGHT, "round": 1})],
             )
+
+            await self._show_phase(update, game, self._night_instructions_text(game))
             return
 
-        phase = game["phase"]
+        phase = game.phase
 
         # Переход: НОЧЬ -> ДЕНЬ
         if phase == self.PHASE_NIGHT:
-            kill_name = game["pending_kill"]
-            heal_name = game["pending_heal"]
+            kill_name = game.pending_kill
+            heal_name = game.pending_heal
 
+            killed_player = None
             killed_player_name = None
 
             if kill_name and heal_name and kill_name == heal_name:
                 # доктор вылечил жертву
-                game["last_night_killed"] = None
+                game.last_night_killed = None
                 killed_msg = "Доктор успел вылечить жертву. Ночью никто не убит."
             elif kill_name:
                 player = self._find_player(game, kill_name)
-                if player and player["alive"]:
-                    player["alive"] = False
-                    killed_player_name = player["name"]
-                    game["last_night_killed"] = killed_player_name
+                if player and game.is_alive(player):
+                    game.kill(player)
+                    killed_player = player
+                    killed_player_name = player.name
+                    game.last_night_killed = killed_player_name
                     killed_msg = f"Ночью убит игрок: {killed_player_name}."
                 else:
-                    game["last_night_killed"] = None
+                    game.last_night_killed = None
                     killed_msg = (
                         "Жертва мафии не найдена (возможно, игрок уже выбыл)."
                     )
             else:
-                game["last_night_killed"] = None
+                game.last_night_killed = None
                 killed_msg = "Мафия никого не выбрала, ночью никто не убит."
 
             # Если кто-то погиб — синхронизируем в БД
-            session_id = game.get("db_session_id")
-            if killed_player_name and session_id:
-                await self._set_player_dead(session_id, killed_player_name, game)
+            if killed_player and game.db_session_id:
+                await self._set_player_dead(game, killed_player)
 
             # очистить ночные выборы
-            game["pending_kill"] = None
-            game["pending_heal"] = None
-            game["pending_check"] = None
+            game.pending_kill = None
+            game.pending_heal = None
+            game.pending_check = None
 
-            game["phase"] = self.PHASE_DAY
+            game.phase = self.PHASE_DAY
 
-            day_round = game.get("round", 1)
+            day_round = game.round
 
             await self._update_session_phase(game, self.PHASE_DAY)
 
-            await update.message.reply_text(
+            await self._show_phase(
+                update,
+                game,
                 f"🌞 День, круг {day_round}.\n"
                 f"{killed_msg}\n\n"
                 "Ведущий объявляет результаты ночи и даёт время на обсуждение.\n"
                 "Когда обсуждение закончится — напиши /next, начнётся голосование.",
-                reply_markup=self._control_keyboard(game),
             )
 
             # Проверяем победу после ночи
             win_text = self._check_win_and_build_message(game)
+
+            # итоги ночи, смена фазы и (если есть) конец игры — одной записью
+            events = [
+                (GameEvent.Kind.NIGHT_RESULT, {"killed": killed_player_name}),
+                (GameEvent.Kind.PHASE, {"phase": self.PHASE_DAY, "round": day_round}),
+            ]
+            if win_text:
+                events.append(self._finished_event(game))
+            await self._record_events(game, events)
+
             if win_text and update.message:
                 await self._finish_session_in_db(game)
-                await update.message.reply_text(
-                    win_text,
-                    reply_markup=self._control_keyboard(game),
-                )
+                await self._announce_win(update, game, win_text)
+            else:
+                await self._start_day_timers(update, game)
             return
 
         # Переход: ДЕНЬ -> ГОЛОСОВАНИЕ
         if phase == self.PHASE_DAY:
-            game["phase"] = self.PHASE_VOTE
+            game.phase = self.PHASE_VOTE
 
             await self._update_session_phase(game, self.PHASE_VOTE)
+            await self._record_events(
+                game,
+                [(
+                    GameEvent.Kind.PHASE,
+                    {"phase": self.PHASE_VOTE, "round": game.round},
+                )],
+            )
 
-            await update.message.reply_text(
-                f"🗳 Голосование, круг {game['round']}.\n\n"
+            await self._show_phase(
+                update,
+                game,
+                f"🗳 Голосование, круг {game.round}.\n\n"
                 "1) Объяви кандидатов.\n"
                 "2) Собери голоса.\n"
                 "3) Исключи игрока командой:\n"
@@ -1605,25 +3445,29 @@ class Command(BaseCommand):
                 "Или используй /lynch и выбери игрока по кнопке.\n"
                 "После того как игрок исключён, напиши /next, "
                 "чтобы перейти к следующей ночи.",
-                reply_markup=self._control_keyboard(game),
             )
             return
 
         # Переход: ГОЛОСОВАНИЕ -> НОЧЬ (следующий круг)
         if phase == self.PHASE_VOTE:
-            game["round"] += 1
-            game["phase"] = self.PHASE_NIGHT
+            game.round += 1
+            game.phase = self.PHASE_NIGHT
 
             await self._update_session_phase(game, self.PHASE_NIGHT)
-
-            await update.message.reply_text(
-                self._night_instructions_text(game),
-                reply_markup=self._control_keyboard(game),
+            await self._record_events(
+                game,
+                [(
+                    GameEvent.Kind.PHASE,
+                    {"phase": self.PHASE_NIGHT, "round": game.round},
+                )],
             )
+
+            await self._show_phase(update, game, self._night_instructions_text(game))
             return
 
         # На всякий случай
-        await update.message.reply_text(
+        await self._reply(
+            update,
             "Что-то пошло не так с фазой игры. "
             "Попробуй /startgame N, чтобы начать заново.",
             reply_markup=self._control_keyboard(game),
@@ -1635,53 +3479,265 @@ class Command(BaseCommand):
 
         Что делаем:
         - помечаем связанную Session в БД как 'сброшена'
-        - удаляем состояние игры из self.games[chat_id].
+        - удаляем состояние игры из self.games[(chat_id, стол)].
         """
         chat_id = self._get_chat_id(update)
         if chat_id is None or not update.message:
             return
 
-        game = self.games.get(chat_id)
+        key = self._game_key(update)
+        game = self.games.get(key)
         if not game:
-            await update.message.reply_text(
+            await self._reply(
+                update,
                 "Для этого чата игра ещё не создана. "
                 "Сначала запусти /startgame N.",
                 reply_markup=self._control_keyboard(None),
             )
             return
 
-        session_id = game.get("db_session_id")
+        session_id = game.db_session_id
 
         if session_id:
-            try:
-                def _cancel():
-                    session = Session.objects.get(id=session_id)
-                    status_cancel = getattr(
-                        Session.Status,
-                        "CANCELLED",
-                        Session.Status.FINISHED,
-                    )
-                    session.status = status_cancel
-                    session.save()
-                await sync_to_async(_cancel)()
-            except Exception as e:
-                self.stderr.write(
-                    self.style.WARNING(
-                        f"Не удалось пометить Session как сброшенную: {e}"
-                    )
-                )
+            await self.writer.update(
+                Session, {"status": Session.Status.CANCELLED}, id=session_id
+            )
+
+        await self._record_events(game, [(GameEvent.Kind.RESET, {})])
 
         # Удаляем состояние партии из памяти
-        self.games.pop(chat_id, None)
+        self.games.pop(key, None)
+        self._panels.pop(key, None)
+        await self._cancel_timer(*key)
 
-        await update.message.reply_text(
+        await self._reply(
+            update,
             "Текущая партия сброшена.\n"
             "Можно начать новую командой /startgame 10.",
             reply_markup=self._control_keyboard(None),
         )
 
+    async def table_cmd(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """
+        /table — столы этого чата и их фазы.
+        /table N — дальше мои команды без #N относятся к столу N.
+        """
+        chat_id = self._get_chat_id(update)
+        user = update.effective_user
+        if chat_id is None or not update.message or user is None:
+            return
+
+        args = self._args(context)
+        if args:
+            try:
+                table = int(args[0])
+            except ValueError:
+                table = 0
+            if not 1 <= table <= 999:
+                await self._reply(update, "Номер стола — число от 1 до 999. Пример: /table 2")
+                return
+            self._user_tables.setdefault(chat_id, {})[user.id] = table
+            exists = table in self.games.tables(chat_id)
+            await self._reply(
+                update,
+                f"Твои команды теперь относятся к столу {table}."
+                + ("" if exists else f"\nНа нём ещё нет партии: /startgame 10 #{table}"),
+            )
+            return
+
+        tables = self.games.tables(chat_id)
+        if not tables:
+            await self._reply(
+                update,
+                "В этом чате нет партий. Создать: /startgame 10 "
+                "(второй стол: /startgame 10 #2).",
+            )
+            return
+
+        current = self._table_of(update)
+        lines = ["Столы этого чата:"]
+        for table, game in sorted(tables.items()):
+            phase = self._phase_headline(game) or "набор игроков."
+            mark = " ← ты здесь" if table == current else ""
+            lines.append(f" #{table}: {phase} Игроков: {len(game.players)}{mark}")
+        lines += [
+            "",
+            "Команда к другому столу: /next #2. Выбрать стол: /table 2",
+        ]
+        await self._reply(update, "\n".join(lines))
+
     # Обработка обычных текстовых сообщений (для добавления игроков)
 
+    async def stats_cmd(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """
+        /stats — метрики бота (только для администраторов из TG_BOT_ADMIN_IDS).
+        """
+        if not update.message:
+            return
+
+        user = update.effective_user
+        if user is None or user.id not in getattr(settings, "TG_BOT_ADMIN_IDS", ()):
+            await self._reply(update, "Эта команда доступна только администраторам бота.")
+            return
+
+        await self._reply(update, "📊 Статистика бота\n\n" + self._stats_text())
+
+    async def memprof_cmd(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """
+        /memprof — отчёт профилировщика памяти (только для администраторов):
+        /memprof on — включить, /memprof off — выключить, без аргументов — снимок.
+        """
+        if not update.message:
+            return
+
+        user = update.effective_user
+        if user is None or user.id not in getattr(settings, "TG_BOT_ADMIN_IDS", ()):
+            await self._reply(update, "Эта команда доступна только администраторам бота.")
+            return
+
+        arg = (self._args(context) or [""])[0].lower()
+        if arg == "on":
+            self._start_memprof()
+            await self._reply(update, "Профилировщик памяти включён. Снимок — /memprof.")
+        elif arg == "off":
+            self.memprof.stop()
+            await self._reply(update, "Профилировщик памяти выключен.")
+        elif not self.memprof.tracing:
+            await self._reply(update, "Профилировщик памяти выключен. Включить — /memprof on.")
+        else:
+            await self._reply(update, "🧠 Память бота\n\n" + await self._memory_report())
+
+    def _start_memprof(self):
+        """Включить tracemalloc; снимки пишутся в TG_BOT_MEMPROF_FILE (у воркера — с его номером)."""
+        path = getattr(settings, "TG_BOT_MEMPROF_FILE", "")
+        if path and self.shard[1] > 1:
+            path = f"{path}.{self.shard[0]}"
+        self.memprof.path = path
+        self.memprof.start()
+
+    async def _memory_report(self) -> str:
+        """
+        Снимок памяти и отчёт по нему. Размер партий считается в цикле
+        событий (партии меняются только в нём), снимок и его разбор —
+        в отдельном потоке, чтобы не задерживать апдейты.
+        """
+        total, largest = game_sizes(self.games, self.memprof.top)
+        lines = [
+            f"Партий в памяти: {len(self.games)}, занимают {total / 1024:.1f} КБ",
+        ]
+        if largest:
+            lines.append(
+                "Самые большие: "
+                + ", ".join(f"{chat_id}#{table} {size / 1024:.1f} КБ" for size, (chat_id, table) in largest)
+            )
+
+        def _snapshot():
+            return self.memprof.report(self.memprof.take())
+
+        try:
+            lines += [""] + await asyncio.to_thread(_snapshot)
+        except OSError as e:
+            self._bot_warning(f"Не удалось записать снимок памяти: {e}")
+        return "\n".join(lines)
+
+    async def _log_memory_report(self):
+        if self.memprof.tracing:
+            self.stdout.write(f"[memprof]\n{await self._memory_report()}")
+
+    async def _memprof_forever(self, interval: float):
+        """Раз в interval секунд, пока профилировщик включён, пишем отчёт в консоль."""
+        while True:
+            await asyncio.sleep(interval)
+            await self._log_memory_report()
+
+    def _memprof_signal(self):
+        """SIGUSR2: первый сигнал включает профилировщик, следующие — пишут отчёт в консоль."""
+        if not self.memprof.tracing:
+            self._start_memprof()
+            self.stdout.write("[memprof] профилировщик памяти включён, отчёт — по следующему SIGUSR2")
+            return
+        self._spawn(self._log_memory_report())
+
+    async def _count_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        self.metrics.count_update()
+
+    async def _flood_gate(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """
+        Отбросить команду или нажатие кнопки сверх лимитов чата и пользователя
+        и повторное нажатие той же кнопки. Стоит до восстановления партии,
+        поэтому отброшенный апдейт не доходит ни до БД, ни до ответа в чат
+        (нажатию кнопки только отвечаем, чтобы у игрока не висела загрузка).
+        Обычный текст (имена игроков) не ограничивается.
+        """
+        query = update.callback_query
+        if query is not None:
+            message = query.message
+            tap = (message.message_id if message else query.inline_message_id, query.data)
+        elif update.message and (update.message.text or "").startswith("/"):
+            tap = None
+        else:
+            return
+
+        user = update.effective_user
+        reason = self.flood.check(self._get_chat_id(update), user.id if user else None, tap)
+        if reason is None:
+            return
+        if query is not None:
+            # иначе у нажавшего крутится индикатор загрузки, пока не истечёт;
+            # answerCallbackQuery не расходует лимиты сообщений
+            try:
+                await query.answer(
+                    None if reason == FloodGuard.REPEAT else "Слишком часто, подожди немного."
+                )
+            except Exception:
+                # ответ не дошёл — индикатор погаснет сам
+                pass
+        raise ApplicationHandlerStop
+
+    def _stats_text(self) -> str:
+        in_progress = sum(
+            1 for game in self.games.values()
+            if game.phase != self.PHASE_FINISHED
+        )
+        writer = self.writer
+        outbound = self.outbound
+        return self.metrics.render([
+            f"Партий в игре: {in_progress} (всего в памяти: {len(self.games)}, "
+            f"чатов: {len(self.games.by_chat)})",
+            f"Апдейты: обрабатывается {self.update_processor.running}, "
+            f"ждут свой чат {self.update_processor.waiting}",
+            f"Запись в БД: в очереди {writer.pending}, записано {writer.written}, "
+            f"сбросов {writer.flushes}, последний {writer.last_flush_seconds * 1000:.1f} мс, "
+            f"обращений к потокам БД {self.db.handoffs}",
+            f"Исходящие: в очереди {outbound.pending}, отправлено {outbound.sent}, "
+            f"склеено {outbound.merged}, правок {outbound.edited} "
+            f"(лишних пропущено {outbound.superseded}), ошибок {outbound.failed}",
+            f"Таймеров дня: {len(self.timers)}, сработало {self.timers.fired}",
+            f"Входящие отброшены: лимит пользователя {self.flood.dropped[FloodGuard.USER]}, "
+            f"лимит чата {self.flood.dropped[FloodGuard.CHAT]}, "
+            f"повторных нажатий {self.flood.dropped[FloodGuard.REPEAT]}",
+            f"Правки с сайта: применено {self.web_edits}, курсор ленты {self.changes.position}",
+            f"Сверка с БД: проходов {self.reconcile_stats.runs}, партий "
+            f"{self.reconcile_stats.games} (пропущено {self.reconcile_stats.skipped}), "
+            f"запросов {self.reconcile_stats.statements}, "
+            f"{self.reconcile_stats.last_seconds * 1000:.0f} мс; {self.reconcile_stats.render()}",
+            f"Роли в личку: доставлено {self.roles_dm.sent}, не доставлено "
+            f"{self.roles_dm.failed}, повторов {self.roles_dm.retried}, "
+            f"в очереди {self.roles_dm.pending}",
+            f"Выгружено из памяти партий: {self.evicted}, "
+            f"отменено брошенных: {self.cancelled_sessions}",
+            *self._webhook_stats(),
+        ])
+
+    def _webhook_stats(self) -> list[str]:
+        webhook = self.webhook
+        if webhook is None:
+            return []
+        return [
+            f"Webhook: принято {webhook.accepted}, очередь полна {webhook.overflows}, "
+            f"чужой секрет {webhook.forbidden}, битых {webhook.bad}",
+        ]
+
     async def text_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
         Обработка обычных текстовых сообщений (без команды).
@@ -1703,11 +3759,11 @@ class Command(BaseCommand):
             return
 
         # Если игра уже идёт или роли выбраны — не воспринимаем текст как имена
-        if game.get("roles_mode"):
+        if game.roles_mode:
             return
 
         # Если режим добавления игроков не включён — тоже игнорируем
-        if not game.get("adding_players"):
+        if not game.adding_players:
             return
 
         await self._handle_players_input(game, text, update)
@@ -1720,20 +3776,27 @@ class Command(BaseCommand):
         - kill:ID   — выбор жертвы мафии;
         - check:ID  — выбор проверки комиссара;
         - heal:ID   — выбор лечения доктора;
-        - lynch:ID  — выбор исключаемого игрока на голосовании.
+        - lynch:ID  — выбор исключаемого игрока на голосовании;
+        - join:ID:USER / nojoin:ID:USER — ведущий подтверждает или отклоняет /join.
+        Между действием и ID стоит номер стола: kill:СТОЛ:ID.
         """
         query = update.callback_query
         if not query:
             return
 
+        data = query.data or ""
+        if data.startswith(("join:", "nojoin:")):
+            # на нажатие отвечает сам: не ведущему — подсказкой
+            await self._join_decision(update, query)
+            return
+
         await query.answer()
 
-        data = query.data or ""
         chat_id = self._get_chat_id(update)
         if chat_id is None:
             return
 
-        game = self.games.get(chat_id)
+        game = self.games.get(self._game_key(update))
         if not game:
             await query.edit_message_text(
                 "Игра для этого чата не найдена. "
@@ -1743,179 +3806,583 @@ class Command(BaseCommand):
 
         # ---- Выбор жертвы мафии ----
         if data.startswith("kill:"):
-            if game.get("phase") != self.PHASE_NIGHT:
-                await query.edit_message_text(
+            if game.phase != self.PHASE_NIGHT:
+                await self._button_error(
+                    update,
+                    game,
                     "Жертву мафии можно выбирать только ночью."
                 )
                 return
 
             try:
-                idx = int(data.split(":", 1)[1])
+                idx = int(data.rsplit(":", 1)[1])
             except (ValueError, IndexError):
                 return
 
             try:
-                player = game["players"][idx]
+                player = game.players[idx]
             except IndexError:
-                await query.edit_message_text("Игрок не найден.")
+                await self._button_error(update, game, "Игрок не найден.")
                 return
 
-            if not player["alive"]:
-                await query.edit_message_text(
-                    f"Игрок «{player['name']}» уже выбыл."
+            if not game.is_alive(player):
+                await self._button_error(
+                    update,
+                    game,
+                    f"Игрок «{player.name}» уже выбыл."
                 )
                 return
 
-            game["pending_kill"] = player["name"]
-
-            await query.edit_message_text(
-                f"Мафия выбрала жертву: {player['name']}.\n"
-                "Если нужно изменить выбор — снова вызови /kill "
-                "и выбери другого игрока."
+            game.pending_kill = player.name
+            await self._record_events(
+                game,
+                [(
+                    GameEvent.Kind.NIGHT_CHOICE,
+                    {"action": "kill", "name": player.name},
+                )],
             )
+
+            if not await self._refresh_panel(update, game):
+                await query.edit_message_text(
+                    f"Мафия выбрала жертву: {player.name}.\n"
+                    "Если нужно изменить выбор — снова вызови /kill "
+                    "и выбери другого игрока."
+                )
             return
 
         # Выбор проверки комиссара
         if data.startswith("check:"):
-            if game.get("phase") != self.PHASE_NIGHT:
-                await query.edit_message_text(
+            if game.phase != self.PHASE_NIGHT:
+                await self._button_error(
+                    update,
+                    game,
                     "Проверять можно только ночью."
                 )
                 return
 
-            if not game.get("roles_mode") == "random" or not game.get("roles_assigned"):
-                await query.edit_message_text(
+            if not game.roles_mode == "random" or not game.roles_assigned:
+                await self._button_error(
+                    update,
+                    game,
                     "В режиме карточек бот не знает ролей игроков."
                 )
                 return
 
             try:
-                idx = int(data.split(":", 1)[1])
+                idx = int(data.rsplit(":", 1)[1])
             except (ValueError, IndexError):
                 return
 
             try:
-                player = game["players"][idx]
+                player = game.players[idx]
             except IndexError:
-                await query.edit_message_text("Игрок не найден.")
+                await self._button_error(update, game, "Игрок не найден.")
                 return
 
-            if not player["alive"]:
-                await query.edit_message_text(
-                    f"Игрок «{player['name']}» уже выбыл."
+            if not game.is_alive(player):
+                await self._button_error(
+                    update,
+                    game,
+                    f"Игрок «{player.name}» уже выбыл."
                 )
                 return
 
-            game["pending_check"] = player["name"]
-            role_ru = self._format_role_ru(player["role"])
-
-            await query.edit_message_text(
-                f"Комиссар проверяет игрока: {player['name']}.\n"
-                f"Роль этого игрока: {role_ru}."
+            game.pending_check = player.name
+            await self._record_events(
+                game,
+                [(
+                    GameEvent.Kind.NIGHT_CHOICE,
+                    {"action": "check", "name": player.name},
+                )],
             )
+            role_ru = self._format_role_ru(player.role)
+
+            if not await self._refresh_panel(update, game):
+                await query.edit_message_text(
+                    f"Комиссар проверяет игрока: {player.name}.\n"
+                    f"Роль этого игрока: {role_ru}."
+                )
             return
 
         # Выбор лечения доктора
         if data.startswith("heal:"):
             # На всякий случай: если спортивная мафия — игнорируем
-            game_mode = game.get("game_mode") or self.GAME_MODE_CLASSIC
+            game_mode = game.game_mode or self.GAME_MODE_CLASSIC
             if game_mode == self.GAME_MODE_SPORT:
-                await query.edit_message_text(
+                await self._button_error(
+                    update,
+                    game,
                     "В спортивной мафии доктор не используется."
                 )
                 return
 
-            if game.get("phase") != self.PHASE_NIGHT:
-                await query.edit_message_text(
+            if game.phase != self.PHASE_NIGHT:
+                await self._button_error(
+                    update,
+                    game,
                     "Доктор лечит только ночью."
                 )
                 return
 
             try:
-                idx = int(data.split(":", 1)[1])
+                idx = int(data.rsplit(":", 1)[1])
             except (ValueError, IndexError):
                 return
 
             try:
-                player = game["players"][idx]
+                player = game.players[idx]
             except IndexError:
-                await query.edit_message_text("Игрок не найден.")
+                await self._button_error(update, game, "Игрок не найден.")
                 return
 
-            if not player["alive"]:
-                await query.edit_message_text(
-                    f"Игрок «{player['name']}» уже выбыл."
+            if not game.is_alive(player):
+                await self._button_error(
+                    update,
+                    game,
+                    f"Игрок «{player.name}» уже выбыл."
                 )
                 return
 
-            game["pending_heal"] = player["name"]
-
-            await query.edit_message_text(
-                f"Доктор будет лечить игрока: {player['name']}.\n"
-                "Если нужно изменить выбор — снова вызови /heal "
-                "и выбери другого игрока."
+            game.pending_heal = player.name
+            await self._record_events(
+                game,
+                [(
+                    GameEvent.Kind.NIGHT_CHOICE,
+                    {"action": "heal", "name": player.name},
+                )],
             )
+
+            if not await self._refresh_panel(update, game):
+                await query.edit_message_text(
+                    f"Доктор будет лечить игрока: {player.name}.\n"
+                    "Если нужно изменить выбор — снова вызови /heal "
+                    "и выбери другого игрока."
+                )
             return
 
         # Исключение на голосовании
         if data.startswith("lynch:"):
-            if game.get("phase") != self.PHASE_VOTE:
-                await query.edit_message_text(
+            if game.phase != self.PHASE_VOTE:
+                await self._button_error(
+                    update,
+                    game,
                     "Исключать игрока голосованием можно только на стадии голосования."
                 )
                 return
 
             try:
-                idx = int(data.split(":", 1)[1])
+                idx = int(data.rsplit(":", 1)[1])
             except (ValueError, IndexError):
                 return
 
             try:
-                player = game["players"][idx]
+                player = game.players[idx]
             except IndexError:
-                await query.edit_message_text("Игрок не найден.")
+                await self._button_error(update, game, "Игрок не найден.")
                 return
 
-            if not player["alive"]:
-                await query.edit_message_text(
-                    f"Игрок «{player['name']}» уже выбыл."
+            if not game.is_alive(player):
+                await self._button_error(
+                    update,
+                    game,
+                    f"Игрок «{player.name}» уже выбыл."
                 )
                 return
 
             # помечаем игрока "выбыл"
-            player["alive"] = False
+            game.kill(player)
 
             # фиксируем смерть в БД с кругом/фазой
-            session_id = game.get("db_session_id")
-            if session_id:
-                await self._set_player_dead(session_id, player["name"], game)
+            if game.db_session_id:
+                await self._set_player_dead(game, player)
 
             # сообщение вместо инлайн-кнопок
-            await query.edit_message_text(
-                f"По итогам голосования из игры выбывает: {player['name']}."
-            )
+            lynched_text = f"По итогам голосования из игры выбывает: {player.name}."
+            if not await self._refresh_panel(
+                update, game, f"{self._phase_headline(game)}\n{lynched_text}"
+            ):
+                await query.edit_message_text(lynched_text)
 
             # Проверяем победу
             win_text = self._check_win_and_build_message(game)
+
+            events = [(GameEvent.Kind.LYNCH, {"name": player.name})]
+            if win_text:
+                events.append(self._finished_event(game))
+            await self._record_events(game, events)
+
             if win_text:
                 await self._finish_session_in_db(game)
 
                 # отдельным сообщением — итоги и клавиатура
-                await query.message.reply_text(
-                    win_text,
-                    reply_markup=self._control_keyboard(game),
-                )
+                await self._announce_win(update, game, win_text)
             return
 
     # Запуск бота
 
+    async def _post_init(self, app):
+        """Прогрев справочников и запуск фоновых задач."""
+        await self._reference_data()
+        self.writer.start()
+
+        # таймеры, заведённые до перезапуска
+        self._app = app
+        try:
+            restored = await self.db.run(self._load_timers)
+        except Exception as e:
+            self._db_warning(f"Не удалось загрузить таймеры: {e}")
+        else:
+            for timer in restored:
+                self.timers.schedule(
+                    (timer.tg_chat_id, timer.session.tg_table),
+                    timer.deadline.timestamp(),
+                    {
+                        "session_id": timer.session_id,
+                        "kind": timer.kind,
+                        "round": timer.round,
+                        "speaker": timer.speaker,
+                    },
+                )
+        self.timers.start()
+
+        # правки с сайта читаются с текущего конца ленты: более ранние
+        # партии догонят сами, когда поднимутся из БД
+        interval = getattr(settings, "TG_BOT_CHANGE_FEED_INTERVAL", 1.0)
+        if interval:
+            try:
+                self.changes = ChangeCursor(position=await self.db.run(self._last_change_id))
+            except Exception as e:
+                self._db_warning(f"Не удалось прочитать ленту правок с сайта: {e}")
+            else:
+                self._changes_task = asyncio.create_task(self._poll_changes_forever(interval))
+
+        interval = getattr(settings, "TG_BOT_RECONCILE_INTERVAL", 300)
+        if interval:
+            self._reconcile_task = asyncio.create_task(self._reconcile_forever(interval))
+
+        if getattr(settings, "TG_BOT_MEMPROF", False):
+            self._start_memprof()
+        interval = getattr(settings, "TG_BOT_MEMPROF_INTERVAL", 900)
+        if interval:
+            self._memprof_task = asyncio.create_task(self._memprof_forever(interval))
+        if hasattr(signal, "SIGUSR2"):
+            try:
+                asyncio.get_running_loop().add_signal_handler(signal.SIGUSR2, self._memprof_signal)
+            except (NotImplementedError, RuntimeError):
+                # цикл не в главном потоке или без поддержки сигналов
+                pass
+
+        interval = getattr(settings, "TG_BOT_STATS_LOG_INTERVAL", 300)
+        if interval:
+            self._stats_task = asyncio.create_task(self._log_stats_forever(interval))
+
+        interval = getattr(settings, "TG_BOT_EVICTION_INTERVAL", 60)
+        if interval:
+            self._eviction_task = asyncio.create_task(
+                self._evict_forever(
+                    interval, getattr(settings, "TG_BOT_ABANDONED_AFTER", 7 * 24 * 60 * 60)
+                )
+            )
+
+    async def _post_stop(self, app):
+        """Остановка: отправляем то, что ещё стоит в очереди (бот ещё подключён)."""
+        for task in (
+            self._stats_task,
+            self._eviction_task,
+            self._changes_task,
+            self._reconcile_task,
+            self._memprof_task,
+        ):
+            if task is not None:
+                task.cancel()
+        self._stats_task = self._eviction_task = self._changes_task = None
+        self._reconcile_task = self._memprof_task = None
+        if hasattr(signal, "SIGUSR2"):
+            try:
+                asyncio.get_running_loop().remove_signal_handler(signal.SIGUSR2)
+            except (NotImplementedError, RuntimeError):
+                pass
+        # таймеры остаются в БД и заведутся при следующем запуске
+        self.timers.stop()
+        await self.roles_dm.close()
+        await self.outbound.close()
+
+    async def _log_stats_forever(self, interval: float):
+        """Раз в interval секунд пишем метрики бота в консоль."""
+        while True:
+            await asyncio.sleep(interval)
+            self.stdout.write(f"[stats]\n{self._stats_text()}")
+
+    async def _post_shutdown(self, app):
+        """Остановка: дописываем в БД всё, что осталось в очереди."""
+        await self.writer.close()
+        self.db.close()
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--shards",
+            type=int,
+            default=getattr(settings, "TG_BOT_SHARDS", 1),
+            help="Число процессов-воркеров; чаты делятся между ними по chat_id.",
+        )
+        parser.add_argument(
+            "--updates-file",
+            help="Брать апдейты не из Telegram, а из файла JSON Lines (локальные прогоны).",
+        )
+        parser.add_argument(
+            "--fake-api",
+            action="store_true",
+            help="Не обращаться к Telegram: ответы бота никуда не отправляются.",
+        )
+        parser.add_argument(
+            "--webhook",
+            action="store_true",
+            default=getattr(settings, "TG_BOT_WEBHOOK", False),
+            help="Получать апдейты через webhook (локальный HTTP-сервер), а не long polling. "
+            "С --updates-file апдейты из файла отправляются на этот сервер.",
+        )
+
+    def build_application(
+        self, token: str, request=None, update_queue=None, rate_limiter=None
+    ):
+        """Приложение python-telegram-bot со всеми обработчиками бота."""
+        if rate_limiter is None:
+            rate_limiter = OutboundRateLimiter(
+                global_rate=getattr(settings, "TG_BOT_OUTBOUND_GLOBAL_RATE", 30),
+                chat_rate=getattr(settings, "TG_BOT_OUTBOUND_CHAT_RATE", 1),
+                group_rate=getattr(settings, "TG_BOT_OUTBOUND_GROUP_RATE", 20 / 60),
+                chat_burst=getattr(settings, "TG_BOT_OUTBOUND_CHAT_BURST", 3),
+                max_retries=getattr(settings, "TG_BOT_OUTBOUND_MAX_RETRIES", 3),
+            )
+        builder = (
+            ApplicationBuilder()
+            .token(token)
+            .rate_limiter(rate_limiter)
+            .concurrent_updates(self.update_processor)
+        )
+        if request is not None:
+            builder = builder.request(request).get_updates_request(request)
+        else:
+            # один пул соединений на все запросы бота, переиспользуется
+            builder = (
+                builder
+                .connection_pool_size(getattr(settings, "TG_BOT_HTTP_POOL_SIZE", 32))
+                .pool_timeout(getattr(settings, "TG_BOT_HTTP_POOL_TIMEOUT", 10))
+                .connect_timeout(getattr(settings, "TG_BOT_HTTP_CONNECT_TIMEOUT", 5))
+                .read_timeout(getattr(settings, "TG_BOT_HTTP_READ_TIMEOUT", 10))
+                .write_timeout(getattr(settings, "TG_BOT_HTTP_WRITE_TIMEOUT", 10))
+            )
+        if update_queue is not None:
+            builder = builder.update_queue(update_queue)
+        app = (
+            builder
+            .post_init(self._post_init)
+            .post_stop(self._post_stop)
+            .post_shutdown(self._post_shutdown)
+            .build()
+        )
+
+        instrument = self.metrics.instrument
+
+        # Счётчик апдейтов, лимиты входящих и восстановление партии из БД —
+        # раньше всех остальных обработчиков
+        app.add_handler(TypeHandler(Update, self._count_update), group=-3)
+        app.add_handler(TypeHandler(Update, self._flood_gate), group=-2)
+        app.add_handler(
+            TypeHandler(Update, instrument("restore", self._restore_game)), group=-1
+        )
+
+        # Команды
+        commands = {
+            "start": self.start_cmd,
+            "help": self.help_cmd,
+            "startgame": self.startgame_cmd,
+            "addplayer": self.addplayer_cmd,
+            "players": self.players_cmd,
+            "assign": self.assign_cmd,
+            "join": self.join_cmd,
+            "roles": self.roles_cmd,
+            "check": self.check_cmd,
+            "kill": self.kill_cmd,
+            "heal": self.heal_cmd,
+            "lynch": self.lynch_cmd,
+            "next": self.next_cmd,
+            "reset": self.reset_cmd,
+            "timer": self.timer_cmd,
+            "table": self.table_cmd,
+            "stats": self.stats_cmd,
+            "memprof": self.memprof_cmd,
+        }
+        for name, callback in commands.items():
+            app.add_handler(CommandHandler(name, instrument(f"/{name}", callback)))
+
+        # Обработка обычных текстовых сообщений (имена игроков после /addplayer)
+        app.add_handler(
+            MessageHandler(
+                filters.TEXT & ~filters.COMMAND,
+                instrument("text", self.text_message),
+            )
+        )
+
+        # Обработка inline-кнопок
+        app.add_handler(
+            CallbackQueryHandler(instrument("button", self.button_callback))
+        )
+
+        # Сработавшие таймеры дня (кладутся в очередь апдейтов колесом таймеров)
+        app.add_handler(TypeHandler(TimerEntry, instrument("timer", self._timer_expired)))
+        app.add_handler(TypeHandler(TableChanges, instrument("web", self._changes_received)))
+        return app
+
+    # Шардированный режим: воркер
+
+    def serve_shard(self, index: int, shards: int, updates, fake_api: bool = False):
+        """
+        Воркер шардированного режима: обрабатывает апдейты своих чатов
+        из очереди фронта, пока не получит None.
+        """
+        token = getattr(settings, "TG_BOT_TOKEN", None) or "0:fake"
+        request = FakeBotAPI(record=False) if fake_api else None
+        self.shard = (index, shards)
+        asyncio.run(self._serve_queue(token, request, updates))
+        self.stdout.write(f"Воркер {index + 1}/{shards} остановлен.")
+
+    async def _serve_queue(self, token, request, updates):
+        # очередь приложения ограничена, чтобы воркер не вычитывал
+        # очередь фронта быстрее, чем успевает обрабатывать
+        app = self.build_application(
+            token,
+            request=request,
+            update_queue=asyncio.Queue(
+                maxsize=getattr(settings, "TG_BOT_SHARD_QUEUE_SIZE", 1000)
+            ),
+        )
+        loop = asyncio.get_running_loop()
+
+        await app.initialize()
+        # post_init/post_stop/post_shutdown сами вызываются только в run_polling
+        await self._post_init(app)
+        await app.start()
+        try:
+            while True:
+                data = await loop.run_in_executor(None, updates.get)
+                if data is None:
+                    break
+                await app.update_queue.put(Update.de_json(data, app.bot))
+            # дожидаемся обработки всего принятого: при параллельной
+            # обработке stop() сам не ждёт уже запущенные апдейты
+            await app.update_queue.join()
+        finally:
+            await app.stop()
+            await self._post_stop(app)
+            await self._post_shutdown(app)
+            await app.shutdown()
+
+    def _webhook_server(self, fake_api: bool) -> WebhookServer | None:
+        """WebhookServer по настройкам TG_BOT_WEBHOOK_* (None — секрета взять неоткуда)."""
+        secret = getattr(settings, "TG_BOT_WEBHOOK_SECRET", "")
+        if not secret:
+            if not (getattr(settings, "TG_BOT_WEBHOOK_URL", "") or fake_api):
+                # адрес регистрирует не бот — без общего секрета все апдейты получат 403
+                return None
+            # адрес регистрирует сам бот: секрет достаточно знать этому процессу
+            secret = secrets.token_urlsafe(32)
+        return WebhookServer(
+            secret,
+            path=getattr(settings, "TG_BOT_WEBHOOK_PATH", "/telegram"),
+            listen=getattr(settings, "TG_BOT_WEBHOOK_LISTEN", "127.0.0.1"),
+            port=getattr(settings, "TG_BOT_WEBHOOK_PORT", 8443),
+        )
+
+    async def _serve_webhook(self, token, request, server: WebhookServer, replay_file=None):
+        """
+        Один процесс с webhook: апдейты с HTTP-сервера кладутся прямо
+        в очередь приложения, без getUpdates.
+        """
+        # очередь ограничена: когда обработчики не успевают, сервер отвечает
+        # Telegram 503, и апдейты ждут у Telegram, а не в памяти бота
+        app = self.build_application(
+            token,
+            request=request,
+            update_queue=asyncio.Queue(
+                maxsize=getattr(settings, "TG_BOT_WEBHOOK_QUEUE_SIZE", 1000)
+            ),
+        )
+
+        def intake(data):
+            try:
+                app.update_queue.put_nowait(Update.de_json(data, app.bot))
+            except asyncio.QueueFull:
+                return False
+            return True
+
+        server.intake = intake
+        self.webhook = server
+
+        await app.initialize()
+        await self._post_init(app)
+        await app.start()
+        await server.start()
+        try:
+            url = getattr(settings, "TG_BOT_WEBHOOK_URL", "")
+            if url and request is None:
+                await register_webhook(
+                    app.bot,
+                    url,
+                    server.secret_token,
+                    max_connections=getattr(settings, "TG_BOT_WEBHOOK_MAX_CONNECTIONS", 40),
+                )
+            self.stdout.write(f"Webhook слушает {server.url}")
+
+            if replay_file:
+                latencies = sorted(
+                    await replay_updates(server.url, replay_file, server.secret_token)
+                )
+                await app.update_queue.join()
+                if latencies:
+                    self.stdout.write(
+                        f"Отправлено апдейтов: {len(latencies)}, ответ webhook, мс: "
+                        f"p50 {latencies[len(latencies) // 2] * 1000:.2f}, "
+                        f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f}"
+                    )
+            else:
+                # до Ctrl+C
+                await asyncio.Event().wait()
+        finally:
+            await server.close()
+            await app.stop()
+            await self._post_stop(app)
+            await self._post_shutdown(app)
+            await app.shutdown()
+
     def handle(self, *args, **options):
         """
         Точка входа management-команды.
         Запускает приложение python-telegram-bot и регистрирует обработчики команд.
+
+        С --shards N (N > 1) или --updates-file запускается фронт-процесс,
+        который раздаёт апдейты N воркерам по chat_id. С --webhook апдейты
+        принимает локальный HTTP-сервер (во фронт-процессе, если воркеров
+        несколько).
         """
+        shards = max(1, options.get("shards") or 1)
+        updates_file = options.get("updates_file")
+        fake_api = options.get("fake_api", False)
+        webhook = None
+        if options.get("webhook"):
+            webhook = self._webhook_server(fake_api or bool(updates_file))
+            if webhook is None:
+                self.stderr.write(
+                    self.style.ERROR(
+                        "Для --webhook нужен TG_BOT_WEBHOOK_SECRET "
+                        "(или TG_BOT_WEBHOOK_URL, чтобы бот сам зарегистрировал webhook)."
+                    )
+                )
+                return
+            self.webhook = webhook
+
         token = getattr(settings, "TG_BOT_TOKEN", None)
-        if not token:
+        if not token and not (updates_file and fake_api):
             self.stderr.write(
                 self.style.ERROR(
                     "В settings.py не найден TG_BOT_TOKEN."
@@ -1923,32 +4390,48 @@ class Command(BaseCommand):
             )
             return
 
-        app = ApplicationBuilder().token(token).build()
-
-        # Команды
-        app.add_handler(CommandHandler("start", self.start_cmd))
-        app.add_handler(CommandHandler("help", self.help_cmd))
-        app.add_handler(CommandHandler("startgame", self.startgame_cmd))
-        app.add_handler(CommandHandler("addplayer", self.addplayer_cmd))
-        app.add_handler(CommandHandler("players", self.players_cmd))
-        app.add_handler(CommandHandler("assign", self.assign_cmd))
-        app.add_handler(CommandHandler("check", self.check_cmd))
-        app.add_handler(CommandHandler("kill", self.kill_cmd))
-        app.add_handler(CommandHandler("heal", self.heal_cmd))
-        app.add_handler(CommandHandler("lynch", self.lynch_cmd))
-        app.add_handler(CommandHandler("next", self.next_cmd))
-        app.add_handler(CommandHandler("reset", self.reset_cmd))
+        if shards > 1 or (updates_file and webhook is None):
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Бот запущен: {shards} воркер(а/ов). Нажми Ctrl+C для остановки."
+                )
+            )
+            router = run_sharded(
+                shards,
+                token=token,
+                updates_file=updates_file,
+                fake_api=fake_api,
+                queue_size=getattr(settings, "TG_BOT_SHARD_QUEUE_SIZE", 1000),
+                log=lambda msg: self.stderr.write(self.style.WARNING(msg)),
+                webhook=webhook,
+                webhook_url="" if fake_api else getattr(settings, "TG_BOT_WEBHOOK_URL", ""),
+            )
+            routed = ", ".join(str(count) for count in router.routed)
+            self.stdout.write(f"Апдейтов по воркерам: {routed}.")
+            for line in self._webhook_stats():
+                self.stdout.write(line)
+            return
 
-        # Обработка обычных текстовых сообщений (имена игроков после /addplayer)
-        app.add_handler(
-            MessageHandler(
-                filters.TEXT & ~filters.COMMAND,
-                self.text_message,
+        if webhook is not None:
+            self.stdout.write(
+                self.style.SUCCESS("Бот запущен (webhook). Нажми Ctrl+C для остановки.")
             )
-        )
+            try:
+                asyncio.run(
+                    self._serve_webhook(
+                        token or "0:fake",
+                        FakeBotAPI(record=False) if fake_api else None,
+                        webhook,
+                        replay_file=updates_file,
+                    )
+                )
+            except KeyboardInterrupt:
+                pass
+            return
 
-        # Обработка inline-кнопок
-        app.add_handler(CallbackQueryHandler(self.button_callback))
+        app = self.build_application(
+            token, request=FakeBotAPI(record=False) if fake_api else None
+        )
 
         self.stdout.write(
             self.style.SUCCESS("Бот запущен. Нажми Ctrl+C для остановки.")
@@ -0,0 +1,22 @@
+# Generated by Django 6.0 on 2026-10-16 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0012_alter_session_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='session',
+            name='tg_chat_id',
+            field=models.BigIntegerField(blank=True, help_text='Чат, в котором партию ведёт бот (пусто для сессий с сайта)', null=True, verbose_name='Telegram-чат'),
+        ),
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(fields=['tg_chat_id', 'status'], name='session_tg_chat_status_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 6.0 on 2026-10-17 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0013_session_tg_chat_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GameEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.PositiveIntegerField(verbose_name='Номер события в партии')),
+                ('kind', models.CharField(choices=[('started', 'Игра создана'), ('players_added', 'Добавлены игроки'), ('roles_assigned', 'Выбран способ выдачи ролей'), ('phase', 'Смена фазы'), ('night_choice', 'Ночной выбор'), ('night_result', 'Итоги ночи'), ('lynch', 'Исключение на голосовании'), ('finished', 'Игра окончена'), ('reset', 'Игра сброшена'), ('snapshot', 'Снимок состояния')], max_length=20, verbose_name='Тип события')),
+                ('payload', models.JSONField(blank=True, default=dict, verbose_name='Данные')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='game.session', verbose_name='Сессия')),
+            ],
+            options={
+                'verbose_name': 'Событие партии',
+                'verbose_name_plural': 'События партий',
+                'ordering': ['session', 'seq'],
+                'indexes': [models.Index(fields=['session', 'kind', 'seq'], name='gameevent_session_kind_idx')],
+                'constraints': [models.UniqueConstraint(fields=('session', 'seq'), name='unique_event_seq_per_session')],
+            },
+        ),
+    ]
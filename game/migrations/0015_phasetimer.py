@@ -0,0 +1,31 @@
+# Generated by Django 6.0 on 2026-10-17 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0014_gameevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PhaseTimer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tg_chat_id', models.BigIntegerField(verbose_name='ID чата Telegram')),
+                ('kind', models.CharField(choices=[('speech', 'Речь игрока'), ('discussion', 'Обсуждение')], max_length=20, verbose_name='Тип таймера')),
+                ('round', models.PositiveIntegerField(verbose_name='Круг')),
+                ('speaker', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Место говорящего игрока')),
+                ('deadline', models.DateTimeField(db_index=True, verbose_name='Срабатывает')),
+                ('session', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='timer', to='game.session', verbose_name='Сессия')),
+            ],
+            options={
+                'verbose_name': 'Таймер фазы',
+                'verbose_name_plural': 'Таймеры фаз',
+                'ordering': ['deadline'],
+            },
+        ),
+    ]
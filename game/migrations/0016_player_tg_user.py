@@ -0,0 +1,28 @@
+# Generated by Django 6.0 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0015_phasetimer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='player',
+            name='role_delivery',
+            field=models.CharField(blank=True, choices=[('sent', 'Доставлена'), ('failed', 'Не доставлена')], max_length=10, verbose_name='Роль в личные сообщения'),
+        ),
+        migrations.AddField(
+            model_name='player',
+            name='tg_user_id',
+            field=models.BigIntegerField(blank=True, db_index=True, help_text='Игрок привязал себя к месту командой /join в чате партии', null=True, verbose_name='Telegram id игрока'),
+        ),
+        migrations.AlterField(
+            model_name='gameevent',
+            name='kind',
+            field=models.CharField(choices=[('started', 'Игра создана'), ('players_added', 'Добавлены игроки'), ('roles_assigned', 'Выбран способ выдачи ролей'), ('phase', 'Смена фазы'), ('night_choice', 'Ночной выбор'), ('night_result', 'Итоги ночи'), ('lynch', 'Исключение на голосовании'), ('finished', 'Игра окончена'), ('reset', 'Игра сброшена'), ('linked', 'Игрок привязал Telegram'), ('snapshot', 'Снимок состояния')], max_length=20, verbose_name='Тип события'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 6.0 on 2026-10-17 12:00
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+# max_length поля Player.name
+NAME_MAX_LENGTH = 100
+
+
+def suffixed_name(name: str, suffix: int) -> str:
+    """«Имя (2)» не длиннее Player.name: длинное имя укорачивается под суффикс."""
+    tail = f" ({suffix})"
+    return name[: NAME_MAX_LENGTH - len(tail)].rstrip() + tail
+
+
+def rename_duplicate_players(apps, schema_editor):
+    """Повторы имён в партии (до ограничения их можно было добавить с сайта) — «Имя (2)»."""
+    Player = apps.get_model("game", "Player")
+    seen = set()
+    for player in Player.objects.order_by("session_id", "id").only("id", "session_id", "name"):
+        key = (player.session_id, player.name.lower())
+        if key not in seen:
+            seen.add(key)
+            continue
+        suffix = 2
+        while (player.session_id, suffixed_name(player.name, suffix).lower()) in seen:
+            suffix += 1
+        player.name = suffixed_name(player.name, suffix)
+        seen.add((player.session_id, player.name.lower()))
+        player.save(update_fields=["name"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0016_player_tg_user'),
+    ]
+
+    operations = [
+        migrations.RunPython(rename_duplicate_players, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='player',
+            constraint=models.UniqueConstraint(models.F('session'), django.db.models.functions.text.Lower('name'), name='unique_player_name_per_session', violation_error_message='В этой партии уже есть игрок с таким именем.'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0017_player_name_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='session',
+            name='tg_table',
+            field=models.PositiveSmallIntegerField(default=1, help_text='Номер стола, если в одном чате бот ведёт несколько партий', verbose_name='Стол в чате'),
+        ),
+    ]
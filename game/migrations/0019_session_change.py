@@ -0,0 +1,36 @@
+# Generated by Django 6.0 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0018_session_tg_table'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='gameevent',
+            name='kind',
+            field=models.CharField(choices=[('started', 'Игра создана'), ('players_added', 'Добавлены игроки'), ('roles_assigned', 'Выбран способ выдачи ролей'), ('phase', 'Смена фазы'), ('night_choice', 'Ночной выбор'), ('night_result', 'Итоги ночи'), ('lynch', 'Исключение на голосовании'), ('finished', 'Игра окончена'), ('reset', 'Игра сброшена'), ('linked', 'Игрок привязал Telegram'), ('web_edit', 'Правка с сайта'), ('snapshot', 'Снимок состояния')], max_length=20, verbose_name='Тип события'),
+        ),
+        migrations.CreateModel(
+            name='SessionChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_id', models.BigIntegerField(verbose_name='ID сессии')),
+                ('tg_chat_id', models.BigIntegerField(verbose_name='ID чата Telegram')),
+                ('tg_table', models.PositiveSmallIntegerField(default=1, verbose_name='Стол в чате')),
+                ('kind', models.CharField(choices=[('player_status', 'Статус игрока'), ('players_added', 'Добавлены игроки'), ('phase', 'Смена фазы'), ('status', 'Статус сессии')], max_length=20, verbose_name='Тип правки')),
+                ('payload', models.JSONField(blank=True, default=dict, verbose_name='Данные')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создана')),
+            ],
+            options={
+                'verbose_name': 'Правка партии с сайта',
+                'verbose_name_plural': 'Правки партий с сайта',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['session_id', 'id'], name='sessionchange_session_idx')],
+            },
+        ),
+    ]
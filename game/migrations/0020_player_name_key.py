@@ -0,0 +1,59 @@
+# Generated by Django 6.0 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+# max_length поля Player.name
+NAME_MAX_LENGTH = 100
+
+
+def suffixed_name(name: str, suffix: int) -> str:
+    """«Имя (2)» не длиннее Player.name: длинное имя укорачивается под суффикс."""
+    tail = f" ({suffix})"
+    return name[: NAME_MAX_LENGTH - len(tail)].rstrip() + tail
+
+
+def fill_name_keys(apps, schema_editor):
+    """
+    Ключ имени (casefold) для всех игроков. Повторы, которые старое
+    ограничение на LOWER(name) пропускало (кириллица в SQLite), — «Имя (2)».
+    """
+    Player = apps.get_model("game", "Player")
+    seen = set()
+    for player in Player.objects.order_by("session_id", "id").only("id", "session_id", "name"):
+        name = player.name
+        key = name.strip().casefold()
+        suffix = 2
+        while (player.session_id, key) in seen:
+            name = suffixed_name(player.name, suffix)
+            key = name.strip().casefold()
+            suffix += 1
+        seen.add((player.session_id, key))
+        player.name = name
+        player.name_key = key
+        player.save(update_fields=["name", "name_key"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0019_session_change'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='player',
+            name='unique_player_name_per_session',
+        ),
+        migrations.AddField(
+            model_name='player',
+            name='name_key',
+            field=models.CharField(default='', editable=False, max_length=200, verbose_name='Имя без учёта регистра'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_name_keys, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='player',
+            constraint=models.UniqueConstraint(fields=('session', 'name_key'), name='unique_player_name_per_session', violation_error_message='В этой партии уже есть игрок с таким именем.'),
+        ),
+    ]
@@ -81,11 +81,29 @@ class Session(models.Model):
         blank=True,
         related_name="sessions_in_phase",
     )
+    tg_chat_id = models.BigIntegerField(
+        "Telegram-чат",
+        null=True,
+        blank=True,
+        help_text="Чат, в котором партию ведёт бот (пусто для сессий с сайта)",
+    )
+    tg_table = models.PositiveSmallIntegerField(
+        "Стол в чате",
+        default=1,
+        help_text="Номер стола, если в одном чате бот ведёт несколько партий",
+    )
 
     class Meta:
         verbose_name = "Игровая сессия"
         verbose_name_plural = "Игровые сессии"
         ordering = ["-created_at"]
+        indexes = [
+            # бот ищет незавершённые партии (столы) своего чата после рестарта
+            models.Index(
+                fields=["tg_chat_id", "status"],
+                name="session_tg_chat_status_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"Сессия #{self.id} — {self.mode.name} ({self.get_status_display()})"
@@ -108,12 +126,25 @@ class Phase(models.Model):
         return self.name
 
 
+def player_name_key(name: str) -> str:
+    """
+    Имя игрока без учёта регистра — для уникальности имени в партии.
+    LOWER() и LIKE в SQLite приводят к нижнему регистру только латиницу,
+    поэтому ключ считается в Python (casefold) и хранится в Player.name_key.
+    """
+    return name.strip().casefold()
+
+
 class Player(models.Model):
     """Конкретный игрок в рамках сессии."""
     class PlayerStatus(models.TextChoices):
         ALIVE = "alive", "В игре"
         DEAD = "dead", "Выбыл"
 
+    class RoleDelivery(models.TextChoices):
+        SENT = "sent", "Доставлена"
+        FAILED = "failed", "Не доставлена"
+
     session = models.ForeignKey(
         Session,
         verbose_name="Сессия",
@@ -121,6 +152,8 @@ class Player(models.Model):
         related_name="players",
     )
     name = models.CharField("Имя в партии", max_length=100)
+    # casefold может удлинить строку (ß -> ss), отсюда запас по длине
+    name_key = models.CharField("Имя без учёта регистра", max_length=200, editable=False)
     role = models.ForeignKey(
         Role,
         verbose_name="Роль",
@@ -154,15 +187,43 @@ class Player(models.Model):
         blank=True,
     )
     notes = models.CharField("Примечания", max_length=300, blank=True)
+    tg_user_id = models.BigIntegerField(
+        "Telegram id игрока",
+        null=True,
+        blank=True,
+        db_index=True,
+        help_text="Игрок привязал себя к месту командой /join в чате партии",
+    )
+    role_delivery = models.CharField(
+        "Роль в личные сообщения",
+        max_length=10,
+        choices=RoleDelivery.choices,
+        blank=True,
+    )
 
     class Meta:
         verbose_name = "Игрок"
         verbose_name_plural = "Игроки"
         ordering = ["session", "seat_number", "name"]
+        constraints = [
+            # бот и сайт ищут игрока партии по имени без учёта регистра
+            models.UniqueConstraint(
+                fields=["session", "name_key"],
+                name="unique_player_name_per_session",
+                violation_error_message="В этой партии уже есть игрок с таким именем.",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.name} (сессия #{self.session_id})"
 
+    def save(self, *args, **kwargs):
+        self.name_key = player_name_key(self.name)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "name" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "name_key"}
+        super().save(*args, **kwargs)
+
 
 class Vote(models.Model):
     """Голос одного игрока против другого в конкретной фазе."""
@@ -235,6 +296,138 @@ class Result(models.Model):
         return f"Результат сессии #{self.session_id} ({self.get_winner_side_display()})"
 
 
+class GameEvent(models.Model):
+    """
+    Событие партии, которую ведёт Telegram-бот (журнал только на запись).
+
+    Состояние игры бота восстанавливается из последнего снимка (SNAPSHOT)
+    и событий после него.
+    """
+
+    class Kind(models.TextChoices):
+        STARTED = "started", "Игра создана"
+        PLAYERS_ADDED = "players_added", "Добавлены игроки"
+        ROLES_ASSIGNED = "roles_assigned", "Выбран способ выдачи ролей"
+        PHASE = "phase", "Смена фазы"
+        NIGHT_CHOICE = "night_choice", "Ночной выбор"
+        NIGHT_RESULT = "night_result", "Итоги ночи"
+        LYNCH = "lynch", "Исключение на голосовании"
+        FINISHED = "finished", "Игра окончена"
+        RESET = "reset", "Игра сброшена"
+        LINKED = "linked", "Игрок привязал Telegram"
+        WEB_EDIT = "web_edit", "Правка с сайта"
+        SNAPSHOT = "snapshot", "Снимок состояния"
+
+    session = models.ForeignKey(
+        Session,
+        verbose_name="Сессия",
+        on_delete=models.CASCADE,
+        related_name="events",
+    )
+    seq = models.PositiveIntegerField("Номер события в партии")
+    kind = models.CharField("Тип события", max_length=20, choices=Kind.choices)
+    payload = models.JSONField("Данные", default=dict, blank=True)
+    created_at = models.DateTimeField("Создано", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Событие партии"
+        verbose_name_plural = "События партий"
+        ordering = ["session", "seq"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["session", "seq"],
+                name="unique_event_seq_per_session",
+            ),
+        ]
+        indexes = [
+            # поиск последнего снимка партии
+            models.Index(
+                fields=["session", "kind", "seq"],
+                name="gameevent_session_kind_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"#{self.seq} {self.get_kind_display()} (сессия #{self.session_id})"
+
+
+class PhaseTimer(models.Model):
+    """
+    Таймер дневной фазы партии бота (речь игрока или общее обсуждение).
+
+    У партии не больше одного таймера. Запись нужна, чтобы таймеры
+    переживали перезапуск бота: при старте он читает их все и заводит заново.
+    """
+
+    class Kind(models.TextChoices):
+        SPEECH = "speech", "Речь игрока"
+        DISCUSSION = "discussion", "Обсуждение"
+
+    session = models.OneToOneField(
+        Session,
+        verbose_name="Сессия",
+        on_delete=models.CASCADE,
+        related_name="timer",
+    )
+    tg_chat_id = models.BigIntegerField("ID чата Telegram")
+    kind = models.CharField("Тип таймера", max_length=20, choices=Kind.choices)
+    round = models.PositiveIntegerField("Круг")
+    speaker = models.PositiveSmallIntegerField(
+        "Место говорящего игрока",
+        null=True,
+        blank=True,
+    )
+    deadline = models.DateTimeField("Срабатывает", db_index=True)
+
+    class Meta:
+        verbose_name = "Таймер фазы"
+        verbose_name_plural = "Таймеры фаз"
+        ordering = ["deadline"]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} до {self.deadline:%H:%M:%S} (сессия #{self.session_id})"
+
+
+class SessionChange(models.Model):
+    """
+    Правка партии Telegram-бота, сделанная на сайте (лента изменений для бота).
+
+    Сайт дописывает строку в той же транзакции, что и саму правку. Бот
+    читает ленту по возрастанию id от своего курсора и применяет правки
+    к партиям в памяти; партия, поднятая из БД, догоняет ленту по session_id.
+    Правки сессий без чата (обычные партии сайта) не пишутся.
+    """
+
+    class Kind(models.TextChoices):
+        PLAYER_STATUS = "player_status", "Статус игрока"
+        PLAYERS_ADDED = "players_added", "Добавлены игроки"
+        PHASE = "phase", "Смена фазы"
+        STATUS = "status", "Статус сессии"
+
+    # не внешний ключ: запись об удалении сессии должна пережить саму сессию
+    session_id = models.BigIntegerField("ID сессии")
+    tg_chat_id = models.BigIntegerField("ID чата Telegram")
+    tg_table = models.PositiveSmallIntegerField("Стол в чате", default=1)
+    kind = models.CharField("Тип правки", max_length=20, choices=Kind.choices)
+    payload = models.JSONField("Данные", default=dict, blank=True)
+    created_at = models.DateTimeField("Создана", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Правка партии с сайта"
+        verbose_name_plural = "Правки партий с сайта"
+        ordering = ["id"]
+        indexes = [
+            # догон ленты при восстановлении партии
+            models.Index(
+                fields=["session_id", "id"],
+                name="sessionchange_session_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"#{self.id} {self.get_kind_display()} (сессия #{self.session_id})"
+
+
 class Profile(models.Model):
     class Role(models.TextChoices):
         ADMIN = "admin", "Администратор"
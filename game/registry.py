@@ -0,0 +1,128 @@
+import threading
+
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Mode, Phase, Role
+
+User = get_user_model()
+
+
+class ReferenceRegistry:
+    """
+    Кэш справочников процесса: роли, фазы, режимы и нужные пользователи.
+
+    Эти таблицы почти не меняются, поэтому читаем их один раз (warm)
+    и дальше отдаём из памяти — и сайту (game/logic.py), и боту.
+    Сохранение/удаление Role, Phase, Mode или User в этом процессе
+    сбрасывает кэш через сигналы, следующее обращение перечитает таблицы.
+
+    Всё, что посчитано на основе справочников (например, набор ролей
+    под число игроков), можно запомнить через memo() — оно сбрасывается
+    вместе с кэшем.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._data = None
+        self._users: dict = {}
+        self._user_ids: set[int] = set()
+        self._memo: dict = {}
+
+    # Загрузка / сброс
+
+    def warm(self, user_ids=()):
+        """Прочитать справочники (и указанных пользователей) из БД."""
+        with self._lock:
+            self._user_ids.update(uid for uid in user_ids if uid is not None)
+
+            if self._data is None:
+                roles = list(Role.objects.all())
+                self._data = {
+                    "roles": roles,
+                    "roles_by_name": {r.name.lower(): r for r in roles},
+                    "phases": list(Phase.objects.order_by("order")),
+                    "modes": list(Mode.objects.order_by("id")),
+                }
+
+            missing = self._user_ids - self._users.keys()
+            if missing:
+                found = {u.id: u for u in User.objects.filter(id__in=missing)}
+                # несуществующих тоже запоминаем (None), чтобы не искать снова
+                for user_id in missing:
+                    self._users[user_id] = found.get(user_id)
+
+    @property
+    def ready(self) -> bool:
+        """Справочники и запрошенные пользователи уже в памяти (без запросов к БД)."""
+        return self._data is not None and self._user_ids <= self._users.keys()
+
+    def invalidate(self):
+        """Сбросить справочники и всё, что на них посчитано."""
+        with self._lock:
+            self._data = None
+            self._memo.clear()
+
+    def invalidate_users(self):
+        with self._lock:
+            self._users.clear()
+
+    def _get(self, key: str):
+        data = self._data
+        if data is None:
+            self.warm()
+            data = self._data
+        return data[key]
+
+    # Доступ к данным
+
+    def roles(self) -> list[Role]:
+        return list(self._get("roles"))
+
+    def role(self, name: str) -> Role | None:
+        """Роль по названию (без учёта регистра)."""
+        return self._get("roles_by_name").get(name.lower())
+
+    def phases(self) -> list[Phase]:
+        """Фазы по порядку (Phase.order)."""
+        return list(self._get("phases"))
+
+    def mode(self, mode_id) -> Mode | None:
+        for mode in self._get("modes"):
+            if mode.id == mode_id:
+                return mode
+        return None
+
+    def first_mode(self) -> Mode | None:
+        modes = self._get("modes")
+        return modes[0] if modes else None
+
+    def user(self, user_id):
+        """Пользователь по id (запоминается после первого обращения)."""
+        if user_id not in self._users:
+            self.warm(user_ids=[user_id])
+        return self._users.get(user_id)
+
+    def memo(self, key, factory):
+        """Значение, посчитанное по справочникам: factory() вызывается один раз."""
+        if key not in self._memo:
+            value = factory()
+            with self._lock:
+                self._memo.setdefault(key, value)
+        return self._memo[key]
+
+
+registry = ReferenceRegistry()
+
+
+@receiver([post_save, post_delete], sender=Role)
+@receiver([post_save, post_delete], sender=Phase)
+@receiver([post_save, post_delete], sender=Mode)
+def _reference_changed(sender, **kwargs):
+    registry.invalidate()
+
+
+@receiver([post_save, post_delete], sender=User)
+def _user_changed(sender, **kwargs):
+    registry.invalidate_users()
@@ -1,3 +1,1290 @@
-from django.test import TestCase
+import asyncio
+import importlib
+import itertools
+import json
+import os
+import queue
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from types import SimpleNamespace
 
-# Create your tests here.
+import httpx
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.contrib.messages.storage.session import SessionStorage
+from django.db import IntegrityError, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.error import RetryAfter
+
+from game import views
+from game.bot.changes import ChangeCursor
+from game.bot.fake_api import FakeBotAPI
+from game.bot.flood import FloodGuard
+from game.bot.outbound import OutboundRateLimiter, OutboundScheduler, TokenBucket
+from game.bot.sharding import ShardRouter, read_updates_file, shard_for, update_chat_id
+from game.bot.tables import DEFAULT_TABLE, TableMap
+from game.bot.timers import TimerWheel
+from game.bot.webhook import SECRET_HEADER, WebhookServer, replay_updates
+from game.bot.writer import WriteBehindQueue
+from game.forms import PlayerForm
+from game.logic import build_players
+from game.management.commands.runbot import Command as BotCommand
+from game.models import GameEvent, Mode, Phase, Player, Role, Session, SessionChange
+from game.registry import registry
+
+User = get_user_model()
+
+# лимиты Telegram в тестах не нужны
+UNLIMITED = 1e9
+
+NAMES = ["Аня", "Боря", "Вера", "Гена", "Даша", "Егор"]
+
+# фоновые задачи бота в тестах не запускаем, исходящие не придерживаем
+BOT_SETTINGS = {
+    "TG_BOT_CHANGE_FEED_INTERVAL": 0,
+    "TG_BOT_RECONCILE_INTERVAL": 0,
+    "TG_BOT_MEMPROF": False,
+    "TG_BOT_MEMPROF_INTERVAL": 0,
+    "TG_BOT_STATS_LOG_INTERVAL": 0,
+    "TG_BOT_EVICTION_INTERVAL": 0,
+    "TG_BOT_OUTBOUND_MERGE_DELAY": 0,
+    "TG_BOT_OUTBOUND_GLOBAL_RATE": UNLIMITED,
+    "TG_BOT_OUTBOUND_CHAT_RATE": UNLIMITED,
+    "TG_BOT_OUTBOUND_GROUP_RATE": UNLIMITED,
+    "TG_BOT_OUTBOUND_CHAT_BURST": UNLIMITED,
+    "TG_BOT_SPEECH_SECONDS": {"classic": 0, "sport": 0},
+    "TG_BOT_DISCUSSION_SECONDS": {"classic": 0, "sport": 0},
+}
+
+
+def make_update(update_id: int, chat_id: int, text: str = None, data: str = None, user: int = 7) -> dict:
+    """Апдейт Bot API (dict): сообщение text или нажатие кнопки data."""
+    sender = {"id": user, "is_bot": False, "first_name": "Ведущий"}
+    message = {
+        "message_id": update_id,
+        "date": 0,
+        "chat": {"id": chat_id, "type": "group"},
+        "from": sender,
+    }
+    if data:
+        message["from"] = FakeBotAPI.BOT_USER
+        message["text"] = "Кнопки"
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": sender,
+                "chat_instance": str(chat_id),
+                "data": data,
+                "message": message,
+            },
+        }
+
+    message["text"] = text
+    if text.startswith("/"):
+        message["entities"] = [
+            {"type": "bot_command", "offset": 0, "length": len(text.split()[0])}
+        ]
+    return {"update_id": update_id, "message": message}
+
+
+class FakeClock:
+    """Часы для бакетов и курсоров: время двигает сам тест."""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def new_bot() -> BotCommand:
+    bot = BotCommand(stdout=StringIO(), stderr=StringIO())
+    # тесты шлют апдейты без пауз — входящие лимиты их бы обрезали
+    bot.flood = FloodGuard(chat_rate=0, user_rate=0, debounce=0)
+    return bot
+
+
+@override_settings(**BOT_SETTINGS)
+class BotTestCase(TestCase):
+    """
+    Бот целиком: обработчики runbot поверх FakeBotAPI на тестовой БД.
+
+    Апдейты проходят через app.process_update, после каждого очереди
+    исходящих и отложенной записи дописываются — состояние бота и БД
+    можно сразу проверять.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create(id=1, username="host")
+        Mode.objects.create(id=1, name="Классическая", min_players=6, max_players=20)
+        Mode.objects.create(id=2, name="Спортивная", min_players=10, max_players=10)
+        for order, name in enumerate(["Ночь", "День", "Голосование"], 1):
+            Phase.objects.create(name=name, order=order)
+        for name in BotCommand.ROLE_DB_NAMES.values():
+            Role.objects.create(name=name, description=name)
+
+    def setUp(self):
+        registry.invalidate()
+        registry.invalidate_users()
+        self.update_id = 0
+
+    async def start_bot(self):
+        self.api = FakeBotAPI()
+        self.bot = new_bot()
+        self.app = self.bot.build_application(
+            "0:test",
+            request=self.api,
+            rate_limiter=OutboundRateLimiter(
+                global_rate=UNLIMITED,
+                chat_rate=UNLIMITED,
+                group_rate=UNLIMITED,
+                chat_burst=UNLIMITED,
+            ),
+        )
+        await self.app.initialize()
+        await self.bot._post_init(self.app)
+
+    async def stop_bot(self):
+        await self.bot._post_stop(self.app)
+        await self.app.shutdown()
+        await self.bot._post_shutdown(self.app)
+
+    def update(self, chat_id: int, text: str = None, data: str = None, user: int = 7) -> dict:
+        self.update_id += 1
+        return make_update(self.update_id, chat_id, text, data, user)
+
+    async def send(self, chat_id: int, text: str = None, data: str = None, user: int = 7):
+        update = Update.de_json(self.update(chat_id, text, data, user), self.app.bot)
+        await self.app.process_update(update)
+        await self.bot.roles_dm.flush()
+        await self.bot.outbound.flush()
+        await self.bot.writer.flush()
+
+    async def start_game(self, chat_id: int):
+        for text in ["/startgame 6", "/addplayer", "\n".join(NAMES), "/assign random"]:
+            await self.send(chat_id, text)
+        return self.bot.games[chat_id, DEFAULT_TABLE]
+
+
+class FullGameTests(BotTestCase):
+    async def test_game_is_played_to_the_end(self):
+        await self.start_bot()
+        chat_id = -100
+        game = await self.start_game(chat_id)
+        self.assertEqual(game.phase, BotCommand.PHASE_NIGHT)
+        self.assertTrue(game.roles_assigned)
+
+        mafia_roles = (BotCommand.ROLE_MAFIA, BotCommand.ROLE_DON)
+        lynched_round = None
+        # ночью мафия убивает мирного, на голосовании исключают мафию
+        for _ in range(30):
+            if game.phase == BotCommand.PHASE_FINISHED:
+                break
+            alive = game.alive_players()
+            if game.phase == BotCommand.PHASE_NIGHT:
+                town = [p for p in alive if p.role not in mafia_roles]
+                await self.send(chat_id, f"/kill {town[0].name}")
+                await self.send(chat_id, "/next")
+            elif game.phase == BotCommand.PHASE_VOTE and lynched_round != game.round:
+                lynched_round = game.round
+                mafia = [p for p in alive if p.role in mafia_roles]
+                await self.send(chat_id, f"/lynch {mafia[0].name}")
+            else:
+                await self.send(chat_id, "/next")
+
+        self.assertEqual(game.phase, BotCommand.PHASE_FINISHED)
+        self.assertEqual(game.winner_side, "town")
+        self.assertIn("Победили мирные жители", "\n".join(
+            params["text"] for params in self.api.sent_messages(chat_id)
+        ))
+        await self.stop_bot()
+
+        session = await Session.objects.select_related("result").aget(id=game.db_session_id)
+        self.assertEqual(session.status, Session.Status.FINISHED)
+        self.assertEqual(session.result.winner_side, "town")
+        alive = {
+            name async for name in Player.objects.filter(
+                session=session, status=Player.PlayerStatus.ALIVE
+            ).values_list("name", flat=True)
+        }
+        self.assertEqual(alive, {p.name for p in game.alive_players()})
+
+    async def test_game_is_restored_after_restart(self):
+        await self.start_bot()
+        chat_id = -101
+        game = await self.start_game(chat_id)
+        await self.send(chat_id, "/next")
+        players = [(p.name, p.role) for p in game.players]
+        alive = [p.name for p in game.alive_players()]
+        await self.stop_bot()
+
+        await self.start_bot()
+        await self.send(chat_id, "/players")
+        restored = self.bot.games[chat_id, DEFAULT_TABLE]
+        self.assertEqual(restored.phase, game.phase)
+        self.assertEqual(restored.round, game.round)
+        self.assertEqual([(p.name, p.role) for p in restored.players], players)
+        self.assertEqual([p.name for p in restored.alive_players()], alive)
+        self.assertEqual(restored.event_seq, game.event_seq)
+        await self.stop_bot()
+
+    async def test_restore_is_retried_after_db_error(self):
+        await self.start_bot()
+        chat_id = -105
+        await self.start_game(chat_id)
+        await self.stop_bot()
+
+        await self.start_bot()
+        load = self.bot._load_games_from_db
+        failures = [RuntimeError("database is locked")]
+
+        def flaky_load(chat_id):
+            if failures:
+                raise failures.pop()
+            return load(chat_id)
+
+        self.bot._load_games_from_db = flaky_load
+        await self.send(chat_id, "/players")
+        self.assertFalse(self.bot.games.tables(chat_id))
+
+        await self.send(chat_id, "/players")
+        game = self.bot.games[chat_id, DEFAULT_TABLE]
+        self.assertEqual([p.name for p in game.players], NAMES)
+        await self.stop_bot()
+
+    async def test_addplayer_mode_survives_restart(self):
+        await self.start_bot()
+        chat_id = -102
+        for text in ["/startgame 6", "/addplayer", "Аня\nБоря"]:
+            await self.send(chat_id, text)
+        await self.stop_bot()
+
+        await self.start_bot()
+        await self.send(chat_id, "Вера")
+        game = self.bot.games[chat_id, DEFAULT_TABLE]
+        self.assertTrue(game.adding_players)
+        self.assertEqual([p.name for p in game.players], ["Аня", "Боря", "Вера"])
+        await self.stop_bot()
+
+    async def test_journal_with_gap_is_not_replayed(self):
+        await self.start_bot()
+        chat_id = -103
+        game = await self.start_game(chat_id)
+        await self.send(chat_id, "/next")
+        session_id, last_seq = game.db_session_id, game.event_seq
+        await self.stop_bot()
+
+        # пачка с одним из событий не записалась
+        await GameEvent.objects.filter(session_id=session_id, seq=last_seq - 1).adelete()
+
+        await self.start_bot()
+        await self.send(chat_id, "/players")
+        restored = self.bot.games[chat_id, DEFAULT_TABLE]
+        # состояние — из Session / Player, нумерация журнала продолжается
+        self.assertEqual(restored.phase, BotCommand.PHASE_DAY)
+        self.assertEqual(restored.event_seq, last_seq + 1)
+        self.assertEqual(restored.snapshot_seq, last_seq + 1)
+        await self.stop_bot()
+
+        snapshot = await GameEvent.objects.filter(session_id=session_id).alatest("seq")
+        self.assertEqual(snapshot.kind, GameEvent.Kind.SNAPSHOT)
+
+
+class ReplyKeyboardTests(BotTestCase):
+    def keyboards(self, chat_id: int) -> list:
+        return [
+            params["reply_markup"] for params in self.api.sent_messages(chat_id)
+            if "keyboard" in params.get("reply_markup", {})
+        ]
+
+    async def test_keyboard_is_not_repeated(self):
+        await self.start_bot()
+        chat_id = -160
+        await self.start_game(chat_id)
+        shown = len(self.keyboards(chat_id))
+        self.assertTrue(shown)
+        await self.send(chat_id, "/players")
+        await self.send(chat_id, "/players")
+        self.assertEqual(len(self.keyboards(chat_id)), shown)
+        await self.stop_bot()
+
+    async def test_keyboard_is_resent_after_failed_delivery(self):
+        await self.start_bot()
+        chat_id = -161
+        await self.start_game(chat_id)
+        await self.send(chat_id, "/next")
+
+        # ответ с новой клавиатурой не дошёл (бота, например, ограничили в чате)
+        self.api.blocked.add(chat_id)
+        await self.send(chat_id, "/next")
+        self.assertNotIn(chat_id, self.bot._last_keyboard)
+
+        self.api.blocked.discard(chat_id)
+        shown = len(self.keyboards(chat_id))
+        await self.send(chat_id, "/players")
+        self.assertEqual(len(self.keyboards(chat_id)), shown + 1)
+        await self.stop_bot()
+
+
+class JoinTests(BotTestCase):
+    HOST = 7
+    STRANGER = 501
+
+    def dms(self, user_id: int) -> list[str]:
+        return [params["text"] for params in self.api.sent_messages(user_id)]
+
+    async def test_seat_is_linked_only_after_host_confirms(self):
+        await self.start_bot()
+        chat_id = -110
+        game = await self.start_game(chat_id)
+        seat = game.find_player("Аня").seat
+
+        await self.send(chat_id, "/join Аня", user=self.STRANGER)
+        self.assertIn("Ведущий, подтверди", self.api.sent_messages(chat_id)[-1]["text"])
+
+        # игрок сам нажимает «Подтвердить» — место не привязывается
+        await self.send(chat_id, data=f"join:{DEFAULT_TABLE}:{seat}:{self.STRANGER}", user=self.STRANGER)
+        self.assertIsNone(game.players[seat].tg_user_id)
+        self.assertEqual(self.dms(self.STRANGER), [])
+        answer = [params for method, params in self.api.calls if method == "answerCallbackQuery"][-1]
+        self.assertTrue(answer.get("show_alert"))
+
+        await self.send(chat_id, data=f"join:{DEFAULT_TABLE}:{seat}:{self.STRANGER}", user=self.HOST)
+        self.assertEqual(game.players[seat].tg_user_id, self.STRANGER)
+        self.assertEqual(len(self.dms(self.STRANGER)), 1)
+        await self.stop_bot()
+
+        player = await Player.objects.aget(id=game.players[seat].db_id)
+        self.assertEqual(player.tg_user_id, self.STRANGER)
+        self.assertEqual(player.role_delivery, "sent")
+
+    async def test_host_can_deny_join(self):
+        await self.start_bot()
+        chat_id = -111
+        game = await self.start_game(chat_id)
+
+        await self.send(chat_id, "/join Боря", user=self.STRANGER)
+        await self.send(chat_id, data=f"nojoin:{DEFAULT_TABLE}:1:{self.STRANGER}", user=self.HOST)
+        self.assertIsNone(game.players[1].tg_user_id)
+        self.assertEqual(self.dms(self.STRANGER), [])
+        await self.stop_bot()
+
+    async def test_roles_are_resent_after_forbidden(self):
+        await self.start_bot()
+        chat_id = -112
+        game = await self.start_game(chat_id)
+        # игрок ещё не писал боту: личка отвечает 403
+        self.api.blocked.add(self.STRANGER)
+
+        await self.send(chat_id, "/join Вера", user=self.STRANGER)
+        await self.send(chat_id, data=f"join:{DEFAULT_TABLE}:2:{self.STRANGER}", user=self.HOST)
+        self.assertEqual(game.players[2].role_dm, "failed")
+        await self.send(chat_id, "/roles")
+        self.assertIn("Вера: ❌ не доставлена", self.api.sent_messages(chat_id)[-1]["text"])
+
+        self.api.blocked.clear()
+        attempts = len(self.dms(self.STRANGER))
+        await self.send(chat_id, "/roles resend")
+        self.assertEqual(self.api.sent_messages(chat_id)[-1]["text"], "Отправляю роли заново: 1.")
+        self.assertEqual(game.players[2].role_dm, "sent")
+        self.assertEqual(len(self.dms(self.STRANGER)), attempts + 1)
+
+        await self.send(chat_id, "/roles resend")
+        self.assertEqual(
+            self.api.sent_messages(chat_id)[-1]["text"],
+            "Всем привязанным игрокам роли уже доставлены.",
+        )
+        await self.stop_bot()
+
+    async def test_start_in_private_chat_delivers_failed_role(self):
+        await self.start_bot()
+        chat_id = -113
+        game = await self.start_game(chat_id)
+        self.api.blocked.add(self.STRANGER)
+        await self.send(chat_id, "/join Гена", user=self.STRANGER)
+        await self.send(chat_id, data=f"join:{DEFAULT_TABLE}:3:{self.STRANGER}", user=self.HOST)
+        self.assertEqual(game.players[3].role_dm, "failed")
+
+        # игрок открыл личный чат с ботом и нажал «Start»
+        self.api.blocked.clear()
+        attempts = len(self.dms(self.STRANGER))
+        self.update_id += 1
+        data = make_update(self.update_id, self.STRANGER, "/start", user=self.STRANGER)
+        data["message"]["chat"]["type"] = "private"
+        await self.app.process_update(Update.de_json(data, self.app.bot))
+        await self.bot.roles_dm.flush()
+        await self.bot.outbound.flush()
+
+        self.assertEqual(game.players[3].role_dm, "sent")
+        # приветствие и роль
+        self.assertEqual(len(self.dms(self.STRANGER)), attempts + 2)
+        await self.stop_bot()
+
+
+class EvictionTests(BotTestCase):
+    async def start_bot(self):
+        await super().start_bot()
+        self.clock = FakeClock()
+        self.bot.eviction.clock = self.clock
+
+    async def test_idle_game_is_evicted_and_restored(self):
+        await self.start_bot()
+        self.bot.eviction.ttl = 60
+        chat_id = -120
+        game = await self.start_game(chat_id)
+        await self.send(chat_id, "/next")
+        players = [(p.name, p.role, p.seat) for p in game.players]
+        alive = [p.name for p in game.alive_players()]
+
+        self.clock.now += 30
+        self.assertEqual(await self.bot._evict_idle_games(), 0)
+        self.clock.now += 60
+        self.assertEqual(await self.bot._evict_idle_games(), 1)
+        self.assertFalse(self.bot.games.tables(chat_id))
+
+        await self.send(chat_id, "/players")
+        restored = self.bot.games[chat_id, DEFAULT_TABLE]
+        self.assertIsNot(restored, game)
+        self.assertEqual(restored.phase, BotCommand.PHASE_DAY)
+        self.assertEqual(restored.round, game.round)
+        self.assertEqual([(p.name, p.role, p.seat) for p in restored.players], players)
+        self.assertEqual([p.name for p in restored.alive_players()], alive)
+        self.assertEqual(restored.db_session_id, game.db_session_id)
+
+        # партия продолжается с того же места, журнал — без пропусков
+        await self.send(chat_id, "/next")
+        self.assertEqual(restored.phase, BotCommand.PHASE_VOTE)
+        await self.stop_bot()
+
+    async def test_least_recent_chat_is_evicted_over_memory_budget(self):
+        await self.start_bot()
+        self.bot.eviction.ttl = 0
+        old_chat, new_chat = -121, -122
+        await self.start_game(old_chat)
+        self.clock.now += 10
+        await self.start_game(new_chat)
+
+        size = self.bot.eviction.game_size(self.bot.games.by_chat)
+        self.bot.eviction.memory_budget = int(size * 1.5)
+        self.assertEqual(await self.bot._evict_idle_games(), 1)
+        self.assertFalse(self.bot.games.tables(old_chat))
+        self.assertTrue(self.bot.games.tables(new_chat))
+
+        await self.send(old_chat, "/players")
+        self.assertEqual(
+            [p.name for p in self.bot.games[old_chat, DEFAULT_TABLE].players], NAMES
+        )
+        await self.stop_bot()
+
+
+class AbandonedSessionTests(BotTestCase):
+    async def create_session(self, chat_id: int, age: timedelta, status=Session.Status.ACTIVE):
+        session = await Session.objects.acreate(
+            mode_id=1, host_id=1, players_count=6, tg_chat_id=chat_id, status=status
+        )
+        # created_at ставится при создании — состариваем отдельным UPDATE
+        await Session.objects.filter(id=session.id).aupdate(created_at=timezone.now() - age)
+        return session.id
+
+    async def test_only_own_shard_sessions_are_cancelled(self):
+        old, fresh = timedelta(days=2), timedelta(minutes=5)
+        chats = [-130, -131, -132, -133]
+        stale = {chat_id: await self.create_session(chat_id, old) for chat_id in chats}
+        fresh_id = await self.create_session(-134, fresh)
+        finished_id = await self.create_session(-136, old, status=Session.Status.FINISHED)
+
+        await self.start_bot()
+        self.bot.shard = (1, 2)
+        cutoff = timezone.now() - timedelta(days=1)
+        cancelled = await self.bot._cancel_abandoned_sessions(cutoff)
+        await self.stop_bot()
+
+        expected = {stale[chat_id] for chat_id in chats if shard_for(chat_id, 2) == 1}
+        self.assertEqual(set(cancelled), expected)
+        statuses = {
+            session_id: status async for session_id, status in
+            Session.objects.values_list("id", "status")
+        }
+        for chat_id, session_id in stale.items():
+            self.assertEqual(
+                statuses[session_id],
+                Session.Status.CANCELLED if session_id in expected else Session.Status.ACTIVE,
+            )
+        self.assertEqual(statuses[fresh_id], Session.Status.ACTIVE)
+        self.assertEqual(statuses[finished_id], Session.Status.FINISHED)
+
+    async def test_abandoned_game_is_dropped_from_memory(self):
+        await self.start_bot()
+        chat_id = -137
+        game = await self.start_game(chat_id)
+        await Session.objects.filter(id=game.db_session_id).aupdate(
+            created_at=timezone.now() - timedelta(days=2)
+        )
+        await GameEvent.objects.filter(session_id=game.db_session_id).aupdate(
+            created_at=timezone.now() - timedelta(days=2)
+        )
+
+        self.assertEqual(await self.bot._drop_abandoned_games(24 * 60 * 60), 1)
+        self.assertFalse(self.bot.games.tables(chat_id))
+        await self.stop_bot()
+        session = await Session.objects.aget(id=game.db_session_id)
+        self.assertEqual(session.status, Session.Status.CANCELLED)
+
+
+class WebEditTests(BotTestCase):
+    async def toggle_on_site(self, player_id: int):
+        """Ведущий переключает статус игрока в кабинете на сайте."""
+        host, _ = await User.objects.aget_or_create(username="admin", is_superuser=True)
+        session_id = await Player.objects.filter(id=player_id).values_list("session_id", flat=True).aget()
+        request = RequestFactory().post(
+            reverse("game:player_toggle_status", args=[session_id, player_id])
+        )
+        request.user = host
+        response = await sync_to_async(views.player_toggle_status)(request, session_id, player_id)
+        self.assertEqual(response.status_code, 302)
+
+    async def poll_changes(self):
+        """Один проход ленты правок, как в _poll_changes_forever, и обработка её очереди."""
+        await self.bot._poll_changes()
+        queue = self.app.update_queue
+        while not queue.empty():
+            await self.app.process_update(queue.get_nowait())
+        await self.bot.outbound.flush()
+        await self.bot.writer.flush()
+
+    async def test_site_toggle_reaches_running_game(self):
+        await self.start_bot()
+        chat_id = -140
+        game = await self.start_game(chat_id)
+        vera = game.find_player("Вера")
+
+        await self.toggle_on_site(vera.db_id)
+        await self.poll_changes()
+        self.assertFalse(game.is_alive(vera))
+        self.assertIn("Вера выбывает", self.api.sent_messages(chat_id)[-1]["text"])
+
+        event = await GameEvent.objects.filter(session_id=game.db_session_id).alatest("seq")
+        self.assertEqual(event.kind, GameEvent.Kind.WEB_EDIT)
+        self.assertEqual(event.payload["player_id"], vera.db_id)
+        self.assertFalse(event.payload["alive"])
+        self.assertEqual(event.seq, game.event_seq)
+
+        # повторный проход ленты правку не применяет второй раз
+        await self.toggle_on_site(vera.db_id)
+        await self.poll_changes()
+        await self.poll_changes()
+        self.assertTrue(game.is_alive(vera))
+        self.assertEqual(self.bot.web_edits, 2)
+        await self.stop_bot()
+
+    async def test_evicted_game_catches_up_on_restore(self):
+        await self.start_bot()
+        chat_id = -141
+        game = await self.start_game(chat_id)
+        vera_id = game.find_player("Вера").db_id
+        self.bot.eviction.ttl = 60
+        self.bot.eviction.clock = FakeClock(time.monotonic() + 120)
+        self.assertEqual(await self.bot._evict_idle_games(), 1)
+
+        # партии нет в памяти — лента её правку пропускает
+        await self.toggle_on_site(vera_id)
+        await self.poll_changes()
+        self.assertEqual(self.bot.web_edits, 0)
+
+        await self.send(chat_id, "/players")
+        restored = self.bot.games[chat_id, DEFAULT_TABLE]
+        self.assertFalse(restored.is_alive(restored.find_player("Вера")))
+        self.assertEqual(self.bot.web_edits, 1)
+        await self.stop_bot()
+
+        kinds = [
+            kind async for kind in GameEvent.objects
+            .filter(session_id=game.db_session_id).order_by("seq").values_list("kind", flat=True)
+        ]
+        self.assertEqual(kinds[-1], GameEvent.Kind.WEB_EDIT)
+
+
+class ReconcileTests(BotTestCase):
+    async def test_rows_changed_by_hand_are_repaired(self):
+        await self.start_bot()
+        chat_id = -150
+        game = await self.start_game(chat_id)
+        await self.send(chat_id, "/next")
+        anya, borya = game.find_player("Аня"), game.find_player("Боря")
+        session_id, borya_id = game.db_session_id, borya.db_id
+
+        # строки в БД правят в обход бота
+        await Session.objects.filter(id=session_id).aupdate(current_round=7)
+        await Player.objects.filter(id=anya.db_id).aupdate(
+            status=Player.PlayerStatus.DEAD, fail_round=1
+        )
+        await Player.objects.filter(id=borya_id).adelete()
+
+        stats = await self.bot._reconcile()
+        await self.bot.writer.flush()
+        self.assertEqual(stats.games, 1)
+        self.assertEqual(stats.mismatches["Session.current_round"], 1)
+        self.assertEqual(stats.mismatches["Player.status"], 1)
+        self.assertEqual(stats.mismatches["нет строки Player"], 1)
+
+        session = await Session.objects.aget(id=session_id)
+        self.assertEqual(session.current_round, game.round)
+        row = await Player.objects.aget(id=anya.db_id)
+        self.assertEqual(row.status, Player.PlayerStatus.ALIVE)
+        self.assertIsNone(row.fail_round)
+        # удалённого игрока создали заново и связали с игроком в памяти
+        self.assertNotEqual(borya.db_id, borya_id)
+        row = await Player.objects.aget(id=borya.db_id)
+        self.assertEqual((row.session_id, row.name), (session_id, "Боря"))
+
+        # второй проход расхождений уже не находит
+        stats = await self.bot._reconcile()
+        self.assertFalse(stats.mismatches)
+        await self.stop_bot()
+
+    async def test_game_with_unapplied_site_edit_is_skipped(self):
+        await self.start_bot()
+        chat_id = -151
+        game = await self.start_game(chat_id)
+        vera = game.find_player("Вера")
+
+        # сайт уже записал правку, а бот её ещё не прочитал из ленты
+        await Player.objects.filter(id=vera.db_id).aupdate(status=Player.PlayerStatus.DEAD)
+        await SessionChange.objects.acreate(
+            session_id=game.db_session_id,
+            tg_chat_id=chat_id,
+            tg_table=DEFAULT_TABLE,
+            kind=SessionChange.Kind.PLAYER_STATUS,
+            payload={"player_id": vera.db_id, "name": vera.name, "alive": False},
+        )
+
+        stats = await self.bot._reconcile()
+        await self.bot.writer.flush()
+        self.assertEqual((stats.games, stats.skipped), (0, 1))
+        row = await Player.objects.aget(id=vera.db_id)
+        self.assertEqual(row.status, Player.PlayerStatus.DEAD)
+        await self.stop_bot()
+
+
+class PlayerNameKeyTests(TestCase):
+    """Имя игрока уникально в партии без учёта регистра: «Иван» и «иван» — один игрок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.host = User.objects.create(username="admin", is_superuser=True)
+        mode = Mode.objects.create(name="Классическая", min_players=6, max_players=20)
+        cls.session = Session.objects.create(mode=mode, host=cls.host, players_count=6)
+
+    def setUp(self):
+        self.ivan = Player.objects.create(session=self.session, name="Иван")
+
+    def test_save_fills_name_key(self):
+        self.assertEqual(self.ivan.name_key, "иван")
+        self.ivan.name = "  ИВАН Петров "
+        self.ivan.save(update_fields=["name"])
+        self.ivan.refresh_from_db()
+        self.assertEqual(self.ivan.name_key, "иван петров")
+
+    def test_build_players_fills_name_key(self):
+        players = build_players(self.session.id, ["Мария", "ОЛЕГ"])
+        self.assertEqual([p.name_key for p in players], ["мария", "олег"])
+
+    def test_form_rejects_name_in_other_case(self):
+        form = PlayerForm({"name": "иван", "status": Player.PlayerStatus.ALIVE}, session=self.session)
+        self.assertFalse(form.is_valid())
+        self.assertIn("name", form.errors)
+
+        # сам игрок может сменить регистр своего имени
+        form = PlayerForm(
+            {"name": "ИВАН", "status": Player.PlayerStatus.ALIVE},
+            instance=self.ivan,
+            session=self.session,
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+
+    def test_bulk_add_skips_name_in_other_case(self):
+        request = RequestFactory().post(
+            reverse("game:player_add", args=[self.session.id]),
+            {"names": "иван, Пётр"},
+        )
+        request.user = self.host
+        # сообщения — в сессию: cookie-хранилищу нужен SECRET_KEY, а его задаёт окружение
+        request.session = {}
+        request._messages = SessionStorage(request)
+        response = views.player_add(request, self.session.id)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            sorted(self.session.players.values_list("name", flat=True)),
+            ["Иван", "Пётр"],
+        )
+        self.assertIn("иван", " ".join(str(m) for m in request._messages))
+
+    def test_db_rejects_name_in_other_case(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Player.objects.create(session=self.session, name="иван")
+        # bulk_create мимо save() упирается в то же ограничение
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Player.objects.bulk_create(build_players(self.session.id, ["ИВАН"]))
+
+
+class DuplicateNameMigrationTests(SimpleTestCase):
+    def test_suffixed_name_fits_player_name(self):
+        max_length = Player._meta.get_field("name").max_length
+        for module in ("0017_player_name_unique", "0020_player_name_key"):
+            migration = importlib.import_module(f"game.migrations.{module}")
+            self.assertEqual(migration.suffixed_name("Иван", 2), "Иван (2)")
+            name = migration.suffixed_name("Я" * max_length, 12)
+            self.assertEqual(len(name), max_length)
+            self.assertTrue(name.endswith("Я (12)"))
+
+
+class ShardingTests(SimpleTestCase):
+    def test_shard_for_matches_python_modulo(self):
+        self.assertEqual(shard_for(None, 4), 0)
+        self.assertEqual(shard_for(-1001, 1), 0)
+        self.assertEqual(shard_for(-1001, 4), -1001 % 4)
+        self.assertEqual(shard_for(1002, 4), 2)
+
+    def test_update_chat_id(self):
+        self.assertEqual(update_chat_id(make_update(1, -5, "/next")), -5)
+        self.assertEqual(update_chat_id(make_update(2, -5, data="kill:1:0")), -5)
+        inline = {"update_id": 3, "callback_query": {"id": "3", "from": {"id": 9}, "data": "x"}}
+        self.assertEqual(update_chat_id(inline), 9)
+        self.assertIsNone(update_chat_id({"update_id": 4, "poll": {}}))
+
+    def test_router_keeps_chat_order_in_one_queue(self):
+        queues = [queue.Queue(), queue.Queue(), queue.Queue()]
+        router = ShardRouter(queues)
+        updates = [make_update(i, chat_id, f"/next {i}") for i, chat_id in enumerate([-7, -8, -7, -9, -7])]
+        for data in updates:
+            router.route(data)
+
+        owner = queues[shard_for(-7, 3)]
+        routed = []
+        while not owner.empty():
+            routed.append(owner.get_nowait())
+        self.assertEqual(
+            [data["update_id"] for data in routed if update_chat_id(data) == -7], [0, 2, 4]
+        )
+        self.assertEqual(sum(router.routed), len(updates))
+
+    def test_offer_refuses_when_queue_is_full(self):
+        router = ShardRouter([queue.Queue(maxsize=1)])
+        self.assertTrue(router.offer(make_update(1, -7, "/next")))
+        self.assertFalse(router.offer(make_update(2, -7, "/next")))
+        self.assertEqual(router.routed, [1])
+
+
+class ReplayTests(BotTestCase):
+    def write_updates(self, updates) -> str:
+        fd, path = tempfile.mkstemp(suffix=".jsonl")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for data in updates:
+                f.write(json.dumps(data, ensure_ascii=False) + "\n\n")
+        self.addCleanup(os.remove, path)
+        return path
+
+    async def test_worker_replays_recorded_updates(self):
+        script = ["/startgame 6", "/addplayer", "\n".join(NAMES), "/assign random", "/next"]
+        chats = [-201, -202]
+        # записанные апдейты двух чатов вперемешку
+        path = self.write_updates(
+            self.update(chat_id, text) for text in script for chat_id in chats
+        )
+
+        updates = queue.Queue()
+        router = ShardRouter([updates])
+        for data in read_updates_file(path):
+            router.route(data)
+        router.close()
+
+        bot = new_bot()
+        await bot._serve_queue("0:test", FakeBotAPI(), updates)
+
+        for chat_id in chats:
+            game = bot.games[chat_id, DEFAULT_TABLE]
+            self.assertEqual(game.phase, BotCommand.PHASE_DAY)
+            self.assertEqual([p.name for p in game.players], NAMES)
+        self.assertEqual(
+            await Session.objects.filter(
+                tg_chat_id__in=chats, status=Session.Status.ACTIVE
+            ).acount(),
+            2,
+        )
+
+    async def test_webhook_replays_recorded_updates(self):
+        script = ["/startgame 6", "/addplayer", "\n".join(NAMES), "/assign random", "/next"]
+        path = self.write_updates(self.update(-203, text) for text in script)
+
+        bot = new_bot()
+        server = WebhookServer("webhook-secret", port=0)
+        await bot._serve_webhook("0:test", FakeBotAPI(), server, replay_file=path)
+
+        self.assertEqual(server.accepted, len(script))
+        game = bot.games[-203, DEFAULT_TABLE]
+        self.assertEqual(game.phase, BotCommand.PHASE_DAY)
+        self.assertEqual([p.name for p in game.players], NAMES)
+
+
+class WebhookServerTests(SimpleTestCase):
+    SECRET = "webhook-secret"
+
+    def setUp(self):
+        self.received = []
+        # сколько следующих апдейтов intake отклонит (очередь бота полна)
+        self.refuse = 0
+
+    def intake(self, data) -> bool:
+        if self.refuse:
+            self.refuse -= 1
+            return False
+        self.received.append(data)
+        return True
+
+    async def start_server(self) -> WebhookServer:
+        server = WebhookServer(self.SECRET, port=0, intake=self.intake)
+        await server.start()
+        return server
+
+    async def test_replayed_updates_are_accepted_in_order(self):
+        fd, path = tempfile.mkstemp(suffix=".jsonl")
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for i in range(5):
+                f.write(json.dumps(make_update(i, -7, f"/next {i}")) + "\n")
+
+        server = await self.start_server()
+        try:
+            # первый апдейт получит 503 и придёт повторно
+            self.refuse = 1
+            latencies = await replay_updates(server.url, path, self.SECRET, retry_delay=0)
+        finally:
+            await server.close()
+
+        self.assertEqual(len(latencies), 5)
+        self.assertEqual([data["update_id"] for data in self.received], list(range(5)))
+        self.assertEqual(server.overflows, 1)
+        self.assertEqual(server.accepted, 5)
+
+    async def test_bad_requests_are_rejected(self):
+        update = json.dumps(make_update(1, -7, "/next"))
+        server = await self.start_server()
+        try:
+            async with httpx.AsyncClient() as client:
+                async def status(body, secret=self.SECRET, path="/telegram", method="POST"):
+                    url = f"http://{server.listen}:{server.port}{path}"
+                    response = await client.request(
+                        method, url, content=body, headers={SECRET_HEADER: secret}
+                    )
+                    return response.status_code
+
+                self.assertEqual(await status(update, secret="wrong"), 403)
+                self.assertEqual(await status("не json"), 400)
+                self.assertEqual(await status(json.dumps({"message": {}})), 400)
+                self.assertEqual(await status(update, path="/other"), 404)
+                self.assertEqual(await status(update, method="GET"), 405)
+                self.assertEqual(await status(update), 200)
+        finally:
+            await server.close()
+
+        self.assertEqual(len(self.received), 1)
+        self.assertEqual(server.forbidden, 1)
+        self.assertEqual(server.bad, 2)
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_burst_then_refill(self):
+        clock = FakeClock()
+        bucket = TokenBucket(2, 3, clock=clock)
+        self.assertEqual([bucket.try_acquire() for _ in range(4)], [True, True, True, False])
+        self.assertAlmostEqual(bucket.delay(), 0.5)
+
+        clock.now += 0.5
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+
+    def test_refill_is_capped(self):
+        clock = FakeClock()
+        bucket = TokenBucket(2, 3, clock=clock)
+        bucket.try_acquire()
+        clock.now += 100
+        self.assertTrue(bucket.full)
+        self.assertEqual(bucket.tokens, 3)
+
+
+class OutboundRateLimiterTests(SimpleTestCase):
+    async def test_retry_after_pauses_chat_and_repeats_request(self):
+        limiter = OutboundRateLimiter(global_rate=UNLIMITED, group_rate=UNLIMITED, chat_burst=UNLIMITED)
+        attempts = []
+
+        async def send():
+            attempts.append(time.monotonic())
+            if len(attempts) == 1:
+                raise RetryAfter(1)
+            return "ok"
+
+        result = await limiter.process_request(send, (), {}, "sendMessage", {"chat_id": -5}, None)
+        self.assertEqual(result, "ok")
+        self.assertEqual(limiter.retries, 1)
+        # повтор — не раньше, чем просил Telegram
+        self.assertGreaterEqual(attempts[1] - attempts[0], 0.9)
+
+    async def test_retries_are_limited(self):
+        limiter = OutboundRateLimiter(max_retries=0)
+
+        async def send():
+            raise RetryAfter(1)
+
+        with self.assertRaises(RetryAfter):
+            await limiter.process_request(send, (), {}, "sendMessage", {"chat_id": -5}, None)
+
+    async def test_free_endpoints_do_not_spend_tokens(self):
+        limiter = OutboundRateLimiter(global_rate=1)
+
+        async def answer():
+            return True
+
+        for _ in range(5):
+            await limiter.process_request(answer, (), {}, "answerCallbackQuery", {}, None)
+        self.assertTrue(limiter.global_bucket.full)
+
+
+class RecordingBot:
+    """Бот для OutboundScheduler: запоминает отправленные сообщения и правки."""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.sent = []
+        self.edits = []
+        self._message_ids = itertools.count(1)
+
+    async def send_message(self, chat_id, text, reply_markup=None, reply_parameters=None):
+        if self.fail:
+            raise RuntimeError("сеть недоступна")
+        self.sent.append((chat_id, text, reply_markup))
+        return SimpleNamespace(message_id=next(self._message_ids))
+
+    async def edit_message_text(self, text, chat_id=None, message_id=None, reply_markup=None):
+        self.edits.append((message_id, text))
+        return True
+
+
+class OutboundSchedulerTests(SimpleTestCase):
+    def setUp(self):
+        self.bot = RecordingBot()
+        self.errors = []
+        self.scheduler = OutboundScheduler(merge_delay=0, on_error=self.errors.append)
+
+    async def test_consecutive_texts_are_merged(self):
+        futures = [self.scheduler.send(self.bot, -5, text) for text in ("раз", "два", "три")]
+        await self.scheduler.flush()
+
+        self.assertEqual(self.bot.sent, [(-5, "раз\n\nдва\n\nтри", None)])
+        self.assertEqual(self.scheduler.merged, 2)
+        messages = {(await future).message_id for future in futures}
+        self.assertEqual(messages, {1})
+
+    async def test_keyboard_and_merge_false_end_the_batch(self):
+        keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("Дальше", callback_data="next")]])
+        self.scheduler.send(self.bot, -5, "раз")
+        self.scheduler.send(self.bot, -5, "два", reply_markup=keyboard)
+        self.scheduler.send(self.bot, -5, "три")
+        self.scheduler.send(self.bot, -5, "четыре", merge=False)
+        self.scheduler.send(self.bot, -6, "другой чат")
+        await self.scheduler.flush()
+
+        self.assertEqual(
+            [(text, markup) for chat_id, text, markup in self.bot.sent if chat_id == -5],
+            [("раз\n\nдва", keyboard), ("три", None), ("четыре", None)],
+        )
+        self.assertIn((-6, "другой чат", None), self.bot.sent)
+
+    async def test_long_texts_are_not_merged(self):
+        text = "а" * (OutboundScheduler.MAX_TEXT_LENGTH - 1)
+        self.scheduler.send(self.bot, -5, text)
+        self.scheduler.send(self.bot, -5, text)
+        await self.scheduler.flush()
+        self.assertEqual(len(self.bot.sent), 2)
+
+    async def test_superseded_edit_is_skipped(self):
+        first = self.scheduler.edit(self.bot, -5, 42, "старый текст")
+        second = self.scheduler.edit(self.bot, -5, 42, "новый текст")
+        await self.scheduler.flush()
+
+        self.assertEqual(self.bot.edits, [(42, "новый текст")])
+        self.assertEqual(self.scheduler.superseded, 1)
+        self.assertIsNone(await first)
+        self.assertTrue(await second)
+
+    async def test_edit_waits_for_sent_message(self):
+        sent = self.scheduler.send(self.bot, -5, "панель")
+        self.scheduler.edit(self.bot, -5, sent, "панель, ход 2")
+        await self.scheduler.flush()
+        self.assertEqual(self.bot.edits, [(1, "панель, ход 2")])
+
+    async def test_failed_send_is_reported(self):
+        self.bot.fail = True
+        future = self.scheduler.send(self.bot, -5, "раз")
+        await self.scheduler.flush()
+
+        self.assertEqual(self.scheduler.failed, 1)
+        self.assertEqual(len(self.errors), 1)
+        with self.assertRaises(RuntimeError):
+            await future
+
+
+class WriteBehindQueueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        mode = Mode.objects.create(name="Классическая", min_players=6, max_players=20)
+        host = User.objects.create(username="host")
+        cls.session = Session.objects.create(mode=mode, host=host, players_count=6)
+
+    def setUp(self):
+        self.errors = []
+        self.writer = WriteBehindQueue(on_error=self.errors.append)
+
+    async def refresh(self) -> Session:
+        return await Session.objects.aget(id=self.session.id)
+
+    async def test_updates_of_one_row_are_merged(self):
+        await self.writer.update(Session, {"current_round": 2}, id=self.session.id)
+        await self.writer.update(
+            Session, {"current_round": 3, "status": Session.Status.ACTIVE}, id=self.session.id
+        )
+        self.assertEqual(self.writer.pending, 1)
+        await self.writer.flush()
+
+        session = await self.refresh()
+        self.assertEqual(session.current_round, 3)
+        self.assertEqual(session.status, Session.Status.ACTIVE)
+        self.assertEqual(self.writer.written, 1)
+
+    async def test_call_keeps_order_of_updates_around_it(self):
+        seen = []
+
+        def read_round():
+            seen.append(Session.objects.get(id=self.session.id).current_round)
+
+        await self.writer.update(Session, {"current_round": 2}, id=self.session.id)
+        await self.writer.call(read_round, models=(Session,))
+        await self.writer.update(Session, {"current_round": 3}, id=self.session.id)
+        # обновление после call не склеивается с обновлением до неё
+        self.assertEqual(self.writer.pending, 3)
+        await self.writer.flush()
+
+        self.assertEqual(seen, [2])
+        self.assertEqual((await self.refresh()).current_round, 3)
+
+    async def test_call_with_other_models_does_not_split_updates(self):
+        await self.writer.update(Session, {"current_round": 2}, id=self.session.id)
+        await self.writer.call(lambda: None, models=(Player,))
+        await self.writer.update(Session, {"current_round": 3}, id=self.session.id)
+        self.assertEqual(self.writer.pending, 2)
+        await self.writer.flush()
+
+        self.assertEqual((await self.refresh()).current_round, 3)
+
+    async def test_failed_operation_does_not_lose_batch(self):
+        def broken():
+            raise ValueError("битая операция")
+
+        await self.writer.call(broken, models=())
+        await self.writer.update(Session, {"current_round": 5}, id=self.session.id)
+        await self.writer.flush()
+
+        self.assertEqual((await self.refresh()).current_round, 5)
+        self.assertEqual(self.writer.written, 1)
+        self.assertTrue(any("битая операция" in error for error in self.errors))
+
+
+@override_settings(TG_BOT_DB_THREADS=1)
+class WriteBehindQueueThreadsTests(TransactionTestCase):
+    """Пачки пишутся в своём пуле потоков БД — вне транзакции теста."""
+
+    def setUp(self):
+        mode = Mode.objects.create(name="Классическая", min_players=6, max_players=20)
+        host = User.objects.create(username="host")
+        self.session = Session.objects.create(mode=mode, host=host, players_count=6)
+        self.bot = new_bot()
+        self.addCleanup(self.bot.db.close)
+
+    async def test_flush_waits_for_batch_in_flight(self):
+        writer = self.bot.writer
+        written = []
+
+        def slow_write():
+            time.sleep(0.2)
+            written.append(True)
+
+        await writer.update(Session, {"current_round": 2}, id=self.session.id)
+        await writer.call(slow_write, models=())
+        first = asyncio.create_task(writer.flush())
+        await asyncio.sleep(0.05)
+
+        # очередь уже пуста, но пачка ещё пишется — flush() её дожидается
+        self.assertEqual(writer.pending, 0)
+        await writer.flush()
+        self.assertEqual(written, [True])
+
+        await writer.update(Session, {"current_round": 3}, id=self.session.id)
+        await asyncio.gather(first, writer.flush())
+        session = await Session.objects.aget(id=self.session.id)
+        self.assertEqual(session.current_round, 3)
+
+
+class TimerWheelTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock(1000.0)
+        self.expired = []
+        self.wheel = TimerWheel(self.expired.append, resolution=1.0, slots=8, clock=self.clock)
+
+    def test_timer_fires_at_deadline(self):
+        self.wheel.schedule((-5, 1), 1010.5, payload="речь")
+        self.wheel.advance(1010.9)
+        self.assertEqual(self.expired, [])
+
+        self.wheel.advance(1011)
+        self.assertEqual([entry.payload for entry in self.expired], ["речь"])
+        # сработавший таймер остаётся, пока его не заберут
+        self.assertTrue(self.wheel.get((-5, 1)).fired)
+        self.assertIs(self.wheel.cancel((-5, 1)), self.expired[0])
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_deadline_beyond_one_turn_of_the_wheel(self):
+        self.wheel.schedule((-5, 1), 1020)
+        self.wheel.advance(1012)
+        self.assertEqual(self.expired, [])
+        self.wheel.advance(1020)
+        self.assertEqual(len(self.expired), 1)
+
+    def test_schedule_replaces_and_cancel_removes(self):
+        self.wheel.schedule((-5, 1), 1003, payload="старый")
+        self.wheel.schedule((-5, 1), 1005, payload="новый")
+        self.wheel.schedule((-6, 1), 1004)
+        self.wheel.cancel((-6, 1))
+        self.wheel.advance(1010)
+        self.assertEqual([entry.payload for entry in self.expired], ["новый"])
+        self.assertEqual(self.wheel.fired, 1)
+
+    def test_past_deadline_fires_on_next_tick(self):
+        self.wheel.schedule((-5, 1), 900)
+        self.wheel.advance(1000)
+        self.assertEqual(len(self.expired), 1)
+
+
+class ChangeCursorTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cursor = ChangeCursor(grace=30, max_gaps=5, clock=self.clock)
+
+    def test_gaps_are_rechecked_until_they_arrive(self):
+        self.cursor.advance([1, 2, 5, 6])
+        self.assertEqual(self.cursor.position, 6)
+        self.assertEqual(self.cursor.missing(), [3, 4])
+
+        # транзакция с id 4 закоммитилась позже
+        self.cursor.advance([4])
+        self.assertEqual(self.cursor.position, 6)
+        self.assertEqual(self.cursor.missing(), [3])
+
+    def test_gaps_are_forgotten_after_grace(self):
+        self.cursor.advance([1, 3])
+        self.clock.now += 31
+        self.assertEqual(self.cursor.missing(), [])
+
+    def test_gaps_are_limited(self):
+        self.cursor.advance([1, 100])
+        self.assertEqual(self.cursor.missing(), [95, 96, 97, 98, 99])
+
+
+class TableMapTests(SimpleTestCase):
+    def test_tables_are_indexed_by_chat(self):
+        games = TableMap()
+        games[-5, 1] = "стол 1"
+        games[-5, 2] = "стол 2"
+        games[-6, 1] = "другой чат"
+        games[-5, 1] = "стол 1, новая партия"
+
+        self.assertEqual(len(games), 3)
+        self.assertEqual(games.tables(-5), {1: "стол 1, новая партия", 2: "стол 2"})
+        self.assertEqual(sorted(games), [(-6, 1), (-5, 1), (-5, 2)])
+        self.assertIsNone(games.get((-7, 1)))
+
+    def test_chat_without_tables_leaves_index(self):
+        games = TableMap()
+        games[-5, 1] = "стол 1"
+        games[-5, 2] = "стол 2"
+        del games[-5, 1]
+        self.assertIn(-5, games.by_chat)
+        del games[-5, 2]
+        self.assertNotIn(-5, games.by_chat)
+        self.assertEqual(len(games), 0)
+        with self.assertRaises(KeyError):
+            del games[-5, 2]
+
+
+class FloodGuardTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def guard(self, **kwargs) -> FloodGuard:
+        options = {
+            "chat_rate": 1, "chat_burst": 3, "user_rate": 1, "user_burst": 2, "debounce": 1.0,
+        }
+        options.update(kwargs)
+        return FloodGuard(clock=self.clock, **options)
+
+    def test_user_limit_comes_before_chat_limit(self):
+        guard = self.guard()
+        self.assertEqual([guard.check(-5, 7) for _ in range(3)], [None, None, FloodGuard.USER])
+        # флудящий не потратил лимит чата: другой игрок проходит
+        self.assertIsNone(guard.check(-5, 8))
+        self.assertEqual(guard.check(-5, 9), FloodGuard.CHAT)
+        self.assertEqual(guard.dropped, {FloodGuard.USER: 1, FloodGuard.CHAT: 1, FloodGuard.REPEAT: 0})
+
+        self.clock.now += 1
+        self.assertIsNone(guard.check(-5, 7))
+
+    def test_repeated_tap_is_dropped_without_spending_limits(self):
+        guard = self.guard(user_burst=2)
+        tap = (10, "kill:1:0")
+        self.assertIsNone(guard.check(-5, 7, tap))
+        self.assertEqual(guard.check(-5, 7, tap), FloodGuard.REPEAT)
+        self.assertEqual(guard.check(-5, 7, tap), FloodGuard.REPEAT)
+        # другая кнопка — не повтор, и у пользователя ещё остался токен
+        self.assertIsNone(guard.check(-5, 7, (10, "kill:1:1")))
+
+        self.clock.now += 1.5
+        self.assertIsNone(guard.check(-5, 7, tap))
+
+    def test_zero_rate_disables_limit(self):
+        guard = self.guard(chat_rate=0, user_rate=0, debounce=0)
+        tap = (10, "kill:1:0")
+        self.assertTrue(all(guard.check(-5, 7, tap) is None for _ in range(100)))
+
+
+class FloodGateTests(BotTestCase):
+    async def test_dropped_tap_is_still_answered(self):
+        await self.start_bot()
+        chat_id = -104
+        await self.start_game(chat_id)
+        self.bot.flood = FloodGuard(chat_rate=0, user_rate=0, debounce=60)
+
+        # двойной тап по одной кнопке одного сообщения
+        for _ in range(2):
+            data = self.update(chat_id, data=f"kill:{DEFAULT_TABLE}:0")
+            data["callback_query"]["message"]["message_id"] = 1
+            await self.app.process_update(Update.de_json(data, self.app.bot))
+        await self.stop_bot()
+
+        self.assertEqual(self.bot.flood.dropped[FloodGuard.REPEAT], 1)
+        # у клиента не остаётся «часиков» на кнопке
+        self.assertEqual(self.api.counts["answerCallbackQuery"], 2)
@@ -1,4 +1,5 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.db import transaction
 from django.contrib import messages
 from django.urls import reverse
 from django.views.decorators.http import require_POST
@@ -7,13 +8,17 @@ from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
 from django.http import HttpResponseForbidden
 
-from .models import Session, Result, Role, Mode, Player, Phase, Profile
-from .forms import SessionForm, PlayerForm, RegisterForm
+from .models import Session, Result, Role, Mode, Player, Profile, SessionChange
+from .registry import registry
+from .forms import SessionForm, PlayerForm, PlayersBulkForm, RegisterForm
 from .logic import (
     assign_roles_randomly,
     advance_phase,
     assign_roles_sport,
     finish_game_if_needed,
+    add_players_bulk,
+    select_new_player_names,
+    record_session_change,
 )
 
 
@@ -243,7 +248,9 @@ def session_manage(request, session_id):
 
 def player_add(request, session_id):
     """
-    Добавление игрока в выбранную сессию.
+    Добавление игроков в выбранную сессию:
+    - по одному через полную форму игрока;
+    - списком имён — одним bulk_create, как в Telegram-боте.
     """
     forbidden = _ensure_host_or_admin(request)
     if forbidden:
@@ -251,19 +258,60 @@ def player_add(request, session_id):
 
     session = get_object_or_404(Session, id=session_id)
 
-    if request.method == "POST":
-        form = PlayerForm(request.POST)
+    form = PlayerForm(session=session)
+    bulk_form = PlayersBulkForm()
+
+    if request.method == "POST" and "names" in request.POST:
+        bulk_form = PlayersBulkForm(request.POST)
+        if bulk_form.is_valid():
+            existing = list(session.players.values_list("name_key", flat=True))
+            added, skipped_existing, skipped_full = select_new_player_names(
+                bulk_form.cleaned_data["names"],
+                existing,
+                session.players_count - len(existing),
+            )
+            if added:
+                with transaction.atomic():
+                    created = add_players_bulk(session.id, added)
+                    record_session_change(
+                        session,
+                        SessionChange.Kind.PLAYERS_ADDED,
+                        names=[p.name for p in created],
+                        ids=[p.id for p in created],
+                    )
+                messages.success(request, "Добавлены игроки: " + ", ".join(added))
+            if skipped_existing:
+                messages.warning(
+                    request,
+                    "Пропущены (уже есть в списке): " + ", ".join(skipped_existing),
+                )
+            if skipped_full:
+                messages.warning(
+                    request,
+                    "Достигнуто запланированное количество игроков. "
+                    "Лишние имена проигнорированы.",
+                )
+            return redirect("game:session_manage", session_id=session.id)
+
+    elif request.method == "POST":
+        form = PlayerForm(request.POST, session=session)
         if form.is_valid():
             player = form.save(commit=False)
             player.session = session
-            player.save()
+            with transaction.atomic():
+                player.save()
+                record_session_change(
+                    session,
+                    SessionChange.Kind.PLAYERS_ADDED,
+                    names=[player.name],
+                    ids=[player.id],
+                )
             return redirect("game:session_manage", session_id=session.id)
-    else:
-        form = PlayerForm()
 
     context = {
         "session": session,
         "form": form,
+        "bulk_form": bulk_form,
     }
     return render(request, "game/player_form.html", context)
 
@@ -289,9 +337,18 @@ def player_toggle_status(request, session_id, player_id):
         player.fail_phase = None
         player.fail_round = None
 
-    player.save()
-    # сразу проверяем, не закончилась ли игра
-    finish_game_if_needed(session)
+    with transaction.atomic():
+        player.save()
+        # бот ведёт эту партию — он узнает о правке из ленты SessionChange
+        record_session_change(
+            session,
+            SessionChange.Kind.PLAYER_STATUS,
+            player_id=player.id,
+            name=player.name,
+            alive=player.status == Player.PlayerStatus.ALIVE,
+        )
+        # сразу проверяем, не закончилась ли игра
+        finish_game_if_needed(session)
 
     return redirect("game:session_manage", session_id=session.id)
 
@@ -315,7 +372,9 @@ def session_delete(request, session_id):
     # Откуда вернуться после удаления
     next_url = request.POST.get("next") or reverse("game:host_sessions")
 
-    session.delete()
+    with transaction.atomic():
+        record_session_change(session, SessionChange.Kind.STATUS, status="deleted")
+        session.delete()
 
     return redirect(next_url)
 
@@ -402,8 +461,8 @@ def session_start(request, session_id):
     # 6. Запускаем игру
     session.status = Session.Status.ACTIVE
     session.current_round = 1
-    first_phase = Phase.objects.order_by("order").first()
-    session.current_phase = first_phase
+    phases = registry.phases()
+    session.current_phase = phases[0] if phases else None
     session.save()
 
     messages.success(request, "Игра начата.")
@@ -45,6 +45,131 @@ TG_BOT_HOST_USER_ID = 1 # User.id, ведущий
 TG_BOT_MODE_CLASSIC_ID = 1   # id режима "Классическая"
 TG_BOT_MODE_SPORT_ID = 2     # id режима "Спортивная" 10 игроков
 
+# Отложенная запись бота в БД: интервал (сек), размер пачки
+# и предел очереди, после которого обработчики ждут записи
+TG_BOT_DB_FLUSH_INTERVAL = 0.5
+TG_BOT_DB_BATCH_SIZE = 100
+TG_BOT_DB_MAX_PENDING = 1000
+# Свои потоки бота для многошаговых операций с БД (запись пачки,
+# восстановление партии); одиночные запросы идут через async-API ORM.
+# 0 — общий поток Django (для SQLite: пишет всегда один поток)
+TG_BOT_DB_THREADS = 0
+
+# Шардированный режим (runbot --shards N): число воркеров по умолчанию
+# и размер очереди апдейтов каждого воркера
+TG_BOT_SHARDS = 1
+TG_BOT_SHARD_QUEUE_SIZE = 1000
+
+# Приём апдейтов через webhook (runbot --webhook или TG_BOT_WEBHOOK = True):
+# бот слушает локальный адрес, TLS и публичный адрес TG_BOT_WEBHOOK_URL —
+# на обратном прокси. С TG_BOT_WEBHOOK_URL бот сам регистрирует webhook
+# в Telegram; секрет заголовка X-Telegram-Bot-Api-Secret-Token тогда можно
+# не задавать (будет случайным). Очередь принятых апдейтов ограничена:
+# когда она полна, Telegram получает 503 и повторяет апдейт позже
+TG_BOT_WEBHOOK = False
+TG_BOT_WEBHOOK_URL = os.environ.get("TG_BOT_WEBHOOK_URL", "")
+TG_BOT_WEBHOOK_SECRET = os.environ.get("TG_BOT_WEBHOOK_SECRET", "")
+TG_BOT_WEBHOOK_LISTEN = "127.0.0.1"
+TG_BOT_WEBHOOK_PORT = 8443
+TG_BOT_WEBHOOK_PATH = "/telegram"
+TG_BOT_WEBHOOK_QUEUE_SIZE = 1000
+TG_BOT_WEBHOOK_MAX_CONNECTIONS = 40
+
+# Параллельная обработка апдейтов разных чатов: сколько обработчиков
+# работает одновременно и сколько апдейтов может ждать своей очереди
+TG_BOT_MAX_IN_FLIGHT = 64
+TG_BOT_MAX_QUEUED_UPDATES = 4096
+
+# Исходящие сообщения бота: лимиты Telegram (сообщений в секунду на бота,
+# в личный чат и в группу), запас на чат, число повторов после 429
+# и пауза (сек), за которую подряд идущие ответы склеиваются в одно сообщение
+TG_BOT_OUTBOUND_GLOBAL_RATE = 30
+TG_BOT_OUTBOUND_CHAT_RATE = 1
+TG_BOT_OUTBOUND_GROUP_RATE = 20 / 60
+TG_BOT_OUTBOUND_CHAT_BURST = 3
+TG_BOT_OUTBOUND_MAX_RETRIES = 3
+TG_BOT_OUTBOUND_MERGE_DELAY = 0.05
+
+# Режим панели: бот держит в чате одно закреплённое сообщение партии и правит
+# его на сменах фаз, убийствах и исключениях; новыми сообщениями — только итоги
+TG_BOT_CONTROL_PANEL = False
+
+# Таймеры дня по режимам партии (сек, 0 — выключен): речь каждого живого игрока
+# по очереди и общее обсуждение после речей. Когда время дня вышло, бот сам
+# начинает голосование (TG_BOT_TIMER_AUTO_VOTE = False — только напоминает)
+TG_BOT_SPEECH_SECONDS = {"classic": 0, "sport": 0}
+TG_BOT_DISCUSSION_SECONDS = {"classic": 0, "sport": 0}
+TG_BOT_TIMER_AUTO_VOTE = True
+# шаг колеса таймеров (сек)
+TG_BOT_TIMER_RESOLUTION = 1.0
+
+# Роли в личку игрокам, привязавшимся через /join: не больше стольких сообщений
+# в секунду (часть общего лимита бота ~30/с, остальное — ответам в группы)
+# и попыток при сетевых ошибках
+TG_BOT_ROLE_DM_RATE = 10
+TG_BOT_ROLE_DM_ATTEMPTS = 3
+
+# HTTP-клиент бота: размер пула соединений и таймауты (сек)
+TG_BOT_HTTP_POOL_SIZE = 32
+TG_BOT_HTTP_POOL_TIMEOUT = 10
+TG_BOT_HTTP_CONNECT_TIMEOUT = 5
+TG_BOT_HTTP_READ_TIMEOUT = 10
+TG_BOT_HTTP_WRITE_TIMEOUT = 10
+
+# Telegram id администраторов бота (через запятую в .env): им доступна /stats
+TG_BOT_ADMIN_IDS = [
+    int(admin_id)
+    for admin_id in os.environ.get("TG_BOT_ADMIN_IDS", "").split(",")
+    if admin_id.strip()
+]
+
+# Как часто (сек) бот пишет свои метрики в консоль; 0 — не писать
+TG_BOT_STATS_LOG_INTERVAL = 300
+
+# Правки партий бота с сайта (лента SessionChange): как часто (сек) бот её
+# читает (0 — не читать), сколько строк за запрос и сколько (сек) строки
+# хранятся — дольше, чем партия может пролежать выгруженной (TG_BOT_ABANDONED_AFTER)
+TG_BOT_CHANGE_FEED_INTERVAL = 1.0
+TG_BOT_CHANGE_FEED_BATCH = 500
+TG_BOT_CHANGE_FEED_RETENTION = 8 * 24 * 60 * 60
+
+# Сверка партий в памяти бота с Session / Player в БД: раз в
+# TG_BOT_RECONCILE_INTERVAL секунд (0 — не сверять), по
+# TG_BOT_RECONCILE_BATCH сессий на запрос
+TG_BOT_RECONCILE_INTERVAL = 300
+TG_BOT_RECONCILE_BATCH = 500
+
+# Лимиты входящих команд и нажатий кнопок: token bucket на чат и на
+# пользователя (в секунду и запас; 0 — без лимита). Сверх лимита апдейт
+# отбрасывается до обращения к БД. Повторное нажатие той же кнопки раньше
+# TG_BOT_BUTTON_DEBOUNCE секунд тоже отбрасывается (0 — не отсеивать)
+TG_BOT_FLOOD_CHAT_RATE = 2
+TG_BOT_FLOOD_CHAT_BURST = 30
+TG_BOT_FLOOD_USER_RATE = 1
+TG_BOT_FLOOD_USER_BURST = 15
+TG_BOT_BUTTON_DEBOUNCE = 1.0
+
+# Профилировщик памяти бота (tracemalloc). Включается здесь (TG_BOT_MEMPROF),
+# командой /memprof on или сигналом SIGUSR2. Пока включён, раз в
+# TG_BOT_MEMPROF_INTERVAL секунд пишет в консоль отчёт: top мест выделения,
+# размер партий и рост с прошлого снимка (0 — только по запросу). Снимок
+# сохраняется в TG_BOT_MEMPROF_FILE, чтобы сравнить с ним следующий запуск
+TG_BOT_MEMPROF = os.environ.get("TG_BOT_MEMPROF", "") == "1"
+TG_BOT_MEMPROF_INTERVAL = 900
+TG_BOT_MEMPROF_FRAMES = 1
+TG_BOT_MEMPROF_TOP = 10
+TG_BOT_MEMPROF_FILE = ""
+
+# Выгрузка партий из памяти бота (снимок остаётся в журнале, партия
+# поднимается из БД при следующем апдейте чата):
+# молчащие дольше TG_BOT_GAME_IDLE_TTL секунд и самые давние сверх бюджета
+# памяти на партии (байт); проверка раз в TG_BOT_EVICTION_INTERVAL секунд
+TG_BOT_GAME_IDLE_TTL = 6 * 60 * 60
+TG_BOT_GAMES_MEMORY_BUDGET = 64 * 1024 * 1024
+TG_BOT_EVICTION_INTERVAL = 60
+# Партии бота без событий дольше этого (сек) отменяются; 0 — не отменять
+TG_BOT_ABANDONED_AFTER = 7 * 24 * 60 * 60
+
 # Application definition
 
 INSTALLED_APPS = [